@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Historical Backfill - loads a long date range as independent, checkpointed windows
+
+    python main.py --backfill --since 2025-01-01 [--until 2025-12-31] [--window-days 7] [--workers 2]
+
+Every window is fetched and upserted on its own (nothing is cleared), and
+recorded in `backfill_checkpoints` once committed. A crashed or interrupted
+backfill is resumed by running the same command again: finished windows are
+skipped, failed and unfinished ones are fetched again.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Set, Tuple
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, Text, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import Config
+from database import DatabaseManager
+from facebook_ads_client import FacebookAdsClient
+from excel_exporter import ExcelExporter
+from columnar_exporter import ColumnarExporter
+from rollups import RollupManager
+from streaming import prefetch
+from metrics import get_metrics, trace_span
+from resources import get_engine, session_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+checkpoints_table = Table(
+    'backfill_checkpoints', metadata,
+    Column('account_id', String(50), primary_key=True),
+    Column('window_start', Date, primary_key=True),
+    Column('window_end', Date, primary_key=True),
+    Column('status', String(20), nullable=False),
+    Column('rows', Integer),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('error', Text),
+    Column('updated_at', DateTime, default=datetime.utcnow),
+)
+
+Window = Tuple[date, date]
+
+
+def plan_windows(since: date, until: date, window_days: int) -> List[Window]:
+    """Consecutive inclusive windows covering since..until, newest first so recent data lands early"""
+    windows = []
+    start = since
+    while start <= until:
+        end = min(start + timedelta(days=window_days - 1), until)
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+    return list(reversed(windows))
+
+
+def days_in_window(window: Window) -> Set[date]:
+    start, end = window
+    return {start + timedelta(days=i) for i in range((end - start).days + 1)}
+
+
+class CheckpointStore:
+    """Status of every backfill window per account"""
+
+    def create_table(self):
+        checkpoints_table.create(get_engine(), checkfirst=True)
+
+    def done_days(self, account_id: str) -> Set[date]:
+        """Days covered by finished windows (window sizes may differ between runs)"""
+        with session_scope() as session:
+            rows = session.execute(
+                select(checkpoints_table.c.window_start, checkpoints_table.c.window_end)
+                .where(checkpoints_table.c.account_id == account_id, checkpoints_table.c.status == 'done')
+            ).all()
+        days = set()
+        for row in rows:
+            days |= days_in_window((row.window_start, row.window_end))
+        return days
+
+    def record(self, account_id: str, window: Window, status: str, rows: int = None, error: str = None):
+        values = {
+            'account_id': account_id, 'window_start': window[0], 'window_end': window[1],
+            'status': status, 'rows': rows, 'error': error, 'attempts': 1, 'updated_at': datetime.utcnow(),
+        }
+        statement = pg_insert(checkpoints_table).values(**values)
+        updates = {key: statement.excluded[key] for key in ('status', 'rows', 'error', 'updated_at')}
+        if status == 'running':
+            updates['attempts'] = checkpoints_table.c.attempts + 1
+        statement = statement.on_conflict_do_update(
+            index_elements=['account_id', 'window_start', 'window_end'], set_=updates
+        )
+        with session_scope() as session:
+            session.execute(statement)
+            session.commit()
+
+
+class Backfill:
+    """Backfills since..until for every account, loading up to max_workers windows at once"""
+
+    def __init__(self, since: date, until: date = None, window_days: int = None, max_workers: int = None,
+                 accounts: List[dict] = None):
+        self.since = since
+        self.until = until or datetime.now().date()
+        if self.since > self.until:
+            raise ValueError(f"--since {self.since} is after --until {self.until}")
+        self.window_days = max(1, window_days or Config.BACKFILL_WINDOW_DAYS)
+        self.max_workers = max(1, max_workers or Config.BACKFILL_WORKERS)
+        self.accounts = accounts if accounts is not None else Config.AD_ACCOUNTS
+        self.checkpoints = CheckpointStore()
+
+    def run(self) -> List[Dict[str, Any]]:
+        logger.info("=" * 60)
+        logger.info(f"BACKFILL {self.since} -> {self.until} ({self.window_days}-day windows, {self.max_workers} workers)")
+        logger.info("=" * 60)
+        self.checkpoints.create_table()
+
+        metrics = get_metrics()
+        metrics.reset()
+        tasks = []
+        partitioned = {}
+        for account in self.accounts:
+            partitioned[account['id']] = self._prepare_table(account)
+            done = self.checkpoints.done_days(account['id'])
+            windows = plan_windows(self.since, self.until, self.window_days)
+            pending = [window for window in windows if not days_in_window(window) <= done]
+            logger.info(f"  {account['name']}: {len(windows)} windows, "
+                        f"{len(windows) - len(pending)} already done, {len(pending)} to load")
+            tasks.extend((account, window) for window in pending)
+
+        with trace_span('backfill', accounts=len(self.accounts), windows=len(tasks)):
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='backfill') as executor:
+                results = list(executor.map(
+                    lambda task: self._load_window(task[0], task[1], partitioned[task[0]['id']]), tasks
+                ))
+
+        summaries = [self._finish_account(account, [r for r in results if r['account_id'] == account['id']])
+                     for account in self.accounts]
+        metrics.finish()
+        metrics.write_outputs()
+        return summaries
+
+    def _prepare_table(self, account: dict) -> bool:
+        """Build and create the table once, and every partition of the range up front.
+
+        Windows then reuse the same Table objects (see create_ads_table) and never race on DDL.
+        """
+        with DatabaseManager(table_name=account['table_name']) as db_manager:
+            db_manager.create_table()
+            if not db_manager.partitions:
+                return False
+            db_manager.partitions.ensure_range(self.since, self.until)
+            db_manager.session.commit()
+            return True
+
+    def _load_window(self, account: dict, window: Window, partitioned: bool) -> Dict[str, Any]:
+        """Fetch and upsert one window; failures are recorded and left for the next run"""
+        account_id, account_name = account['id'], account['name']
+        start, end = window
+        result = {'account_id': account_id, 'window': window, 'status': 'failed', 'rows': 0}
+        started = time.monotonic()
+        try:
+            self.checkpoints.record(account_id, window, 'running')
+            with get_metrics().stage(account_name, 'backfill'), \
+                    DatabaseManager(table_name=account['table_name']) as db_manager:
+                if not partitioned:
+                    # create_table() already ran in _prepare_table and may have dropped partitioning
+                    db_manager.partitions = None
+                fb_client = FacebookAdsClient(ad_account_id=account_id)
+                pages = fb_client.iter_ads_data(start.isoformat(), end.isoformat())
+                result['rows'] = db_manager.load_stream(prefetch(pages, Config.STREAM_PREFETCH_PAGES), upsert=True,
+                                                       date_range=window)
+            self.checkpoints.record(account_id, window, 'done', rows=result['rows'])
+            result['status'] = 'ok'
+            get_metrics().add_rows(account_name, 'backfill', result['rows'])
+            logger.info(f"  {account_name} {start} -> {end}: {result['rows']} rows "
+                        f"({time.monotonic() - started:.1f}s)")
+        except Exception as e:
+            logger.error(f"  {account_name} {start} -> {end} failed: {e}")
+            result['error'] = str(e)
+            try:
+                self.checkpoints.record(account_id, window, 'failed', error=str(e))
+            except Exception as record_error:
+                logger.warning(f"  Could not record failed window: {record_error}")
+        return result
+
+    def _finish_account(self, account: dict, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Refresh rollups for the loaded days and export once, after all windows of the account"""
+        loaded = [r for r in results if r['status'] == 'ok']
+        failed = [r for r in results if r['status'] != 'ok']
+        summary = {
+            'account': account['name'], 'windows': len(results), 'failed': len(failed),
+            'inserted': sum(r['rows'] for r in loaded), 'status': 'failed' if failed else 'ok',
+        }
+        if not loaded:
+            return summary
+
+        try:
+            finish_account(account, sorted(set().union(*(days_in_window(r['window']) for r in loaded))))
+        except Exception as e:
+            logger.error(f"  Post-processing {account['name']} failed: {e}")
+            summary['status'] = 'failed'
+            summary['error'] = str(e)
+        return summary
+
+
+def finish_account(account: dict, days: List[date]):
+    """Refresh rollups for `days` and export the account's table once; shared with the work queue"""
+    with DatabaseManager(table_name=account['table_name']) as db_manager:
+        if Config.ROLLUPS_ENABLED:
+            with get_metrics().stage(account['name'], 'rollups'):
+                rollups = RollupManager(account['table_name'], db_manager.session, db_manager.dimensions)
+                rollups.create_tables()
+                rollups.refresh(days)
+        with get_metrics().stage(account['name'], 'export_excel'):
+            ExcelExporter(filename=account['excel_filename']).export_if_changed(db_manager)
+        if Config.COLUMNAR_FORMATS:
+            with get_metrics().stage(account['name'], 'export_columnar'):
+                ColumnarExporter(account_id=account['id']).export_changed(db_manager)
+
+
+def log_backfill_summary(summaries: List[Dict[str, Any]]):
+    logger.info("-" * 40)
+    logger.info("BACKFILL SUMMARY")
+    for s in summaries:
+        line = f"  {s['account']}: {s['windows'] - s['failed']}/{s['windows']} windows loaded, {s['inserted']} rows"
+        if s['status'] == 'ok':
+            logger.info(line)
+        else:
+            error = f" ({s['error']})" if s.get('error') else ''
+            logger.error(f"{line}, {s['failed']} failed{error} - run the same command again to resume")
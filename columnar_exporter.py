@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar Export Module - Parquet / gzip CSV partitioned by account and day
+"""
+import csv
+import gzip
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import BigInteger, Date, DateTime, Float, String
+from config import Config
+from insight_fields import INSIGHT_FIELDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [spec.column for spec in INSIGHT_FIELDS] + ['fetched_at']
+
+
+def load_pyarrow():
+    """pyarrow and pyarrow.parquet, imported only when Parquet output is configured (optional dependency)"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "COLUMNAR_FORMATS=parquet needs pyarrow, which is not installed: "
+            "pip install pyarrow, or set COLUMNAR_FORMATS=csv"
+        ) from None
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema():
+    """Arrow schema matching the create_ads_table column types"""
+    pa, _ = load_pyarrow()
+
+    def arrow_type(sql_type):
+        if isinstance(sql_type, type):
+            sql_type = sql_type()
+        if isinstance(sql_type, String):
+            return pa.string()
+        if isinstance(sql_type, Date):
+            return pa.date32()
+        if isinstance(sql_type, DateTime):
+            return pa.timestamp('us')
+        if isinstance(sql_type, BigInteger):
+            return pa.int64()
+        if isinstance(sql_type, Float):
+            return pa.float64()
+        raise TypeError(f"No Arrow type for {sql_type!r}")
+
+    fields = [pa.field(spec.column, arrow_type(spec.sql_type)) for spec in INSIGHT_FIELDS]
+    fields.append(pa.field('fetched_at', pa.timestamp('us')))
+    return pa.schema(fields)
+
+
+class ColumnarExporter:
+    """Writes one partition per day under <root>/<format>/account=<id>/date=<YYYY-MM-DD>/
+
+    Partition keys are named account/date so they don't clash with the
+    account_id/day columns stored inside the files.
+    """
+
+    def __init__(self, account_id: str, export_folder: Path = None, formats: List[str] = None):
+        self.account_id = account_id
+        self.root = Path(export_folder or Config.COLUMNAR_EXPORT_FOLDER)
+        self.formats = formats if formats is not None else Config.COLUMNAR_FORMATS
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.schema = arrow_schema() if 'parquet' in self.formats else None
+        self.bytes_written = 0
+        logger.info(f"Columnar exporter initialized. Export folder: {self.root} ({', '.join(self.formats)})")
+
+    def partition_dir(self, fmt: str, day: str) -> Path:
+        return self.root / fmt / f"account={self.account_id}" / f"date={day}"
+
+    def get_manifest_path(self) -> Path:
+        return self.root / f"_manifest_{self.account_id}.json"
+
+    def load_manifest(self) -> Dict[str, Any]:
+        manifest_path = self.get_manifest_path()
+        if not manifest_path.exists():
+            return {}
+        try:
+            return json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return {}
+
+    def save_manifest(self, manifest: Dict[str, Any]):
+        manifest_path = self.get_manifest_path()
+        tmp_path = manifest_path.with_name(f".{manifest_path.name}.tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+        os.replace(tmp_path, manifest_path)
+
+    def export_changed(self, db_manager) -> int:
+        """Rewrite only the day partitions whose content changed, drop partitions of deleted days.
+
+        Returns the number of partitions written.
+        """
+        digests = db_manager.get_day_digests(EXPORT_COLUMNS[:-1])
+        manifest = self.load_manifest()
+        previous = manifest.get('day_digests', {}) if manifest.get('formats') == self.formats else {}
+
+        changed_days = sorted(day for day, digest in digests.items() if previous.get(day) != digest)
+        removed_days = sorted(set(previous) - set(digests))
+
+        for day in removed_days:
+            for fmt in self.formats:
+                shutil.rmtree(self.partition_dir(fmt, day), ignore_errors=True)
+
+        written = 0
+        if changed_days:
+            current_day = None
+            rows = []
+            for batch in db_manager.iter_batches(columns=EXPORT_COLUMNS, days=changed_days):
+                for row in batch:
+                    day = str(row[EXPORT_COLUMNS.index('day')])
+                    if day != current_day and rows:
+                        self.write_partition(current_day, rows)
+                        written += 1
+                        rows = []
+                    current_day = day
+                    rows.append(row)
+            if rows:
+                self.write_partition(current_day, rows)
+                written += 1
+
+        self.save_manifest({
+            'formats': self.formats,
+            'day_digests': digests,
+            'exported_at': datetime.utcnow().isoformat(),
+        })
+        logger.info(
+            f"Columnar export for {self.account_id}: {written} partitions written, "
+            f"{len(digests) - len(changed_days)} unchanged, {len(removed_days)} removed"
+        )
+        return written
+
+    def write_partition(self, day: str, rows: List[Tuple]):
+        """Atomically replace one day's files"""
+        if 'parquet' in self.formats:
+            pa, pq = load_pyarrow()
+            partition = self.partition_dir('parquet', day)
+            partition.mkdir(parents=True, exist_ok=True)
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(EXPORT_COLUMNS)}
+            table = pa.Table.from_pydict(columns, schema=self.schema)
+            target = partition / 'part-0.parquet'
+            tmp_path = partition / '.part-0.parquet.tmp'
+            pq.write_table(table, tmp_path, compression='snappy')
+            self.bytes_written += tmp_path.stat().st_size
+            os.replace(tmp_path, target)
+
+        if 'csv' in self.formats:
+            partition = self.partition_dir('csv', day)
+            partition.mkdir(parents=True, exist_ok=True)
+            target = partition / 'part-0.csv.gz'
+            tmp_path = partition / '.part-0.csv.gz.tmp'
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_COLUMNS)
+                writer.writerows(rows)
+            self.bytes_written += tmp_path.stat().st_size
+            os.replace(tmp_path, target)
@@ -4,6 +4,8 @@ Configuration module for Facebook Ads Data Pipeline
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from insight_fields import api_fields, excel_labels
+from dimensions import NAME_COLUMNS
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +18,50 @@ class Config:
     FACEBOOK_APP_ID = os.getenv('FACEBOOK_APP_ID')
     FACEBOOK_APP_SECRET = os.getenv('FACEBOOK_APP_SECRET')
     FACEBOOK_ACCESS_TOKEN = os.getenv('FACEBOOK_ACCESS_TOKEN')
+    # Override Graph API base URL (e.g. a local fake endpoint for testing)
+    FACEBOOK_GRAPH_URL = os.getenv('FACEBOOK_GRAPH_URL')
+    # Keep-alive HTTP connections shared by all accounts, request timeout in seconds
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '300'))
+    
+    # Async Insights report jobs
+    ASYNC_INSIGHTS = os.getenv('ASYNC_INSIGHTS', 'false').lower() in ('1', 'true', 'yes')
+    ASYNC_POLL_INTERVAL = float(os.getenv('ASYNC_POLL_INTERVAL', '2'))
+    ASYNC_POLL_MAX_INTERVAL = float(os.getenv('ASYNC_POLL_MAX_INTERVAL', '30'))
+    ASYNC_JOB_TIMEOUT = float(os.getenv('ASYNC_JOB_TIMEOUT', '1800'))
+    ASYNC_MAX_JOBS = int(os.getenv('ASYNC_MAX_JOBS', '4'))
+    # Shorter ranges use sync requests: a report job costs at least one poll interval
+    ASYNC_MIN_DAYS = int(os.getenv('ASYNC_MIN_DAYS', '8'))
+    
+    # Fetch planner: split the date range into 'day', 'week' or 'campaign' windows ('none' = single request)
+    FETCH_SPLIT = os.getenv('FETCH_SPLIT', 'none')
+    FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+    FETCH_CAMPAIGNS_PER_WINDOW = int(os.getenv('FETCH_CAMPAIGNS_PER_WINDOW', '50'))
+    
+    # On-disk cache of raw insights rows; days inside the attribution window are volatile
+    CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    CACHE_DIR = Path(os.getenv('CACHE_DIR', '.cache/insights'))
+    CACHE_VOLATILE_TTL = float(os.getenv('CACHE_VOLATILE_TTL', '0'))
+    CACHE_CLOSED_TTL = float(os.getenv('CACHE_CLOSED_TTL', str(30 * 24 * 3600)))
+    CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', '500'))
+    
+    # Graph API throttling (usage percentages from X-*-Usage headers)
+    THROTTLE_MAX_CONCURRENCY = int(os.getenv('THROTTLE_MAX_CONCURRENCY', '8'))
+    THROTTLE_LOW_WATERMARK = float(os.getenv('THROTTLE_LOW_WATERMARK', '50'))
+    THROTTLE_HIGH_WATERMARK = float(os.getenv('THROTTLE_HIGH_WATERMARK', '90'))
+    THROTTLE_MAX_INTERVAL = float(os.getenv('THROTTLE_MAX_INTERVAL', '10'))
+    THROTTLE_MAX_RETRIES = int(os.getenv('THROTTLE_MAX_RETRIES', '5'))
+    THROTTLE_BACKOFF_BASE = float(os.getenv('THROTTLE_BACKOFF_BASE', '5'))
+    THROTTLE_BACKOFF_MAX = float(os.getenv('THROTTLE_BACKOFF_MAX', '300'))
+    
+    # Sub-requests per Graph API batch call (max 50, 0 or 1 = no batching); used for sync insights and id lookups.
+    # A call holds the first page of every window it carries, so memory grows with it
+    GRAPH_BATCH_SIZE = int(os.getenv('GRAPH_BATCH_SIZE', '0'))
+    
+    # Where names come from: 'insights' (every insights row) or 'entities' (ids-only insights,
+    # names from the campaigns/adsets/ads edges, cached and refreshed by updated_time)
+    NAMES_SOURCE = os.getenv('NAMES_SOURCE', 'insights')
+    ENTITY_FULL_REFRESH_HOURS = float(os.getenv('ENTITY_FULL_REFRESH_HOURS', '24'))
     
     # Multiple Ad Accounts Configuration
     AD_ACCOUNTS = []
@@ -26,7 +72,8 @@ class Config:
             'id': os.getenv('AD_ACCOUNT_ID_1'),
             'name': os.getenv('AD_ACCOUNT_NAME_1', 'Account1'),
             'table_name': 'facebook_ads_cpas_shopee',
-            'excel_filename': 'CPAS_Shopee_Shondo.xlsx'
+            'excel_filename': 'CPAS_Shopee_Shondo.xlsx',
+            'cadences': os.getenv('AD_ACCOUNT_CADENCES_1')
         })
     
     # Load Ad Account 2
@@ -35,7 +82,8 @@ class Config:
             'id': os.getenv('AD_ACCOUNT_ID_2'),
             'name': os.getenv('AD_ACCOUNT_NAME_2', 'Account2'),
             'table_name': 'facebook_ads_onlinestore',
-            'excel_filename': 'OnlineStore_Shondo.xlsx'
+            'excel_filename': 'OnlineStore_Shondo.xlsx',
+            'cadences': os.getenv('AD_ACCOUNT_CADENCES_2')
         })
     
     # Backward compatibility
@@ -51,9 +99,19 @@ class Config:
     # Database URL
     DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     
+    # Connection pool shared by all accounts
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    
     # Export Configuration
     EXPORT_FOLDER = Path(os.getenv('EXPORT_FOLDER', 'D:/Get_Data_From_Meta/exports'))
     EXCEL_FILENAME = os.getenv('EXCEL_FILENAME', 'facebook_ads_data.xlsx')
+    # Columnar export alongside Excel: comma-separated 'parquet' and/or 'csv' (empty = disabled)
+    COLUMNAR_FORMATS = [f.strip() for f in os.getenv('COLUMNAR_FORMATS', '').split(',') if f.strip()]
+    COLUMNAR_EXPORT_FOLDER = Path(os.getenv('COLUMNAR_EXPORT_FOLDER', str(EXPORT_FOLDER / 'columnar')))
     
     # Date Configuration
     DATE_PRESET = os.getenv('DATE_PRESET', 'last_30d')
@@ -62,70 +120,75 @@ class Config:
     DEFAULT_DAYS_BACK = int(os.getenv('DEFAULT_DAYS_BACK', '7'))
     DAILY_RUN_TIME = os.getenv('DAILY_RUN_TIME', '06:00')
     
-    # Facebook Ads API Fields - Tất cả fields cần fetch
-    # Mapping: API Field -> Excel Column Name
-    FIELDS_CONFIG = {
-        # Account info
-        'account_id': 'Account ID',
-        'account_name': 'Account name',
-        
-        # Campaign, Adset, Ad info
-        'campaign_name': 'Campaign name',
-        'adset_name': 'Adset Name',
-        'ad_id': 'ADS ID',
-        'ad_name': 'Ad Name',
-        
-        # Date
-        'date_start': 'Day',
-        
-        # Metrics cơ bản
-        'spend': 'Amount spent',
-        'impressions': 'Impressions',
-        'reach': 'Reach',
-        'frequency': 'Frequency',
-        
-        # Click metrics
-        'cpc': 'CPC (all)',
-        'ctr': 'CTR (all)',
-        'cpm': 'CPM (cost per 1,000 impressions)',
-        'inline_link_clicks': 'Link clicks',
-        'inline_link_click_ctr': 'CTR (link click-through rate)',
-        'cost_per_inline_link_click': 'CPC (cost per link click)',
-        
-        # Actions (extracted from 'actions' field)
-        'post_comment': 'Post comments',
-        'link_click': 'Link clicks',
-        'onsite_conversion.messaging_conversation_started_7d': 'Messaging conversations started',
-        'landing_page_view': 'Landing page views',
-        'cost_per_landing_page_view': 'Cost per landing page view',
-        'omni_add_to_cart': 'Adds to cart',
-        'add_to_cart': 'Website adds to cart',
-        'omni_initiated_checkout': 'Checkouts Initiated',
-        'omni_purchase': 'Purchases',
-        'purchase': 'Website purchases',
-        'lead': 'Leads',
-        
-        # Action values (conversion values)
-        'lead_value': 'Leads Conversion Value',
-        'omni_add_to_cart_value': 'Adds to cart conversion value',
-        'omni_initiated_checkout_value': 'Checkouts initiated conversion value',
-        'omni_purchase_value': 'Purchases conversion value',
-        'purchase_value': 'Website purchases conversion value',
-        
-        # Cost per action
-        'cost_per_result': 'Cost Per Result',
-    }
-    
-    # Fields to request from Facebook API
-    INSIGHTS_FIELDS = [
-        'account_id', 'account_name',
-        'campaign_name', 'adset_name', 'ad_id', 'ad_name',
-        'date_start',
-        'spend', 'impressions', 'reach', 'frequency',
-        'cpc', 'ctr', 'cpm',
-        'inline_link_clicks', 'inline_link_click_ctr', 'cost_per_inline_link_click',
-        'actions', 'action_values', 'cost_per_action_type',
-    ]
+    # Scheduler cadences 'name=every/days_back,...' (empty = hourly today + daily lookback at DAILY_RUN_TIME),
+    # per account override with AD_ACCOUNT_CADENCES_<n>; see scheduler.py
+    SCHEDULE_CADENCES = os.getenv('SCHEDULE_CADENCES', '')
+    # Random delay added to every scheduled run to spread API load, retry delay after a failed run
+    SCHEDULE_JITTER_SECONDS = float(os.getenv('SCHEDULE_JITTER_SECONDS', '300'))
+    SCHEDULE_RETRY_MINUTES = float(os.getenv('SCHEDULE_RETRY_MINUTES', '15'))
+    
+    # Sync mode: 'incremental' upserts only the re-fetched window, 'full' clears and reinserts
+    SYNC_MODE = os.getenv('SYNC_MODE', 'full')
+    # Days re-synced on every incremental run to pick up late attribution (older stored days are not fetched again)
+    ATTRIBUTION_LOOKBACK_DAYS = int(os.getenv('ATTRIBUTION_LOOKBACK_DAYS', '3'))
+    
+    # Bulk loading: 'copy' (COPY FROM STDIN) or 'executemany'
+    DB_BULK_METHOD = os.getenv('DB_BULK_METHOD', 'copy')
+    DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '5000'))
+    # Rows fetched per round trip when streaming reads through a server-side cursor
+    DB_READ_BATCH_SIZE = int(os.getenv('DB_READ_BATCH_SIZE', '10000'))
+    
+    # Storage mode: 'wide' keeps names on every row, 'normalized' keeps them in dimension tables
+    STORAGE_MODE = os.getenv('STORAGE_MODE', 'wide')
+    
+    # Range-partition account tables by 'day' or 'month' (empty = plain table)
+    PARTITION_BY = os.getenv('PARTITION_BY', '')
+    # Drop data older than this many days after each run (0 = keep everything)
+    RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '0'))
+    # 'drop' removes expired partitions, 'detach' keeps them as standalone tables
+    RETENTION_ACTION = os.getenv('RETENTION_ACTION', 'drop')
+    
+    # Campaign/day and adset/day rollup tables refreshed after every load
+    ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Stream API pages straight into the database instead of collecting them first
+    STREAMING = os.getenv('STREAMING', 'false').lower() in ('1', 'true', 'yes')
+    STREAM_PREFETCH_PAGES = int(os.getenv('STREAM_PREFETCH_PAGES', '2'))
+    
+    # Number of accounts processed in parallel
+    PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '4'))
+    
+    # --backfill: days per checkpointed window and windows loaded in parallel
+    BACKFILL_WINDOW_DAYS = int(os.getenv('BACKFILL_WINDOW_DAYS', '7'))
+    BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', '2'))
+    
+    # --worker: Postgres job queue shared by all workers (see work_queue.py)
+    WORKER_ID = os.getenv('WORKER_ID', '')
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '2'))
+    QUEUE_LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', '300'))
+    QUEUE_HEARTBEAT_SECONDS = float(os.getenv('QUEUE_HEARTBEAT_SECONDS', '60'))
+    QUEUE_POLL_SECONDS = float(os.getenv('QUEUE_POLL_SECONDS', '10'))
+    QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '5'))
+    QUEUE_RETRY_BASE_SECONDS = float(os.getenv('QUEUE_RETRY_BASE_SECONDS', '60'))
+    
+    # Run metrics: Prometheus textfile path and/or Pushgateway URL, JSON run report folder (empty = off)
+    METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')
+    METRICS_PUSHGATEWAY_URL = os.getenv('METRICS_PUSHGATEWAY_URL', '')
+    METRICS_JOB_NAME = os.getenv('METRICS_JOB_NAME', 'facebook_ads_pipeline')
+    METRICS_REPORT_DIR = os.getenv('METRICS_REPORT_DIR', '')
+    # OpenTelemetry spans per run/account/stage (needs the opentelemetry package)
+    OTEL_TRACING = os.getenv('OTEL_TRACING', 'false').lower() in ('1', 'true', 'yes')
+    
+    # --profile output folder and stack sampling interval (seconds)
+    PROFILE_DIR = Path(os.getenv('PROFILE_DIR', 'profiles'))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    
+    # Facebook Ads API Fields - built from the registry in insight_fields.py
+    # Mapping: table column -> Excel Column Name
+    FIELDS_CONFIG = excel_labels()
+    
+    # Fields to request from Facebook API (without the names when NAMES_SOURCE=entities)
+    INSIGHTS_FIELDS = api_fields(exclude=NAME_COLUMNS if NAMES_SOURCE == 'entities' else ())
     
     @classmethod
     def validate(cls, ad_account_id=None):
@@ -2,138 +2,459 @@
 """
 PostgreSQL Database Module - Multi Account Support
 """
+import csv
+import io
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
-from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime, BigInteger, Date, Table, MetaData
+import threading
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+import pandas as pd
+from sqlalchemy import Column, Integer, DateTime, Table, MetaData, UniqueConstraint, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from config import Config
+from insight_fields import INSIGHT_FIELDS
+from dimensions import DIMENSION_LEVELS, NAME_COLUMNS, DimensionStore, dimension_table_name
+from partitions import PartitionManager
+from resources import get_engine, get_sessionmaker
+from streaming import rebatch
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
-metadata = MetaData()
 
+# Account tables are built once per (name, mode, partitioning), each in its own MetaData,
+# so concurrent accounts and windows never mutate a shared Table or MetaData
+_tables: Dict[Tuple[str, bool, Optional[str]], Table] = {}
+_tables_lock = threading.Lock()
 
-def create_ads_table(table_name: str):
-    """Create a table dynamically for each ad account"""
+# NULL marker used in COPY payloads (keeps empty strings distinct from NULL)
+COPY_NULL = '\\N'
+
+
+def natural_key_name(table_name: str) -> str:
+    """Name of the (ad_id, day) unique index used for upserts"""
+    return f"uq_{table_name}_ad_day"
+
+
+def stored_fields(normalized: bool = False):
+    """Registry fields kept in the fact table (names live in dimension tables when normalized)"""
+    return [spec for spec in INSIGHT_FIELDS if not (normalized and spec.column in NAME_COLUMNS)]
+
+
+def create_ads_table(table_name: str, normalized: bool = False, partition_by: str = None):
+    """Create a table dynamically for each ad account.
+    
+    With partition_by ('day' or 'month') the table is RANGE partitioned on day;
+    Postgres requires the partition key in every unique key, so day joins the primary key.
+    """
+    key = (table_name, normalized, partition_by or None)
+    with _tables_lock:
+        if key not in _tables:
+            _tables[key] = _build_ads_table(table_name, normalized, partition_by)
+        return _tables[key]
+
+
+def _build_ads_table(table_name: str, normalized: bool, partition_by: Optional[str]) -> Table:
+    partitioned = bool(partition_by)
     return Table(
-        table_name, metadata,
+        table_name, MetaData(),
         Column('id', Integer, primary_key=True, autoincrement=True),
-        Column('account_id', String(50)),
-        Column('account_name', String(500)),
-        Column('campaign_name', String(500)),
-        Column('adset_name', String(500)),
-        Column('ad_id', String(50), index=True),
-        Column('ad_name', String(500)),
-        Column('day', Date, index=True),
-        Column('amount_spent', Float, default=0),
-        Column('impressions', BigInteger, default=0),
-        Column('reach', BigInteger, default=0),
-        Column('frequency', Float, default=0),
-        Column('cpc_all', Float, default=0),
-        Column('cpc_link_click', Float, default=0),
-        Column('ctr_all', Float, default=0),
-        Column('ctr_link_click', Float, default=0),
-        Column('cpm', Float, default=0),
-        Column('link_clicks', BigInteger, default=0),
-        Column('cost_per_result', Float, default=0),
-        Column('landing_page_views', BigInteger, default=0),
-        Column('cost_per_landing_page_view', Float, default=0),
-        Column('leads', BigInteger, default=0),
-        Column('leads_conversion_value', Float, default=0),
-        Column('messaging_conversations_started', BigInteger, default=0),
-        Column('adds_to_cart', BigInteger, default=0),
-        Column('website_adds_to_cart', BigInteger, default=0),
-        Column('adds_to_cart_conversion_value', Float, default=0),
-        Column('checkouts_initiated', BigInteger, default=0),
-        Column('checkouts_initiated_conversion_value', Float, default=0),
-        Column('purchases', BigInteger, default=0),
-        Column('website_purchases', BigInteger, default=0),
-        Column('purchases_conversion_value', Float, default=0),
-        Column('website_purchases_conversion_value', Float, default=0),
-        Column('post_comments', BigInteger, default=0),
+        *[
+            Column(spec.column, spec.sql_type, default=spec.default, index=spec.index,
+                   primary_key=partitioned and spec.column == 'day')
+            for spec in stored_fields(normalized)
+        ],
         Column('fetched_at', DateTime, default=datetime.utcnow),
-        extend_existing=True
+        UniqueConstraint('ad_id', 'day', name=natural_key_name(table_name)),
+        **({'postgresql_partition_by': 'RANGE (day)'} if partitioned else {})
     )
 
 
-# Create engine and session
-engine = create_engine(Config.DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(bind=engine)
+def __getattr__(name: str):
+    """Engine and session factory are created lazily by resources (kept importable from here)"""
+    if name == 'engine':
+        return get_engine()
+    if name == 'SessionLocal':
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class DatabaseManager:
     """Database operations manager for specific table"""
     
-    def __init__(self, table_name: str = 'facebook_ads_data'):
+    def __init__(self, table_name: str = 'facebook_ads_data', storage_mode: str = None, partition_by: str = None):
         self.table_name = table_name
-        self.table = create_ads_table(table_name)
-        self.session = SessionLocal()
+        self.normalized = (storage_mode or Config.STORAGE_MODE) == 'normalized'
+        partition_by = Config.PARTITION_BY if partition_by is None else partition_by
+        self.fields = stored_fields(self.normalized)
+        self.table = create_ads_table(table_name, self.normalized, partition_by)
+        self.session = get_sessionmaker()()
+        self.dimensions = DimensionStore(table_name, self.session) if self.normalized else None
+        self.partitions = PartitionManager(table_name, self.session, partition_by) if partition_by else None
+        self.bytes_loaded = 0
         logger.info(f"Database connection established for table: {table_name}")
     
     def create_table(self):
         """Create table if not exists"""
-        self.table.create(engine, checkfirst=True)
+        self.table.create(get_engine(), checkfirst=True)
+        self.ensure_columns()
+        self.ensure_natural_key()
+        if self.partitions and not self.partitions.is_partitioned():
+            # An existing heap cannot be converted in place; keep using it unpartitioned
+            logger.warning(f"Table {self.table_name} exists and is not partitioned, PARTITION_BY ignored")
+            self.partitions = None
+        if self.dimensions:
+            self.dimensions.create_tables()
+            self.seed_dimensions()
         logger.info(f"Table {self.table_name} created/verified")
     
-    def __del__(self):
+    def ensure_columns(self):
+        """Add registry columns missing from tables created by an older version"""
+        existing = {column['name'] for column in inspect(get_engine()).get_columns(self.table_name)}
+        for column in self.table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=get_engine().dialect)
+            self.session.execute(text(
+                f'ALTER TABLE "{self.table_name}" ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}'
+            ))
+            logger.info(f"Added column {column.name} to {self.table_name}")
+        self.session.commit()
+    
+    def ensure_natural_key(self):
+        """Add the (ad_id, day) unique index to tables created before it existed
+
+        Older tables may hold the same ad and day more than once (e.g. two runs
+        overlapping); only the most recently inserted row (highest id) is kept.
+        """
+        index_name = natural_key_name(self.table_name)
+        if self.session.execute(text('SELECT to_regclass(:name)'), {'name': f'"{index_name}"'}).scalar():
+            return
+        result = self.session.execute(text(
+            f'DELETE FROM "{self.table_name}" AS older USING "{self.table_name}" AS newer '
+            f'WHERE older.ad_id = newer.ad_id AND older.day = newer.day AND older.id < newer.id'
+        ))
+        if result.rowcount:
+            logger.warning(f"Removed {result.rowcount} duplicate (ad_id, day) rows from {self.table_name}")
+        try:
+            self.session.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" ON "{self.table_name}" (ad_id, day)'))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise RuntimeError(
+                f"Could not add the (ad_id, day) unique index to {self.table_name}, "
+                f"incremental sync needs it. Remove the duplicate rows and run --setup again: {e}"
+            ) from e
+    
+    def seed_dimensions(self):
+        """Copy names from a table created in wide mode into empty dimension tables"""
+        existing = {column['name'] for column in inspect(get_engine()).get_columns(self.table_name)}
+        for level, (id_column, name_column, parents) in DIMENSION_LEVELS.items():
+            if name_column not in existing:
+                continue
+            dim_table = dimension_table_name(self.table_name, level)
+            columns = ', '.join([id_column, name_column] + list(parents))
+            result = self.session.execute(text(
+                f'INSERT INTO "{dim_table}" ({columns}, updated_at) '
+                f'SELECT DISTINCT ON ({id_column}) {columns}, now() FROM "{self.table_name}" '
+                f'WHERE {id_column} IS NOT NULL AND {name_column} IS NOT NULL '
+                f'ORDER BY {id_column}, day DESC '
+                f'ON CONFLICT ({id_column}) DO NOTHING'
+            ))
+            if result.rowcount:
+                logger.info(f"Seeded {result.rowcount} rows into {dim_table} from {self.table_name}")
+        self.session.commit()
+    
+    def close(self):
+        """Return the connection to the pool"""
         if hasattr(self, 'session'):
             self.session.close()
     
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.session.rollback()
+        self.close()
+    
+    def __del__(self):
+        self.close()
+    
+    def _record_values(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a parsed insight record to table column values"""
+        values = {spec.column: data.get(spec.column, spec.default) for spec in self.fields}
+        values['fetched_at'] = datetime.utcnow()
+        return values
+    
     def insert_data(self, data_list: List[Dict[str, Any]]) -> int:
         """Insert data into table"""
+        count = self._bulk_load(data_list, upsert=False)
+        logger.info(f"Inserted {count} records into {self.table_name}")
+        return count
+    
+    def upsert_data(self, data_list: List[Dict[str, Any]], replace_range: Tuple[date, date] = None) -> int:
+        """Insert or update records keyed on (ad_id, day), clearing replace_range (inclusive) first"""
+        count = self._bulk_load(data_list, upsert=True, replace_range=replace_range)
+        logger.info(f"Upserted {count} records into {self.table_name}")
+        return count
+    
+    def _bulk_load(self, data_list: List[Dict[str, Any]], upsert: bool, batch_size: int = None,
+                   replace_range: Tuple[date, date] = None) -> int:
+        """Load records in batches with COPY (or executemany), one commit at the end"""
+        batch_size = batch_size or Config.DB_BATCH_SIZE
         count = 0
-        for data in data_list:
-            try:
-                insert_stmt = self.table.insert().values(
-                    account_id=data.get('account_id'),
-                    account_name=data.get('account_name'),
-                    campaign_name=data.get('campaign_name'),
-                    adset_name=data.get('adset_name'),
-                    ad_id=data.get('ad_id'),
-                    ad_name=data.get('ad_name'),
-                    day=data.get('day'),
-                    amount_spent=data.get('amount_spent', 0),
-                    impressions=data.get('impressions', 0),
-                    reach=data.get('reach', 0),
-                    frequency=data.get('frequency', 0),
-                    cpc_all=data.get('cpc_all', 0),
-                    cpc_link_click=data.get('cpc_link_click', 0),
-                    ctr_all=data.get('ctr_all', 0),
-                    ctr_link_click=data.get('ctr_link_click', 0),
-                    cpm=data.get('cpm', 0),
-                    link_clicks=data.get('link_clicks', 0),
-                    cost_per_result=data.get('cost_per_result', 0),
-                    landing_page_views=data.get('landing_page_views', 0),
-                    cost_per_landing_page_view=data.get('cost_per_landing_page_view', 0),
-                    leads=data.get('leads', 0),
-                    leads_conversion_value=data.get('leads_conversion_value', 0),
-                    messaging_conversations_started=data.get('messaging_conversations_started', 0),
-                    adds_to_cart=data.get('adds_to_cart', 0),
-                    website_adds_to_cart=data.get('website_adds_to_cart', 0),
-                    adds_to_cart_conversion_value=data.get('adds_to_cart_conversion_value', 0),
-                    checkouts_initiated=data.get('checkouts_initiated', 0),
-                    checkouts_initiated_conversion_value=data.get('checkouts_initiated_conversion_value', 0),
-                    purchases=data.get('purchases', 0),
-                    website_purchases=data.get('website_purchases', 0),
-                    purchases_conversion_value=data.get('purchases_conversion_value', 0),
-                    website_purchases_conversion_value=data.get('website_purchases_conversion_value', 0),
-                    post_comments=data.get('post_comments', 0),
-                    fetched_at=datetime.utcnow()
+        if self.partitions:
+            # Partition DDL before the load transaction starts (commits on its own)
+            self.partitions.ensure_for_days(data.get('day') for data in data_list)
+            if replace_range:
+                self.partitions.ensure_range(*replace_range)
+        if replace_range:
+            self.clear_range(*replace_range)
+        for offset in range(0, len(data_list), batch_size):
+            count += self._load_batch(data_list[offset:offset + batch_size], upsert)
+        
+        self.session.commit()
+        return count
+    
+    def load_stream(self, pages: Iterable[List[Dict[str, Any]]], upsert: bool = True,
+                    replace: bool = False, batch_size: int = None,
+                    replace_range: Tuple[date, date] = None, date_range: Tuple[date, date] = None) -> int:
+        """Consume a stream of record pages in bounded batches, one commit at the end.
+        
+        With replace=True the table (or only replace_range, inclusive) is cleared
+        with DELETE right before the first batch, inside the load transaction:
+        an empty fetch keeps the old data, and so does a fetch that fails midway
+        (the whole load rolls back).
+        
+        date_range (inclusive, defaults to replace_range) is the range the pages
+        cover; on partitioned tables its partitions are created before streaming
+        starts, since partition DDL commits on its own and must not split the
+        load transaction. Replacing a partitioned table therefore needs it.
+        """
+        batch_size = batch_size or Config.DB_BATCH_SIZE
+        count = 0
+        cleared = not (replace or replace_range)
+        date_range = date_range or replace_range
+        create_partitions = False
+        if self.partitions:
+            if date_range:
+                # Partition DDL before streaming starts (commits on its own)
+                self.partitions.ensure_range(*date_range)
+            elif not cleared:
+                raise ValueError(f"Replacing partitioned table {self.table_name} needs the date_range of the stream")
+            else:
+                # Plain upserts only: committing mid-stream cannot expose a cleared range
+                create_partitions = True
+        
+        for batch in rebatch(pages, batch_size):
+            if not cleared:
+                if replace_range:
+                    self.clear_range(*replace_range)
+                else:
+                    self._delete_all()
+                cleared = True
+            if create_partitions:
+                self.partitions.ensure_for_days(data.get('day') for data in batch)
+            count += self._load_batch(batch, upsert)
+            logger.debug(f"Loaded {count} records into {self.table_name} so far")
+        
+        self.session.commit()
+        logger.info(f"{'Upserted' if upsert else 'Inserted'} {count} records into {self.table_name}")
+        return count
+    
+    def _load_batch(self, data_list: List[Dict[str, Any]], upsert: bool) -> int:
+        """Load one batch inside a savepoint.
+        
+        A batch that fails is replayed row by row so bad records are reported
+        individually and the rest of the batch is still loaded.
+        """
+        if self.dimensions:
+            self.dimensions.observe(data_list)
+        rows = [self._record_values(data) for data in data_list]
+        try:
+            with self.session.begin_nested():
+                if Config.DB_BULK_METHOD == 'copy':
+                    self._copy_rows(rows, upsert)
+                else:
+                    self._executemany_rows(rows, upsert)
+            return len(rows)
+        except Exception as e:
+            logger.warning(f"Batch load of {len(rows)} records failed ({e}), retrying row by row")
+            return self._load_rows_individually(rows, upsert)
+    
+    def _executemany_rows(self, rows: List[Dict[str, Any]], upsert: bool):
+        stmt = self._upsert_statement() if upsert else self.table.insert()
+        self.session.execute(stmt, rows)
+    
+    def _copy_rows(self, rows: List[Dict[str, Any]], upsert: bool):
+        """Stream rows through COPY FROM STDIN (into a staging table when upserting)"""
+        columns = list(rows[0].keys())
+        column_list = ', '.join(f'"{name}"' for name in columns)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([COPY_NULL if row[name] is None else row[name] for name in columns])
+        buffer.seek(0)
+        self.bytes_loaded += len(buffer.getvalue())
+        
+        target = self.table_name
+        cursor = self.session.connection().connection.cursor()
+        try:
+            if upsert:
+                target = f"{self.table_name}_staging"
+                cursor.execute(
+                    f'CREATE TEMP TABLE IF NOT EXISTS "{target}" '
+                    f'(LIKE "{self.table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
                 )
-                self.session.execute(insert_stmt)
+                cursor.execute(f'TRUNCATE "{target}"')
+            cursor.copy_expert(
+                f'COPY "{target}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'{COPY_NULL}\')',
+                buffer
+            )
+            if upsert:
+                updates = ', '.join(
+                    f'"{name}" = EXCLUDED."{name}"' for name in columns if name not in ('ad_id', 'day')
+                )
+                cursor.execute(
+                    f'INSERT INTO "{self.table_name}" ({column_list}) '
+                    f'SELECT DISTINCT ON (ad_id, day) {column_list} FROM "{target}" ORDER BY ad_id, day '
+                    f'ON CONFLICT (ad_id, day) DO UPDATE SET {updates}'
+                )
+        finally:
+            cursor.close()
+    
+    def _load_rows_individually(self, rows: List[Dict[str, Any]], upsert: bool) -> int:
+        count = 0
+        for row in rows:
+            try:
+                with self.session.begin_nested():
+                    stmt = self._upsert_statement() if upsert else self.table.insert()
+                    self.session.execute(stmt, [row])
                 count += 1
             except Exception as e:
-                logger.error(f"Error inserting record: {e}")
+                logger.error(f"Error inserting record (ad_id={row.get('ad_id')}, day={row.get('day')}): {e}")
                 continue
-        
-        self.session.commit()
-        logger.info(f"Inserted {count} records into {self.table_name}")
         return count
     
+    def _upsert_statement(self):
+        stmt = pg_insert(self.table)
+        return stmt.on_conflict_do_update(
+            index_elements=['ad_id', 'day'],
+            set_={
+                name: stmt.excluded[name]
+                for name in self.table.c.keys()
+                if name not in ('id', 'ad_id', 'day')
+            }
+        )
+    
+    def get_latest_day(self) -> Optional[date]:
+        """Most recent day stored in the table, or None if empty"""
+        return self.session.execute(select(func.max(self.table.c.day))).scalar()
+    
+    def iter_batches(self, columns: List[str] = None, batch_size: int = None,
+                     days: List[str] = None, since: Union[str, date] = None, until: Union[str, date] = None,
+                     where: Dict[str, Any] = None, descending: bool = True) -> Iterator[List[Tuple]]:
+        """Stream rows through a server-side cursor in batches of tuples.
+        
+        columns: projection (default: all columns)
+        days / since / until: restrict to listed days or an inclusive date range
+        where: {column: value} equality filters, a list/tuple/set value means IN
+        Rows are ordered by day (newest first unless descending=False), then ad_id.
+        In normalized mode, name columns are resolved from the dimension cache.
+        """
+        if self.dimensions and columns and any(name in NAME_COLUMNS for name in columns):
+            yield from self._iter_batches_with_names(columns, batch_size, days, since, until, where, descending)
+            return
+        batch_size = batch_size or Config.DB_READ_BATCH_SIZE
+        selected = [self.table.c[name] for name in columns] if columns else list(self.table.c)
+        day_order = self.table.c.day.desc() if descending else self.table.c.day.asc()
+        stmt = (
+            select(*selected)
+            .where(*self._filters(days, since, until, where))
+            .order_by(day_order, self.table.c.ad_id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = self.session.execute(stmt)
+        try:
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+        finally:
+            result.close()
+    
+    def _iter_batches_with_names(self, columns: List[str], batch_size: int, *filters) -> Iterator[List[Tuple]]:
+        """Select ids instead of names, then swap each id for its cached name"""
+        names = self.dimensions.load_cache()
+        selected = [name for name in columns if name not in NAME_COLUMNS]
+        getters = []
+        for name in columns:
+            if name in NAME_COLUMNS:
+                level = NAME_COLUMNS[name]
+                id_column = DIMENSION_LEVELS[level][0]
+                if id_column not in selected:
+                    selected.append(id_column)
+                getters.append((selected.index(id_column), names[level]))
+            else:
+                getters.append((selected.index(name), None))
+        
+        for batch in self.iter_batches(selected, batch_size, *filters):
+            yield [
+                tuple(lookup.get(row[index]) if lookup is not None else row[index] for index, lookup in getters)
+                for row in batch
+            ]
+    
+    def iter_dataframes(self, columns: List[str] = None, batch_size: int = None, **filters) -> Iterator[pd.DataFrame]:
+        """Same as iter_batches but yields one DataFrame per chunk"""
+        names = columns or list(self.table.c.keys())
+        for batch in self.iter_batches(columns=names, batch_size=batch_size, **filters):
+            yield pd.DataFrame.from_records(batch, columns=names)
+    
+    def iter_records(self, columns: List[str] = None, batch_size: int = None, **filters) -> Iterator[Dict[str, Any]]:
+        """Same as iter_batches but yields one dict per row"""
+        names = columns or list(self.table.c.keys())
+        for batch in self.iter_batches(columns=names, batch_size=batch_size, **filters):
+            for row in batch:
+                yield dict(zip(names, row))
+    
+    def _filters(self, days: List[str] = None, since: Union[str, date] = None, until: Union[str, date] = None,
+                 where: Dict[str, Any] = None) -> List[Any]:
+        conditions = []
+        if days is not None:
+            conditions.append(self.table.c.day.in_(days))
+        if since is not None:
+            conditions.append(self.table.c.day >= since)
+        if until is not None:
+            conditions.append(self.table.c.day <= until)
+        for name, value in (where or {}).items():
+            column = self.table.c[name]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                conditions.append(column.in_(list(value)))
+            else:
+                conditions.append(column == value)
+        return conditions
+    
+    def get_day_digests(self, columns: List[str]) -> Dict[str, str]:
+        """md5 of the given columns per day, used to detect which days changed between exports"""
+        joins = ''
+        expressions = []
+        for name in columns:
+            if self.dimensions and name in NAME_COLUMNS:
+                # Names are part of the digest, so a rename re-exports the affected days
+                level = NAME_COLUMNS[name]
+                id_column = DIMENSION_LEVELS[level][0]
+                joins += (f' LEFT JOIN "{dimension_table_name(self.table_name, level)}" d_{level} '
+                          f'ON d_{level}.{id_column} = f.{id_column}')
+                expressions.append(f'd_{level}."{name}"')
+            else:
+                expressions.append(f'f."{name}"')
+        result = self.session.execute(text(
+            f'SELECT f.day, md5(string_agg(ROW({", ".join(expressions)})::text, \'|\' ORDER BY f.ad_id)) '
+            f'FROM "{self.table_name}" f{joins} GROUP BY f.day'
+        ))
+        return {str(day): digest for day, digest in result}
+    
     def get_all_data(self) -> List[Dict[str, Any]]:
         """Get all data from table"""
         result = self.session.execute(
@@ -144,14 +465,36 @@ class DatabaseManager:
     
     def clear_all_data(self):
         """Clear all data from table"""
-        self.session.execute(self.table.delete())
+        if self.partitions:
+            # Committed right away: TRUNCATE leaves no dead tuples behind but locks the table
+            self.session.execute(text(f'TRUNCATE "{self.table_name}"'))
+        else:
+            self._delete_all()
         self.session.commit()
         logger.info(f"Cleared all data from {self.table_name}")
+    
+    def _delete_all(self):
+        self.session.execute(self.table.delete())
+    
+    def clear_range(self, start_date: date, end_date: date):
+        """Remove the rows of [start_date, end_date] in the current transaction (only the overlapping partitions are scanned)"""
+        self.session.execute(self.table.delete().where(self.table.c.day.between(start_date, end_date)))
+    
+    def prune_old_data(self, retention_days: int, action: str = None) -> int:
+        """Drop data older than retention_days: whole partitions when partitioned, else a DELETE"""
+        action = action or Config.RETENTION_ACTION
+        if self.partitions:
+            return len(self.partitions.prune(retention_days, action))
+        cutoff = date.today() - timedelta(days=retention_days)
+        result = self.session.execute(self.table.delete().where(self.table.c.day < cutoff))
+        self.session.commit()
+        logger.info(f"Deleted {result.rowcount} records older than {cutoff} from {self.table_name}")
+        return result.rowcount
 
 
 def setup_all_tables():
     """Create tables for all configured ad accounts"""
     for account in Config.AD_ACCOUNTS:
-        table = create_ads_table(account['table_name'])
-        table.create(engine, checkfirst=True)
+        table = create_ads_table(account['table_name'], Config.STORAGE_MODE == 'normalized', Config.PARTITION_BY)
+        table.create(get_engine(), checkfirst=True)
         logger.info(f"Table {account['table_name']} created for {account['name']}")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Dimension Tables - account, campaign, adset and ad names keyed by id, with name history
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tables are built once per account table, each in its own MetaData (see database.create_ads_table)
+_tables: Dict[str, Table] = {}
+_tables_lock = threading.Lock()
+
+# Level -> (id column, name column, parent id columns)
+DIMENSION_LEVELS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    'account': ('account_id', 'account_name', ()),
+    'campaign': ('campaign_id', 'campaign_name', ('account_id',)),
+    'adset': ('adset_id', 'adset_name', ('campaign_id',)),
+    'ad': ('ad_id', 'ad_name', ('adset_id', 'campaign_id')),
+}
+
+# Rows per multi-row dimension upsert (keeps the statement under the bind parameter limit)
+UPSERT_CHUNK = 1000
+
+# Name column -> level; these columns are not stored in normalized fact tables
+NAME_COLUMNS: Dict[str, str] = {name: level for level, (_, name, _) in DIMENSION_LEVELS.items()}
+
+
+def dimension_table_name(table_name: str, level: str) -> str:
+    return f"{table_name}_dim_{level}"
+
+
+def _cached_table(name: str, *columns) -> Table:
+    with _tables_lock:
+        if name not in _tables:
+            _tables[name] = Table(name, MetaData(), *columns)
+        return _tables[name]
+
+
+def create_dimension_table(table_name: str, level: str) -> Table:
+    """Current name (and parent ids) of every entity of one level"""
+    id_column, name_column, parents = DIMENSION_LEVELS[level]
+    return _cached_table(
+        dimension_table_name(table_name, level),
+        Column(id_column, String(50), primary_key=True),
+        Column(name_column, String(500)),
+        *[Column(parent, String(50), index=True) for parent in parents],
+        Column('updated_at', DateTime, default=datetime.utcnow),
+    )
+
+
+def create_name_history_table(table_name: str) -> Table:
+    """Every name an entity has had; valid_to is NULL for the current one"""
+    return _cached_table(
+        f"{table_name}_name_history",
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('level', String(20), nullable=False),
+        Column('entity_id', String(50), nullable=False, index=True),
+        Column('name', String(500)),
+        Column('valid_from', DateTime, nullable=False),
+        Column('valid_to', DateTime),
+    )
+
+
+class DimensionStore:
+    """Dimension tables of one account table plus an in-process id -> name lookup cache"""
+
+    def __init__(self, table_name: str, session: Session):
+        self.table_name = table_name
+        self.session = session
+        self.tables = {level: create_dimension_table(table_name, level) for level in DIMENSION_LEVELS}
+        self.history = create_name_history_table(table_name)
+        self.names: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def create_tables(self):
+        bind = self.session.get_bind()
+        for table in list(self.tables.values()) + [self.history]:
+            table.create(bind, checkfirst=True)
+
+    def load_cache(self) -> Dict[str, Dict[str, Any]]:
+        """Read every id -> name mapping once; later lookups never hit the database"""
+        if self.names is None:
+            self.names = {}
+            for level, table in self.tables.items():
+                id_column, name_column, _ = DIMENSION_LEVELS[level]
+                rows = self.session.execute(select(table.c[id_column], table.c[name_column]))
+                self.names[level] = dict(rows.all())
+            logger.info(
+                f"Loaded dimension cache for {self.table_name}: "
+                + ', '.join(f"{len(names)} {level}s" for level, names in self.names.items())
+            )
+        return self.names
+
+    def name_of(self, level: str, entity_id: Any) -> Optional[str]:
+        return self.load_cache()[level].get(entity_id)
+
+    def observe(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Upsert entities whose name is new or changed, and record the change in the history.
+
+        Unchanged names cost a dict lookup only. Changes are committed in short
+        transactions of their own, so concurrent loads of the same account
+        (parallel backfill windows, queue workers) only hold dimension row
+        locks for one level at a time. Returns the number of dimension rows written.
+        """
+        names = self.load_cache()
+        changed: Dict[str, Dict[str, Dict[str, Any]]] = {level: {} for level in DIMENSION_LEVELS}
+        for record in records:
+            for level, (id_column, name_column, parents) in DIMENSION_LEVELS.items():
+                entity_id = record.get(id_column)
+                if entity_id is None:
+                    continue
+                name = record.get(name_column)
+                known = names[level]
+                if entity_id in known and known[entity_id] == name:
+                    continue
+                row = {id_column: entity_id, name_column: name}
+                row.update({parent: record.get(parent) for parent in parents})
+                changed[level][entity_id] = row
+
+        now = datetime.utcnow()
+        written = 0
+        for level, rows in changed.items():
+            if rows:
+                self._write_level(level, list(rows.values()), now)
+                written += len(rows)
+        if written:
+            logger.info(f"Updated {written} dimension rows for {self.table_name}")
+        return written
+
+    def _write_level(self, level: str, rows: List[Dict[str, Any]], now: datetime):
+        """Upsert one level in id order; only rows whose stored name really changed get history.
+
+        Writers lock rows in the same order, so they wait on each other instead of
+        deadlocking, and a writer with a stale cache does not repeat another's history row.
+        """
+        id_column, name_column, parents = DIMENSION_LEVELS[level]
+        table = self.tables[level]
+        rows = sorted(rows, key=lambda row: str(row[id_column]))
+        for row in rows:
+            row['updated_at'] = now
+
+        with self.session.get_bind().begin() as connection:
+            changed = set()
+            for start in range(0, len(rows), UPSERT_CHUNK):
+                stmt = pg_insert(table).values(rows[start:start + UPSERT_CHUNK])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[id_column],
+                    set_={name: stmt.excluded[name] for name in (name_column, 'updated_at') + parents},
+                    where=table.c[name_column].is_distinct_from(stmt.excluded[name_column])
+                ).returning(table.c[id_column])
+                changed.update(connection.execute(stmt).scalars())
+            if changed:
+                connection.execute(
+                    self.history.update()
+                    .where(and_(
+                        self.history.c.level == level,
+                        self.history.c.entity_id.in_(sorted(changed)),
+                        self.history.c.valid_to.is_(None)
+                    ))
+                    .values(valid_to=now)
+                )
+                connection.execute(self.history.insert(), [
+                    {'level': level, 'entity_id': row[id_column], 'name': row[name_column], 'valid_from': now}
+                    for row in rows if row[id_column] in changed
+                ])
+
+        known = self.names[level]
+        for row in rows:
+            known[row[id_column]] = row[name_column]
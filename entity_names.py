@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Entity Names - account, campaign, adset and ad names fetched apart from the insights
+
+With NAMES_SOURCE=entities the insights request carries ids and metrics only.
+Names come from the campaigns/adsets/ads edges of the account, cached on disk
+next to the insights cache. After the first full read only entities whose
+updated_time moved are fetched again; ids the edges did not return (deleted
+or archived entities) are looked up by id in batch calls.
+"""
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from config import Config
+from dimensions import DIMENSION_LEVELS
+from graph_batch import fetch_all_pages
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Level -> account edge listing its entities
+ENTITY_EDGES = {'campaign': 'campaigns', 'adset': 'adsets', 'ad': 'ads'}
+
+# Re-read entities updated slightly before the last sync too (clock skew, eventual consistency)
+UPDATED_TIME_SKEW = 600
+
+
+class EntityNames:
+    """id -> name lookup for one ad account, kept in a SQLite cache and refreshed incrementally"""
+
+    def __init__(self, client, cache_dir: Path = None):
+        self.client = client
+        self.account_id = client.ad_account_id
+        self.cache_dir = Path(cache_dir or Config.CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / 'entity_names.sqlite'
+        self.names: Dict[str, Dict[str, Optional[str]]] = {level: {} for level in DIMENSION_LEVELS}
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entity_names ('
+                ' account_id TEXT NOT NULL, level TEXT NOT NULL, entity_id TEXT NOT NULL,'
+                ' name TEXT, updated_time TEXT,'
+                ' PRIMARY KEY (account_id, level, entity_id))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entity_sync ('
+                ' account_id TEXT PRIMARY KEY, synced_at REAL NOT NULL, full_synced_at REAL NOT NULL)'
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def refresh(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """Load cached names and fetch the entities changed since the last refresh"""
+        with closing(self._connect()) as conn, conn:
+            for level, entity_id, name in conn.execute(
+                'SELECT level, entity_id, name FROM entity_names WHERE account_id = ?', (self.account_id,)
+            ):
+                self.names[level][entity_id] = name
+            sync = conn.execute(
+                'SELECT synced_at, full_synced_at FROM entity_sync WHERE account_id = ?', (self.account_id,)
+            ).fetchone()
+
+        started = time.time()
+        full = sync is None or started - sync[1] > Config.ENTITY_FULL_REFRESH_HOURS * 3600
+        since = None if full else int(sync[0] - UPDATED_TIME_SKEW)
+        calls = []
+        for edge in ENTITY_EDGES.values():
+            params = {'fields': ['id', 'name', 'updated_time'], 'limit': 500}
+            if since is not None:
+                params['filtering'] = [{'field': 'updated_time', 'operator': 'GREATER_THAN', 'value': since}]
+            calls.append((f"{self.account_id}/{edge}", params))
+
+        results = fetch_all_pages(calls, self.client.api, page_metric='api_pages')
+        changed = 0
+        failed = False
+        for level, rows in zip(ENTITY_EDGES, results):
+            if isinstance(rows, Exception):
+                # Ids that are not cached are still looked up in fill()
+                logger.warning(f"Could not read {ENTITY_EDGES[level]} of {self.account_id}: {rows}")
+                failed = True
+                continue
+            changed += self._store(level, rows)
+
+        if not failed:
+            # Only a complete read moves the watermark, otherwise the next refresh repeats it
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entity_sync (account_id, synced_at, full_synced_at) VALUES (?, ?, ?)',
+                    (self.account_id, started, started if full else sync[1])
+                )
+        known = sum(len(names) for names in self.names.values())
+        logger.info(f"Entity names for {self.account_id}: {changed} {'read' if since is None else 'changed'}, "
+                    f"{known} cached")
+        return self.names
+
+    def _store(self, level: str, rows: Iterable[Dict[str, Any]]) -> int:
+        entries = [(self.account_id, level, str(row['id']), row.get('name'), row.get('updated_time'))
+                   for row in rows]
+        if entries:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO entity_names (account_id, level, entity_id, name, updated_time) '
+                    'VALUES (?, ?, ?, ?, ?)', entries
+                )
+        for _, _, entity_id, name, _ in entries:
+            self.names[level][entity_id] = name
+        return len(entries)
+
+    def fill(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Set the name columns of parsed insight records from their ids"""
+        missing: Dict[str, set] = {}
+        for record in records:
+            for level, (id_column, _, _) in DIMENSION_LEVELS.items():
+                entity_id = record.get(id_column)
+                if entity_id and entity_id not in self.names[level]:
+                    missing.setdefault(level, set()).add(entity_id)
+        if missing:
+            self._lookup(missing)
+
+        for record in records:
+            for level, (id_column, name_column, _) in DIMENSION_LEVELS.items():
+                record[name_column] = self.names[level].get(record.get(id_column))
+        return records
+
+    def _lookup(self, missing: Dict[str, set]):
+        """Read ids the edges did not return (the account itself, deleted or archived entities)"""
+        paths = {}
+        for level, ids in missing.items():
+            for entity_id in ids:
+                paths[f"act_{entity_id}" if level == 'account' else entity_id] = (level, entity_id)
+        found = self.client.get_objects(list(paths), ['name'])
+        for path, (level, entity_id) in paths.items():
+            if path in found:
+                self._store(level, [{'id': entity_id, 'name': found[path].get('name')}])
+            else:
+                # Not cached: the next run tries again
+                self.names[level][entity_id] = None
@@ -2,17 +2,26 @@
 """
 Excel Export Module - Multi Account Support
 """
+import json
 import logging
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import pandas as pd
+from openpyxl import Workbook
 from config import Config
+from insight_fields import EXCEL_COLUMN_ORDER, excel_labels
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+SHEET_NAME = 'Facebook Ads Data'
+# Excel's hard limit per sheet, header row included
+MAX_SHEET_ROWS = 1048576
+
+
 class ExcelExporter:
     """Class to export data to Excel"""
     
@@ -20,6 +29,7 @@ class ExcelExporter:
         self.export_folder = Path(export_folder or Config.EXPORT_FOLDER)
         self.filename = filename or Config.EXCEL_FILENAME
         self.export_folder.mkdir(parents=True, exist_ok=True)
+        self.last_row_count = 0
         logger.info(f"Excel exporter initialized. Export folder: {self.export_folder}")
     
     def get_export_path(self) -> Path:
@@ -44,56 +54,10 @@ class ExcelExporter:
         
         df = pd.DataFrame(data)
         
-        column_mapping = {
-            'account_id': 'Account ID',
-            'account_name': 'Account name',
-            'campaign_name': 'Campaign name',
-            'adset_name': 'Adset Name',
-            'ad_id': 'ADS ID',
-            'ad_name': 'Ad Name',
-            'day': 'Day',
-            'amount_spent': 'Amount spent',
-            'impressions': 'Impressions',
-            'reach': 'Reach',
-            'frequency': 'Frequency',
-            'cpc_all': 'CPC (all)',
-            'cpc_link_click': 'CPC (cost per link click)',
-            'ctr_all': 'CTR (all)',
-            'ctr_link_click': 'CTR (link click-through rate)',
-            'cpm': 'CPM (cost per 1,000 impressions)',
-            'link_clicks': 'Link clicks',
-            'cost_per_result': 'Cost Per Result',
-            'landing_page_views': 'Landing page views',
-            'cost_per_landing_page_view': 'Cost per landing page view',
-            'leads': 'Leads',
-            'leads_conversion_value': 'Leads Conversion Value',
-            'messaging_conversations_started': 'Messaging conversations started',
-            'adds_to_cart': 'Adds to cart',
-            'website_adds_to_cart': 'Website adds to cart',
-            'adds_to_cart_conversion_value': 'Adds to cart conversion value',
-            'checkouts_initiated': 'Checkouts Initiated',
-            'checkouts_initiated_conversion_value': 'Checkouts initiated conversion value',
-            'purchases': 'Purchases',
-            'website_purchases': 'Website purchases',
-            'purchases_conversion_value': 'Purchases conversion value',
-            'website_purchases_conversion_value': 'Website purchases conversion value',
-            'post_comments': 'Post comments',
-        }
-        
+        column_mapping = excel_labels()
         df = df.rename(columns=column_mapping)
         
-        desired_order = [
-            'ADS ID', 'Day', 'Campaign name', 'Amount spent', 'CPC (all)',
-            'CPC (cost per link click)', 'CTR (all)', 'CPM (cost per 1,000 impressions)',
-            'Post comments', 'Link clicks', 'Messaging conversations started',
-            'Landing page views', 'Cost per landing page view', 'Website adds to cart',
-            'Checkouts Initiated', 'Website purchases conversion value', 'Impressions',
-            'Website purchases', 'Leads', 'Leads Conversion Value', 'Reach',
-            'Purchases conversion value', 'Cost Per Result', 'Purchases',
-            'Adds to cart conversion value', 'Checkouts initiated conversion value',
-            'Adds to cart', 'Frequency', 'CTR (link click-through rate)',
-            'Account ID', 'Account name', 'Adset Name', 'Ad Name'
-        ]
+        desired_order = [column_mapping[column] for column in EXCEL_COLUMN_ORDER]
         
         existing_cols = [col for col in desired_order if col in df.columns]
         other_cols = [col for col in df.columns if col not in desired_order and col != 'id' and col != 'fetched_at']
@@ -102,7 +66,101 @@ class ExcelExporter:
         if 'Day' in df.columns:
             df = df.sort_values('Day', ascending=False)
         
-        df.to_excel(file_path, index=False, sheet_name='Facebook Ads Data')
+        df.to_excel(file_path, index=False, sheet_name=SHEET_NAME)
         
         logger.info(f"Exported {len(data)} records to {file_path}")
         return file_path
+    
+    def export_from_database(self, db_manager) -> Path:
+        """Stream rows from the database into a write-only workbook with bounded memory.
+        
+        Same column names and order as export_to_excel; rows are read in chunks
+        through a server-side cursor ordered by day (newest first). Overflow
+        beyond Excel's row limit continues on additional sheets.
+        """
+        file_path = self.get_export_path()
+        labels = excel_labels()
+        header = [labels[column] for column in EXCEL_COLUMN_ORDER]
+        
+        workbook = Workbook(write_only=True)
+        sheet = None
+        sheet_rows = MAX_SHEET_ROWS
+        count = 0
+        
+        for batch in db_manager.iter_batches(columns=EXCEL_COLUMN_ORDER):
+            for row in batch:
+                if sheet_rows >= MAX_SHEET_ROWS:
+                    sheet_index = len(workbook.worksheets) + 1
+                    sheet = workbook.create_sheet(SHEET_NAME if sheet_index == 1 else f"{SHEET_NAME} ({sheet_index})")
+                    sheet.append(header)
+                    sheet_rows = 1
+                sheet.append(row)
+                sheet_rows += 1
+                count += 1
+        
+        self.last_row_count = count
+        if not count:
+            logger.warning("No data to export")
+            self.delete_existing_file()
+            return file_path
+        
+        # Write next to the target and rename into place so readers never see a missing file
+        tmp_path = file_path.with_name(f".{file_path.name}.tmp")
+        workbook.save(tmp_path)
+        os.replace(tmp_path, file_path)
+        logger.info(f"Exported {count} records to {file_path}")
+        return file_path
+    
+    def get_manifest_path(self) -> Path:
+        return self.export_folder / f"{self.filename}.manifest.json"
+    
+    def load_manifest(self) -> Dict[str, Any]:
+        manifest_path = self.get_manifest_path()
+        if not manifest_path.exists():
+            return {}
+        try:
+            return json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return {}
+    
+    def save_manifest(self, manifest: Dict[str, Any]):
+        manifest_path = self.get_manifest_path()
+        tmp_path = manifest_path.with_name(f".{manifest_path.name}.tmp")
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+        os.replace(tmp_path, manifest_path)
+    
+    def export_if_changed(self, db_manager) -> Optional[Path]:
+        """Re-export only when the exported content changed since the last run.
+        
+        Compares per-day content digests of the export columns with the manifest
+        stored next to the workbook. Returns None when the export was skipped.
+        """
+        file_path = self.get_export_path()
+        digests = db_manager.get_day_digests(EXCEL_COLUMN_ORDER)
+        manifest = self.load_manifest()
+        
+        if (
+            file_path.exists()
+            and manifest.get('columns') == EXCEL_COLUMN_ORDER
+            and manifest.get('day_digests') == digests
+        ):
+            logger.info(f"Export unchanged, skipping {file_path}")
+            self.last_row_count = 0
+            return None
+        
+        previous = manifest.get('day_digests', {})
+        changed_days = sorted(
+            day for day in set(digests) | set(previous) if digests.get(day) != previous.get(day)
+        )
+        if previous and changed_days:
+            logger.info(f"{len(changed_days)} days changed since last export ({changed_days[0]} .. {changed_days[-1]})")
+        
+        path = self.export_from_database(db_manager)
+        self.save_manifest({
+            'columns': EXCEL_COLUMN_ORDER,
+            'day_digests': digests,
+            'row_count': self.last_row_count,
+            'exported_at': datetime.utcnow().isoformat(),
+        })
+        return path
@@ -3,38 +3,227 @@
 Facebook Ads API Client - Multi Account Support
 """
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
-from facebook_business.api import FacebookAdsApi
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterator, Tuple, Union
+import requests
 from facebook_business.adobjects.adaccount import AdAccount
+from facebook_business.adobjects.adreportrun import AdReportRun
+from facebook_business.exceptions import FacebookRequestError
 from config import Config
+from entity_names import EntityNames
+from graph_batch import MAX_BATCH_SIZE, GraphBatch, fetch_first_pages, next_cursor
+from insight_fields import InsightParser
+from insights_cache import InsightsCache
+from metrics import get_metrics
+from resources import get_api
+from streaming import consume, produce_into
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+INSIGHTS_LEVEL = 'ad'
+
+# Extraction spec compiled once from the field registry
+INSIGHT_PARSER = InsightParser()
+
+# Window length in days for each FETCH_SPLIT mode
+WINDOW_DAYS = {'day': 1, 'week': 7}
+
+# Rows per insights page for result cursors and batched requests
+PAGE_LIMIT = 500
+
+# Every campaign status: the campaigns edge leaves archived and deleted ones out by default,
+# but they can still have spend in the requested range
+CAMPAIGN_STATUSES = ['ACTIVE', 'PAUSED', 'IN_PROCESS', 'WITH_ISSUES', 'ARCHIVED', 'DELETED']
+
+
+class ReportJobError(RuntimeError):
+    """Raised when an async Insights report job fails or times out"""
+
+
+def is_too_much_data_error(error: Exception) -> bool:
+    """True for failures that a smaller request would avoid (oversized or timed-out queries)"""
+    if isinstance(error, (ReportJobError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, FacebookRequestError):
+        message = (error.api_error_message() or '').lower()
+        return (
+            'reduce the amount of data' in message
+            or (error.api_error_code() in (1, 2) and error.http_status() >= 500)
+        )
+    return False
+
+
 class FacebookAdsClient:
     """Facebook Ads API Client"""
     
     def __init__(self, ad_account_id: str = None):
         Config.validate(ad_account_id)
         
-        FacebookAdsApi.init(
-            app_id=Config.FACEBOOK_APP_ID,
-            app_secret=Config.FACEBOOK_APP_SECRET,
-            access_token=Config.FACEBOOK_ACCESS_TOKEN
-        )
-        
+        self.api = get_api()
         self.ad_account_id = ad_account_id or Config.AD_ACCOUNT_ID
-        self.ad_account = AdAccount(self.ad_account_id)
+        self.ad_account = AdAccount(self.ad_account_id, api=self.api)
         logger.info(f"Facebook Ads API initialized for account: {self.ad_account_id}")
     
-    def get_ads_data(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    def get_ads_data(self, start_date: str, end_date: str, use_async: bool = None) -> List[Dict[str, Any]]:
         """Fetch ads insights data"""
+        results = []
+        for page in self.iter_ads_data(start_date, end_date, use_async=use_async):
+            results.extend(page)
+        return results
+    
+    def iter_ads_data(self, start_date: str, end_date: str, use_async: bool = None,
+                      split_by: str = None) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch ads insights data, yielding parsed records one API page (or planned window) at a time"""
         logger.info(f"Fetching ads data from {start_date} to {end_date}")
         
+        if use_async is None:
+            use_async = self._use_async(start_date, end_date)
+        split_by = split_by or Config.FETCH_SPLIT
+        
+        try:
+            total = 0
+            if Config.CACHE_ENABLED:
+                pages = self._iter_with_cache(start_date, end_date, use_async, split_by)
+            else:
+                pages = self._iter_range(start_date, end_date, use_async, split_by)
+            if Config.NAMES_SOURCE == 'entities':
+                # Insights carry ids only; names are joined from the entity cache
+                names = EntityNames(self)
+                names.refresh()
+                pages = (names.fill(page) for page in pages)
+            
+            for page in pages:
+                total += len(page)
+                yield page
+            
+            logger.info(f"Fetched {total} records")
+            
+        except Exception as e:
+            logger.error(f"Error fetching ads data: {e}")
+            raise
+    
+    def _use_async(self, start_date: str, end_date: str) -> bool:
+        """Async report jobs only for ranges of at least ASYNC_MIN_DAYS days"""
+        if not Config.ASYNC_INSIGHTS:
+            return False
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        return (end - start).days + 1 >= Config.ASYNC_MIN_DAYS
+    
+    def _iter_range(self, start_date: str, end_date: str, use_async: bool, split_by: str,
+                    raw: bool = False, window_done: Callable[[Dict[str, Any]], None] = None
+                    ) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch a date range as one request or as planned windows.
+        
+        window_done(window) is called once the last page of a planned window has been consumed.
+        """
+        if split_by == 'none':
+            return self._iter_pages(self._build_insights_params(start_date, end_date), use_async, raw)
+        windows = self.plan_windows(start_date, end_date, split_by)
+        logger.info(f"Fetch plan: {len(windows)} windows split by {split_by}")
+        if not use_async and Config.GRAPH_BATCH_SIZE > 1 and len(windows) > 1:
+            return self._iter_windows_batched(windows, raw, window_done)
+        return self._iter_windows_parallel(windows, use_async, raw, window_done)
+    
+    def _iter_with_cache(self, start_date: str, end_date: str, use_async: bool,
+                         split_by: str) -> Iterator[List[Dict[str, Any]]]:
+        """Serve closed days from the on-disk cache and fetch only missing or volatile days"""
+        cache = InsightsCache()
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        
+        hits = 0
+        missing_run = []
+        try:
+            for day in days:
+                rows = cache.get(self.ad_account_id, day, INSIGHTS_LEVEL, Config.INSIGHTS_FIELDS)
+                if rows is None:
+                    missing_run.append(day)
+                    continue
+                if missing_run:
+                    yield from self._fetch_and_cache(cache, missing_run, use_async, split_by)
+                    missing_run = []
+                hits += 1
+                if rows:
+                    yield [self._parse_insight(row) for row in rows]
+            if missing_run:
+                yield from self._fetch_and_cache(cache, missing_run, use_async, split_by)
+            
+            logger.info(f"Cache: {hits}/{len(days)} days served from {cache.db_path}")
+        finally:
+            cache.evict()
+    
+    def _fetch_and_cache(self, cache: InsightsCache, days: List[date], use_async: bool,
+                         split_by: str) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch a run of consecutive days, yield parsed pages and cache the raw rows per day.
+        
+        Pages are staged in the cache as they arrive. A day becomes a cache entry
+        as soon as the date window holding it is done (windows come in plan order),
+        or at the end for unsplit and per-campaign fetches; an abandoned or failed
+        fetch leaves its unfinished days uncached.
+        """
+        run_id = uuid.uuid4().hex
+        pending = {day.isoformat(): day for day in days}
+        
+        def commit(day_keys):
+            for key in day_keys:
+                day = pending.pop(key, None)
+                if day is not None:
+                    cache.commit_day(run_id, self.ad_account_id, day, INSIGHTS_LEVEL, Config.INSIGHTS_FIELDS)
+        
+        def window_done(window):
+            commit((window['since'] + timedelta(days=i)).isoformat()
+                   for i in range((window['until'] - window['since']).days + 1))
+        
+        try:
+            for raw_page in self._iter_range(str(days[0]), str(days[-1]), use_async, split_by, raw=True,
+                                             window_done=window_done if split_by in WINDOW_DAYS else None):
+                rows_by_day = {}
+                for row in raw_page:
+                    rows_by_day.setdefault(row.get('date_start'), []).append(row)
+                for key, rows in rows_by_day.items():
+                    if key in pending:
+                        cache.append(run_id, self.ad_account_id, pending[key], INSIGHTS_LEVEL,
+                                     Config.INSIGHTS_FIELDS, rows)
+                yield [self._parse_insight(row) for row in raw_page]
+            commit(list(pending))
+        finally:
+            cache.discard(run_id)
+    
+    def _iter_pages(self, params: Dict[str, Any], use_async: bool, raw: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Run one insights request and yield its records page by page (parsed, or raw dicts)"""
+        if use_async:
+            report_run = self.submit_report(params)
+            insights = self.wait_for_report(report_run)
+        else:
+            insights = self.ad_account.get_insights(params=params)
+        
+        metrics = get_metrics()
+        page = []
+        for insight in insights:
+            page.append(insight.export_all_data() if raw else self._parse_insight(insight))
+            # Cursor queue drained: the next item would trigger another page request
+            if len(insights) == 0:
+                metrics.add('api_pages', 1)
+                yield page
+                page = []
+        if page:
+            metrics.add('api_pages', 1)
+            yield page
+    
+    def _build_insights_params(self, start_date: str, end_date: str, campaign_ids: List[str] = None) -> Dict[str, Any]:
         params = {
-            'level': 'ad',
+            'level': INSIGHTS_LEVEL,
             'time_range': {
                 'since': start_date,
                 'until': end_date
@@ -42,82 +231,263 @@ class FacebookAdsClient:
             'time_increment': 1,
             'fields': Config.INSIGHTS_FIELDS,
         }
+        if campaign_ids:
+            params['filtering'] = [{'field': 'campaign.id', 'operator': 'IN', 'value': campaign_ids}]
+        return params
+    
+    def plan_windows(self, start_date: str, end_date: str, split_by: str) -> List[Dict[str, Any]]:
+        """Split a date range into fetch windows: per day, per week or per campaign id chunk"""
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        try:
-            insights = self.ad_account.get_insights(params=params)
-            
-            results = []
-            for insight in insights:
-                parsed = self._parse_insight(insight)
-                results.append(parsed)
+        if split_by == 'campaign':
+            campaigns = self.ad_account.get_campaigns(
+                fields=['id'], params={'limit': PAGE_LIMIT, 'effective_status': CAMPAIGN_STATUSES}
+            )
+            campaign_ids = [c['id'] for c in campaigns]
+            chunk = Config.FETCH_CAMPAIGNS_PER_WINDOW
+            return [
+                {'since': start, 'until': end, 'campaign_ids': campaign_ids[i:i + chunk]}
+                for i in range(0, len(campaign_ids), chunk)
+            ]
+        
+        if split_by not in WINDOW_DAYS:
+            raise ValueError(f"Unknown FETCH_SPLIT: {split_by}")
+        step = WINDOW_DAYS[split_by]
+        windows = []
+        while start <= end:
+            until = min(start + timedelta(days=step - 1), end)
+            windows.append({'since': start, 'until': until, 'campaign_ids': None})
+            start = until + timedelta(days=1)
+        return windows
+    
+    def _iter_windows_parallel(self, windows: List[Dict[str, Any]], use_async: bool, raw: bool = False,
+                               window_done: Callable[[Dict[str, Any]], None] = None
+                               ) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch windows on a thread pool, yielding their pages in plan order.
+        
+        At most FETCH_WORKERS windows are in flight and each hands its pages over
+        a queue of STREAM_PREFETCH_PAGES, so memory is bounded by pages, not windows.
+        """
+        max_workers = max(1, Config.FETCH_WORKERS)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch') as executor:
+            pending = deque()
+            remaining = iter(windows)
             
-            logger.info(f"Fetched {len(results)} records")
-            return results
+            def start(window):
+                buffer = queue.Queue(maxsize=max(1, Config.STREAM_PREFETCH_PAGES))
+                executor.submit(produce_into, buffer, self.iter_window(window, use_async, raw), stop)
+                pending.append((window, buffer))
             
+            for window in islice(remaining, max_workers):
+                start(window)
+            try:
+                while pending:
+                    window, buffer = pending.popleft()
+                    yield from consume(buffer)
+                    if window_done:
+                        window_done(window)
+                    for window in islice(remaining, 1):
+                        start(window)
+            finally:
+                # Unblocks producers whose pages will not be consumed (error or abandoned iteration)
+                stop.set()
+    
+    def _iter_windows_batched(self, windows: List[Dict[str, Any]], raw: bool = False,
+                              window_done: Callable[[Dict[str, Any]], None] = None
+                              ) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch sync windows through Graph batch calls, GRAPH_BATCH_SIZE windows per HTTP call.
+        
+        A batch call carries only the first page of each window. Each window is
+        yielded in turn as soon as the call returns, and its further pages are
+        followed one at a time (see _iter_after_first_page), so at most one
+        batch of first pages is held in memory.
+        Windows the API rejects as too large fall back to iter_window, which bisects them.
+        """
+        size = min(MAX_BATCH_SIZE, Config.GRAPH_BATCH_SIZE)
+        for start in range(0, len(windows), size):
+            group = windows[start:start + size]
+            params = [self._build_insights_params(str(w['since']), str(w['until']), w['campaign_ids']) for w in group]
+            responses = fetch_insights_first_pages([(self.ad_account_id, p) for p in params], self.api)
+            for index, window in enumerate(group):
+                # Released once consumed, the rest of the batch waits its turn
+                response, responses[index] = responses[index], None
+                if isinstance(response, Exception):
+                    if not is_too_much_data_error(response):
+                        raise response
+                    yield from self.iter_window(window, use_async=False, raw=raw)
+                else:
+                    pages, response = self._iter_after_first_page(params[index], response, raw), None
+                    yield from pages
+                if window_done:
+                    window_done(window)
+    
+    def _iter_after_first_page(self, params: Dict[str, Any], response: Dict[str, Any],
+                               raw: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the first page of a batched insights request, then follow its cursor through _iter_pages"""
+        after = next_cursor(response)
+        rows = response.get('data', [])
+        del response
+        records = rows if raw else [self._parse_insight(row) for row in rows]
+        del rows
+        if records:
+            yield records
+        del records
+        if after:
+            yield from self._iter_pages(dict(params, limit=PAGE_LIMIT, after=after), use_async=False, raw=raw)
+    
+    def get_objects(self, ids: List[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Read campaigns, adsets or ads by id (e.g. their status) in batch calls of up to 50"""
+        batch = GraphBatch(self.api)
+        futures = {object_id: batch.get(object_id, fields=fields) for object_id in dict.fromkeys(ids)}
+        calls = batch.execute()
+        objects = {}
+        for object_id, future in futures.items():
+            try:
+                objects[object_id] = future.result()
+            except FacebookRequestError as e:
+                logger.warning(f"Could not read object {object_id}: {e.api_error_message()}")
+        logger.info(f"Read {len(objects)}/{len(futures)} objects in {calls} batch calls")
+        return objects
+    
+    def iter_window(self, window: Dict[str, Any], use_async: bool, raw: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch one window page by page, bisecting it (by date, then by campaign) when the API says it is too large.
+        
+        Only a window failing before its first page is bisected: after that its
+        halves would repeat rows already yielded, so the error is raised.
+        """
+        since = window['since']
+        until = window['until']
+        campaign_ids = window['campaign_ids']
+        params = self._build_insights_params(str(since), str(until), campaign_ids)
+        
+        yielded = False
+        try:
+            for page in self._iter_pages(params, use_async, raw):
+                yielded = True
+                yield page
+            return
         except Exception as e:
-            logger.error(f"Error fetching ads data: {e}")
-            raise
+            if yielded or not is_too_much_data_error(e):
+                raise
+            if since < until:
+                middle = since + (until - since) // 2
+                halves = [
+                    {'since': since, 'until': middle, 'campaign_ids': campaign_ids},
+                    {'since': middle + timedelta(days=1), 'until': until, 'campaign_ids': campaign_ids},
+                ]
+            elif campaign_ids and len(campaign_ids) > 1:
+                middle = len(campaign_ids) // 2
+                halves = [
+                    {'since': since, 'until': until, 'campaign_ids': campaign_ids[:middle]},
+                    {'since': since, 'until': until, 'campaign_ids': campaign_ids[middle:]},
+                ]
+            else:
+                raise
+            reason = e.api_error_message() if isinstance(e, FacebookRequestError) else e
+            logger.warning(f"Window {since}..{until} too large ({reason}), bisecting")
+        for half in halves:
+            yield from self.iter_window(half, use_async, raw)
+    
+    def submit_report(self, params: Dict[str, Any]) -> AdReportRun:
+        """Start an async Insights report job"""
+        report_run = self.ad_account.get_insights(params=params, is_async=True)
+        logger.info(f"Submitted report job {report_run.get_id()} for account {self.ad_account_id}")
+        return report_run
+    
+    def wait_for_report(self, report_run: AdReportRun):
+        """Poll a report job with backoff until it completes, return a cursor over its results"""
+        interval = Config.ASYNC_POLL_INTERVAL
+        deadline = time.monotonic() + Config.ASYNC_JOB_TIMEOUT
+        
+        while True:
+            report_run = report_run.api_get(fields=[
+                AdReportRun.Field.async_status,
+                AdReportRun.Field.async_percent_completion,
+            ])
+            status = report_run[AdReportRun.Field.async_status]
+            percent = report_run.get(AdReportRun.Field.async_percent_completion, 0)
+            
+            if status == 'Job Completed':
+                logger.info(f"Report job {report_run.get_id()} completed")
+                return report_run.get_insights(params={'limit': PAGE_LIMIT})
+            if status in ('Job Failed', 'Job Skipped'):
+                raise ReportJobError(f"Report job {report_run.get_id()} ended with status: {status}")
+            if time.monotonic() + interval > deadline:
+                raise ReportJobError(
+                    f"Report job {report_run.get_id()} timed out after {Config.ASYNC_JOB_TIMEOUT}s ({percent}%)"
+                )
+            
+            logger.debug(f"Report job {report_run.get_id()}: {status} ({percent}%), next poll in {interval:.1f}s")
+            time.sleep(interval)
+            interval = min(interval * 1.5, Config.ASYNC_POLL_MAX_INTERVAL)
     
     def _parse_insight(self, insight) -> Dict[str, Any]:
         """Parse insight data"""
-        data = dict(insight)
-        
-        # Extract actions
-        actions = {}
-        if 'actions' in data:
-            for action in data.get('actions', []):
-                action_type = action.get('action_type', '')
-                action_value = float(action.get('value', 0))
-                actions[action_type] = action_value
-        
-        # Extract action values
-        action_values = {}
-        if 'action_values' in data:
-            for av in data.get('action_values', []):
-                action_type = av.get('action_type', '')
-                action_value = float(av.get('value', 0))
-                action_values[action_type] = action_value
-        
-        # Extract cost per action
-        cost_per_action = {}
-        if 'cost_per_action_type' in data:
-            for cpa in data.get('cost_per_action_type', []):
-                action_type = cpa.get('action_type', '')
-                cost = float(cpa.get('value', 0))
-                cost_per_action[action_type] = cost
-        
-        return {
-            'account_id': data.get('account_id'),
-            'account_name': data.get('account_name'),
-            'campaign_name': data.get('campaign_name'),
-            'adset_name': data.get('adset_name'),
-            'ad_id': data.get('ad_id'),
-            'ad_name': data.get('ad_name'),
-            'day': data.get('date_start'),
-            'amount_spent': float(data.get('spend', 0)),
-            'impressions': int(data.get('impressions', 0)),
-            'reach': int(data.get('reach', 0)),
-            'frequency': float(data.get('frequency', 0)),
-            'cpc_all': float(data.get('cpc', 0)),
-            'cpc_link_click': float(data.get('cost_per_inline_link_click', 0)),
-            'ctr_all': float(data.get('ctr', 0)),
-            'ctr_link_click': float(data.get('inline_link_click_ctr', 0)),
-            'cpm': float(data.get('cpm', 0)),
-            'link_clicks': int(data.get('inline_link_clicks', 0)),
-            'cost_per_result': cost_per_action.get('omni_purchase', cost_per_action.get('purchase', 0)),
-            'landing_page_views': int(actions.get('landing_page_view', 0)),
-            'cost_per_landing_page_view': cost_per_action.get('landing_page_view', 0),
-            'leads': int(actions.get('lead', 0)),
-            'leads_conversion_value': action_values.get('lead', 0),
-            'messaging_conversations_started': int(actions.get('onsite_conversion.messaging_conversation_started_7d', 0)),
-            'adds_to_cart': int(actions.get('omni_add_to_cart', 0)),
-            'website_adds_to_cart': int(actions.get('add_to_cart', 0)),
-            'adds_to_cart_conversion_value': action_values.get('omni_add_to_cart', 0),
-            'checkouts_initiated': int(actions.get('omni_initiated_checkout', 0)),
-            'checkouts_initiated_conversion_value': action_values.get('omni_initiated_checkout', 0),
-            'purchases': int(actions.get('omni_purchase', 0)),
-            'website_purchases': int(actions.get('purchase', 0)),
-            'purchases_conversion_value': action_values.get('omni_purchase', 0),
-            'website_purchases_conversion_value': action_values.get('purchase', 0),
-            'post_comments': int(actions.get('post_comment', actions.get('comment', 0))),
-        }
+        # AdsInsights keeps the raw JSON row in _json; plain dicts come from the cache
+        return INSIGHT_PARSER.parse(getattr(insight, '_json', insight))
+
+
+def fetch_ads_data_many(jobs: List[Tuple[str, str, str]], max_in_flight: int = None) -> List[List[Dict[str, Any]]]:
+    """Fetch several accounts at once; ranges of ASYNC_MIN_DAYS or more run as async report jobs.
+    
+    jobs: list of (ad_account_id, start_date, end_date). Results are returned in the
+    same order, so total wall-clock time follows the slowest job, not the sum.
+    """
+    max_in_flight = max_in_flight or Config.ASYNC_MAX_JOBS
+    # Clients (and the shared API) are created here, before any worker thread starts
+    clients = [FacebookAdsClient(ad_account_id=ad_account_id) for ad_account_id, _, _ in jobs]
+    
+    def run_job(client, job):
+        _, start_date, end_date = job
+        return client.get_ads_data(start_date, end_date)
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        return list(executor.map(run_job, clients, jobs))
+
+
+def fetch_insights_first_pages(calls: List[Tuple[str, Dict[str, Any]]],
+                               api=None) -> List[Union[Dict[str, Any], Exception]]:
+    """Run sync insights requests as one Graph batch call, first page only.
+    
+    calls: list of (ad_account_id, insights params). Returns the response body of
+    every request in the same order (`data` and `paging`), or the exception that
+    request failed with; further pages are read with FacebookAdsClient._iter_after_first_page.
+    """
+    return fetch_first_pages(
+        [(f"{ad_account_id}/insights", dict(params, limit=PAGE_LIMIT)) for ad_account_id, params in calls],
+        api, page_metric='api_pages'
+    )
+
+
+def fetch_ads_data_batched(jobs: List[Tuple[str, str, str]]) -> List[List[Dict[str, Any]]]:
+    """Fetch many small accounts with sync insights, up to 50 accounts per HTTP call.
+    
+    jobs: list of (ad_account_id, start_date, end_date). Results are returned in the
+    same order. Only the first page of every account shares a batch call, the
+    next pages are read per account. Accounts too large for one request are
+    fetched on their own.
+    """
+    clients = [FacebookAdsClient(ad_account_id=ad_account_id) for ad_account_id, _, _ in jobs]
+    calls = [(client.ad_account_id, client._build_insights_params(start_date, end_date))
+                 for client, (_, start_date, end_date) in zip(clients, jobs)]
+    
+    results = []
+    size = max(1, min(MAX_BATCH_SIZE, Config.GRAPH_BATCH_SIZE))
+    for start in range(0, len(jobs), size):
+        responses = fetch_insights_first_pages(calls[start:start + size], clients[0].api)
+        for client, job, (_, params), response in zip(clients[start:start + size], jobs[start:start + size],
+                                                      calls[start:start + size], responses):
+            if isinstance(response, Exception):
+                if not is_too_much_data_error(response):
+                    raise response
+                results.append(client.get_ads_data(job[1], job[2], use_async=False))
+                continue
+            records = [record for page in client._iter_after_first_page(params, response) for record in page]
+            if Config.NAMES_SOURCE == 'entities':
+                names = EntityNames(client)
+                names.refresh()
+                names.fill(records)
+            results.append(records)
+    return results
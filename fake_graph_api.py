@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Fake Graph API - local stand-in for the ad account Insights endpoints (benchmarks and testing)
+
+Serves synthetic ad-level insights with actions/action_values for any date
+range, cursor paging, async report jobs, a campaign list, campaign/adset/ad
+objects by id, batch requests, rate-limit usage headers, simulated latency
+and optional throttle errors.
+
+    python fake_graph_api.py --port 8765 --ads 500
+    FACEBOOK_GRAPH_URL=http://127.0.0.1:8765 python main.py --run-now
+"""
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (action_type, share of link clicks that convert, average value)
+SYNTHETIC_ACTIONS = [
+    ('landing_page_view', 0.6, 0),
+    ('lead', 0.05, 12.0),
+    ('onsite_conversion.messaging_conversation_started_7d', 0.03, 0),
+    ('omni_add_to_cart', 0.08, 35.0),
+    ('add_to_cart', 0.07, 35.0),
+    ('omni_initiated_checkout', 0.04, 40.0),
+    ('omni_purchase', 0.02, 55.0),
+    ('purchase', 0.018, 55.0),
+    ('post_comment', 0.01, 0),
+]
+
+THROTTLE_ERROR = {
+    'message': '(#80004) There have been too many calls to this ad-account. Wait a bit and try again.',
+    'type': 'OAuthException',
+    'code': 80004,
+    'error_subcode': 2446079,
+}
+
+# Account edge -> first digit of its entity ids
+EDGES = {'campaigns': '2', 'adsets': '3', 'ads': '1'}
+
+
+class FakeGraphAPI:
+    """Threaded HTTP server generating deterministic synthetic insights"""
+
+    def __init__(self, ads: int = 100, campaigns: int = 10, adsets_per_campaign: int = 3,
+                 page_size: int = 500, latency: float = 0.0, usage: float = 10.0,
+                 throttle_rate: float = 0.0, async_polls: int = 1, host: str = '127.0.0.1',
+                 port: int = 0, seed: int = 0):
+        self.ads = ads
+        self.campaigns = campaigns
+        self.adsets = max(1, campaigns * adsets_per_campaign)
+        self.page_size = page_size
+        self.latency = latency
+        self.usage = usage
+        self.throttle_rate = throttle_rate
+        self.async_polls = async_polls
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.job_ids = count(1)
+        self.stats = {'requests': 0, 'rows': 0, 'throttled': 0, 'jobs': 0, 'batched': 0, 'bytes': 0}
+        # Every entity was last updated a day before the server started
+        self.updated_time = int(time.time()) - 86400
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeGraphAPI':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-graph-api', daemon=True)
+        self.thread.start()
+        logger.info(f"Fake Graph API listening on {self.url} ({self.ads} ads, {self.campaigns} campaigns)")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # Synthetic entities and rows
+
+    def ad_ids(self, campaign_ids: Optional[List[str]] = None) -> List[int]:
+        ids = range(self.ads)
+        if campaign_ids is not None:
+            wanted = set(campaign_ids)
+            ids = [i for i in ids if self.campaign_id(i) in wanted]
+        return list(ids)
+
+    def campaign_id(self, ad: int) -> str:
+        return f"2{ad % self.campaigns:08d}"
+
+    def adset_id(self, ad: int) -> str:
+        return f"3{ad % self.adsets:08d}"
+
+    def insight_row(self, account_id: str, ad: int, day: date, fields: Optional[set]) -> Dict[str, Any]:
+        """One ad-day row, deterministic for (seed, ad, day)"""
+        rng = random.Random(zlib.crc32(f"{self.seed}:{ad}:{day}".encode()))
+        impressions = rng.randint(200, 20000)
+        clicks = int(impressions * rng.uniform(0.005, 0.04))
+        link_clicks = int(clicks * rng.uniform(0.4, 0.9))
+        reach = int(impressions / rng.uniform(1.0, 1.8))
+        spend = round(impressions * rng.uniform(0.002, 0.012), 2)
+
+        actions, values, costs = [], [], []
+        for action_type, rate, value in SYNTHETIC_ACTIONS:
+            n = int(link_clicks * rate * rng.uniform(0.5, 1.5))
+            if not n:
+                continue
+            actions.append({'action_type': action_type, 'value': str(n)})
+            costs.append({'action_type': action_type, 'value': f"{spend / n:.6f}"})
+            if value:
+                values.append({'action_type': action_type, 'value': f"{n * value * rng.uniform(0.8, 1.2):.2f}"})
+
+        row = {
+            'account_id': account_id.replace('act_', ''),
+            'account_name': f"Benchmark {account_id}",
+            'campaign_id': self.campaign_id(ad),
+            'campaign_name': f"Campaign {ad % self.campaigns}",
+            'adset_id': self.adset_id(ad),
+            'adset_name': f"Adset {ad % self.adsets}",
+            'ad_id': f"1{ad:08d}",
+            'ad_name': f"Ad {ad}",
+            'spend': f"{spend:.2f}",
+            'impressions': str(impressions),
+            'reach': str(reach),
+            'frequency': f"{impressions / max(reach, 1):.6f}",
+            'clicks': str(clicks),
+            'inline_link_clicks': str(link_clicks),
+            'cpc': f"{spend / max(clicks, 1):.6f}",
+            'cost_per_inline_link_click': f"{spend / max(link_clicks, 1):.6f}",
+            'ctr': f"{clicks * 100 / impressions:.6f}",
+            'inline_link_click_ctr': f"{link_clicks * 100 / impressions:.6f}",
+            'cpm': f"{spend * 1000 / impressions:.6f}",
+            'actions': actions,
+            'action_values': values,
+            'cost_per_action_type': costs,
+        }
+        if fields:
+            row = {key: value for key, value in row.items() if key in fields}
+        row['date_start'] = row['date_stop'] = day.isoformat()
+        return row
+
+    def insights_page(self, account_id: str, params: Dict[str, Any], after: int, limit: int) -> Dict[str, Any]:
+        """Rows [after, after + limit) of the day-major, ad-minor result set"""
+        time_range = params.get('time_range') or {}
+        since = date.fromisoformat(time_range.get('since', date.today().isoformat()))
+        until = date.fromisoformat(time_range.get('until', since.isoformat()))
+        campaign_ids = None
+        for condition in params.get('filtering') or []:
+            if condition.get('field') == 'campaign.id':
+                campaign_ids = [str(value) for value in condition.get('value', [])]
+        fields = set(params['fields']) if params.get('fields') else None
+
+        ads = self.ad_ids(campaign_ids)
+        total = len(ads) * ((until - since).days + 1) if ads and until >= since else 0
+        end = min(after + limit, total)
+        data = [
+            self.insight_row(account_id, ads[index % len(ads)], since + timedelta(days=index // len(ads)), fields)
+            for index in range(after, end)
+        ]
+        with self.lock:
+            self.stats['rows'] += len(data)
+        response = {'data': data, 'paging': {'cursors': {'before': str(after), 'after': str(end)}}}
+        if end < total:
+            response['paging']['next'] = f"{self.url}/insights?after={end}"
+        return response
+
+    def usage_headers(self, account_id: str) -> Dict[str, str]:
+        usage = min(100.0, max(0.0, self.usage + self.random.uniform(-5, 5)))
+        business = {account_id.replace('act_', ''): [{
+            'type': 'ads_insights', 'call_count': round(usage), 'total_cputime': round(usage / 2),
+            'total_time': round(usage / 2), 'estimated_time_to_regain_access': 0,
+        }]}
+        # Like Meta, a reset time is reported even at low usage
+        account = {'acc_id_util_pct': round(usage, 2), 'reset_time_duration': 100 if usage else 0}
+        return {
+            'X-Business-Use-Case-Usage': json.dumps(business),
+            'X-Ad-Account-Usage': json.dumps(account),
+            'X-App-Usage': json.dumps({'call_count': round(usage / 2), 'total_cputime': 1, 'total_time': 1}),
+        }
+
+    # HTTP
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                self._dispatch('GET', parsed.path, _decode_params(parse_qs(parsed.query)))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf-8') if length else ''
+                params = _decode_params(parse_qs(urlparse(self.path).query))
+                params.update(_decode_params(parse_qs(body)))
+                self._dispatch('POST', urlparse(self.path).path, params)
+
+            def _dispatch(self, method: str, path: str, params: Dict[str, Any]):
+                with api.lock:
+                    api.stats['requests'] += 1
+                if api.latency:
+                    time.sleep(api.latency * api.random.uniform(0.5, 1.5))
+
+                parts = _path_parts(path)
+                if method == 'POST' and not parts and 'batch' in params:
+                    return self._send(200, api.batch(params['batch']), api.usage_headers('act_0'))
+                status, body, headers = api.handle(method, parts, params)
+                self._send(status, body, headers)
+
+            def _send(self, status: int, body: Dict[str, Any], headers: Dict[str, str]):
+                payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+                with api.lock:
+                    api.stats['bytes'] += len(payload)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def handle(self, method: str, parts: List[str], params: Dict[str, Any]) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        """One Graph call (direct or inside a batch): status, JSON body, headers"""
+        account_id = next((part for part in parts if part.startswith('act_')), 'act_0')
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            with self.lock:
+                self.stats['throttled'] += 1
+            return 400, {'error': THROTTLE_ERROR}, self.usage_headers(account_id)
+
+        after = int(params.get('after') or 0)
+        limit = int(params.get('limit') or self.page_size)
+        try:
+            body = self.route(method, parts, params, account_id, after, limit)
+        except KeyError as e:
+            return 400, {'error': {'message': f"Unknown object {e}", 'type': 'GraphMethodException', 'code': 100}}, {}
+        return 200, body, self.usage_headers(account_id)
+
+    def batch(self, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Answer a batch request: one {code, headers, body} entry per sub-request"""
+        with self.lock:
+            self.stats['batched'] += len(calls)
+        responses = []
+        for call in calls:
+            url = urlparse(call['relative_url'])
+            params = _decode_params(parse_qs(url.query))
+            params.update(_decode_params(parse_qs(call.get('body') or '')))
+            status, body, headers = self.handle(call.get('method', 'GET'), _path_parts(url.path), params)
+            responses.append({
+                'code': status,
+                'headers': [{'name': name, 'value': value} for name, value in headers.items()],
+                'body': json.dumps(body, separators=(',', ':')),
+            })
+        return responses
+
+    def entity(self, object_id: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+        """Campaign (2...), adset (3...) or ad (1...) object by id"""
+        number = int(object_id[1:])
+        kind = {'1': ('Ad', self.ads), '2': ('Campaign', self.campaigns), '3': ('Adset', self.adsets)}.get(object_id[0])
+        if kind is None or number >= kind[1]:
+            raise KeyError(object_id)
+        updated = datetime.fromtimestamp(self.updated_time, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+0000')
+        entity = {'id': object_id, 'name': f"{kind[0]} {number}", 'status': 'ACTIVE', 'effective_status': 'ACTIVE',
+                  'updated_time': updated}
+        if kind[0] == 'Ad':
+            entity.update(campaign_id=self.campaign_id(number), adset_id=self.adset_id(number))
+        elif kind[0] == 'Adset':
+            entity['campaign_id'] = f"2{number % self.campaigns:08d}"
+        if fields:
+            entity = {key: value for key, value in entity.items() if key in fields or key == 'id'}
+        return entity
+
+    def edge_page(self, edge: str, params: Dict[str, Any], after: int, limit: int) -> Dict[str, Any]:
+        """campaigns/adsets/ads of the account; honours an updated_time GREATER_THAN filter"""
+        prefix, total = EDGES[edge], {'campaigns': self.campaigns, 'adsets': self.adsets, 'ads': self.ads}[edge]
+        ids = [f"{prefix}{i:08d}" for i in range(total)]
+        for condition in params.get('filtering') or []:
+            if condition.get('field') == 'updated_time' and condition.get('operator') == 'GREATER_THAN':
+                if self.updated_time <= int(condition['value']):
+                    ids = []
+        end = min(after + limit, len(ids))
+        response = {'data': [self.entity(i, params.get('fields')) for i in ids[after:end]],
+                    'paging': {'cursors': {'before': str(after), 'after': str(end)}}}
+        if end < len(ids):
+            response['paging']['next'] = f"{self.url}/{edge}?after={end}"
+        return response
+
+    def route(self, method: str, parts: List[str], params: Dict[str, Any], account_id: str,
+              after: int, limit: int) -> Dict[str, Any]:
+        if len(parts) == 2 and parts[1] == 'insights' and parts[0].startswith('act_'):
+            if method == 'POST':
+                job_id = f"9{next(self.job_ids):08d}"
+                with self.lock:
+                    self.jobs[job_id] = {'account_id': account_id, 'params': params, 'polls': 0}
+                    self.stats['jobs'] += 1
+                return {'report_run_id': job_id}
+            return self.insights_page(account_id, params, after, limit)
+
+        if len(parts) == 2 and parts[1] in EDGES:
+            return self.edge_page(parts[1], params, after, limit)
+
+        if parts == [account_id]:
+            return {'id': account_id, 'name': f"Benchmark {account_id}"}
+
+        if len(parts) == 1 and parts[0] not in self.jobs and parts[0][:1] in ('1', '2', '3'):
+            return self.entity(parts[0], params.get('fields'))
+
+        job = self.jobs[parts[0]]
+        if len(parts) == 2 and parts[1] == 'insights':
+            return self.insights_page(job['account_id'], job['params'], after, limit)
+        with self.lock:
+            job['polls'] += 1
+            done = job['polls'] > self.async_polls
+        return {
+            'id': parts[0],
+            'async_status': 'Job Completed' if done else 'Job Running',
+            'async_percent_completion': 100 if done else 50,
+        }
+
+
+def _path_parts(path: str) -> List[str]:
+    """Path segments without the leading API version"""
+    parts = [part for part in path.split('/') if part]
+    if parts and parts[0].startswith('v') and parts[0][1:2].isdigit():
+        parts = parts[1:]
+    return parts
+
+
+def _decode_params(query: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Graph API params arrive as strings; JSON-encoded ones (time_range, filtering, fields) are decoded"""
+    params = {}
+    for key, values in query.items():
+        value = values[-1]
+        if value[:1] in ('{', '['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        elif key == 'fields':
+            value = value.split(',')
+        params[key] = value
+    return params
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local fake Graph API (Insights endpoints)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ads', type=int, default=100, help='Number of synthetic ads')
+    parser.add_argument('--campaigns', type=int, default=10)
+    parser.add_argument('--adsets-per-campaign', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=500, help='Rows per page when no limit is sent')
+    parser.add_argument('--latency', type=float, default=0.0, help='Average seconds added to every request')
+    parser.add_argument('--usage', type=float, default=10.0, help='Reported rate-limit usage percent')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with #80004')
+    parser.add_argument('--async-polls', type=int, default=1, help='Polls before a report job completes')
+    args = parser.parse_args()
+
+    server = FakeGraphAPI(
+        ads=args.ads, campaigns=args.campaigns, adsets_per_campaign=args.adsets_per_campaign,
+        page_size=args.page_size, latency=args.latency, usage=args.usage,
+        throttle_rate=args.throttle_rate, async_polls=args.async_polls, host=args.host, port=args.port
+    )
+    server.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Graph API Batch Requests - up to 50 sub-requests per HTTP call
+
+    batch = GraphBatch()
+    campaign = batch.get('120210000000001', fields=['name', 'effective_status'])
+    insights = batch.get('act_123/insights', params={...})
+    batch.execute()
+    campaign.result()   # parsed JSON body, or raises FacebookRequestError
+
+Each sub-request gets a Future that is resolved with its own response.
+Throttled, transient and unanswered sub-requests are retried on their own;
+the sub-requests that succeeded are not sent again.
+"""
+import json
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple, Union
+from facebook_business.exceptions import FacebookRequestError
+from config import Config
+from metrics import get_metrics
+from resources import get_api
+from throttling import THROTTLE_ERROR_CODES, get_throttler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hard limit of the Graph API
+MAX_BATCH_SIZE = 50
+
+# Temporary errors (1, 2) are retried like throttling
+RETRYABLE_ERROR_CODES = THROTTLE_ERROR_CODES | {1, 2}
+
+
+class _SubRequest:
+    __slots__ = ('method', 'relative_url', 'params', 'future', 'attempts', 'error')
+
+    def __init__(self, method: str, relative_url: str, params: Optional[Dict[str, Any]]):
+        self.method = method
+        self.relative_url = relative_url
+        self.params = params
+        self.future = Future()
+        self.attempts = 0
+        self.error = None
+
+
+class GraphBatch:
+    """Collects Graph API calls and sends them MAX_BATCH_SIZE at a time"""
+
+    def __init__(self, api=None, batch_size: int = None, max_retries: int = None):
+        self.api = api or get_api()
+        self.batch_size = max(1, min(MAX_BATCH_SIZE, batch_size or Config.GRAPH_BATCH_SIZE))
+        self.max_retries = Config.THROTTLE_MAX_RETRIES if max_retries is None else max_retries
+        self.http_calls = 0
+        self._queue: List[_SubRequest] = []
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def add(self, method: str, relative_url: str, params: Dict[str, Any] = None) -> Future:
+        request = _SubRequest(method, relative_url.lstrip('/'), params)
+        self._queue.append(request)
+        return request.future
+
+    def get(self, path: str, params: Dict[str, Any] = None, fields: List[str] = None) -> Future:
+        params = dict(params or {})
+        if fields:
+            params['fields'] = ','.join(fields)
+        return self.add('GET', path, params)
+
+    def execute(self) -> int:
+        """Send everything queued; returns the number of HTTP calls made"""
+        pending, self._queue = self._queue, []
+        calls_before = self.http_calls
+        attempt = 0
+        while pending:
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                retry.extend(self._execute_chunk(pending[start:start + self.batch_size]))
+            if not retry:
+                break
+            throttled = next((r.error for r in retry if r.error is not None), None)
+            if throttled is not None:
+                # Slows every caller down through the shared throttler before the retry goes out
+                get_metrics().observe_throttle_wait(get_throttler().backoff(attempt, throttled), 'backoff')
+            logger.info(f"Retrying {len(retry)} failed batch sub-requests")
+            attempt += 1
+            pending = retry
+        return self.http_calls - calls_before
+
+    def _execute_chunk(self, chunk: List[_SubRequest]) -> List[_SubRequest]:
+        """One batch HTTP call; returns the sub-requests that should be sent again"""
+        batch = self.api.new_batch()
+        answered = set()
+        retry = []
+
+        def on_success(request):
+            def callback(response):
+                answered.add(id(request))
+                request.future.set_result(response.json())
+            return callback
+
+        def on_failure(request):
+            def callback(response):
+                answered.add(id(request))
+                headers = _header_dict(response.headers())
+                get_throttler().observe(headers)
+                error = FacebookRequestError(
+                    'Batch sub-request failed',
+                    request_context={'method': request.method, 'relative_url': request.relative_url},
+                    http_status=response.status(),
+                    http_headers=headers,
+                    body=response.body(),
+                )
+                self._retry_or_fail(request, error, retry)
+            return callback
+
+        for request in chunk:
+            request.attempts += 1
+            request.error = None
+            batch.add(request.method, request.relative_url, params=request.params,
+                      success=on_success(request), failure=on_failure(request))
+
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole HTTP call failed (after ThrottledFacebookAdsApi's own retries)
+            for request in chunk:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return []
+        finally:
+            self.http_calls += 1
+            get_metrics().add('api_batch_requests', len(chunk))
+
+        for request in chunk:
+            if id(request) not in answered:
+                # No response: Graph API timed the sub-request out
+                self._retry_or_fail(request, None, retry)
+        return retry
+
+    def _retry_or_fail(self, request: _SubRequest, error: Optional[FacebookRequestError], retry: List[_SubRequest]):
+        retryable = error is None or error.api_error_code() in RETRYABLE_ERROR_CODES
+        if retryable and request.attempts <= self.max_retries:
+            request.error = error if error is not None and error.api_error_code() in THROTTLE_ERROR_CODES else None
+            retry.append(request)
+        elif error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_exception(TimeoutError(f"No batch response for {request.relative_url}"))
+
+
+def fetch_first_pages(calls: List[Tuple[str, Dict[str, Any]]], api=None,
+                      page_metric: str = None) -> List[Union[Dict[str, Any], Exception]]:
+    """GET every (path, params) in batch calls, without following cursors.
+
+    Returns the response body of every call in the same order (its `data` and
+    `paging`), or the exception it failed with.
+    """
+    metrics = get_metrics()
+    batch = GraphBatch(api)
+    futures = [batch.get(path, _query_params(params)) for path, params in calls]
+    batch.execute()
+    bodies: List[Union[Dict[str, Any], Exception]] = []
+    for future in futures:
+        try:
+            bodies.append(future.result())
+        except Exception as e:
+            bodies.append(e)
+            continue
+        if page_metric:
+            metrics.add(page_metric, 1)
+    return bodies
+
+
+def fetch_all_pages(calls: List[Tuple[str, Dict[str, Any]]], api=None,
+                    page_metric: str = None) -> List[Union[List[Dict[str, Any]], Exception]]:
+    """GET every (path, params) and follow its cursor; the next pages of all calls share the next batch.
+
+    Returns the `data` rows of every call in the same order, or the exception it failed with.
+    Everything is kept in memory: meant for small edges (ids, names), not insights.
+    """
+    results: List[Union[List[Dict[str, Any]], Exception]] = [[] for _ in calls]
+    pending = [(index, path, _query_params(params)) for index, (path, params) in enumerate(calls)]
+    while pending:
+        bodies = fetch_first_pages([(path, params) for _, path, params in pending], api, page_metric)
+        next_pending = []
+        for (index, path, params), body in zip(pending, bodies):
+            if isinstance(body, Exception):
+                results[index] = body
+                continue
+            results[index].extend(body.get('data', []))
+            after = next_cursor(body)
+            if after:
+                next_pending.append((index, path, dict(params, after=after)))
+        pending = next_pending
+    return results
+
+
+def next_cursor(body: Dict[str, Any]) -> Optional[str]:
+    """`after` cursor of the next page, None on the last page"""
+    paging = body.get('paging') or {}
+    if not paging.get('next'):
+        return None
+    return paging['cursors']['after']
+
+
+def _query_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    params = dict(params or {})
+    if isinstance(params.get('fields'), list):
+        params['fields'] = ','.join(params['fields'])
+    return params
+
+
+def _header_dict(headers) -> Dict[str, str]:
+    """Batch sub-responses carry headers as [{'name': ..., 'value': ...}]"""
+    if isinstance(headers, dict):
+        return headers
+    if isinstance(headers, str):
+        headers = json.loads(headers)
+    return {header['name']: header['value'] for header in headers or []}
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Insight Field Registry - single source of truth for every stored metric
+
+Each FieldSpec describes one table column: where its value comes from in the
+Graph API insight row, how it is converted, its SQL type and its Excel label.
+The parser, the table definition, the loader and the Excel exporter are all
+built from INSIGHT_FIELDS, so adding a metric is one new entry here.
+"""
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+from sqlalchemy import BigInteger, Date, Float, String
+
+# Where a field's value is read from
+FIELD = 'field'                      # top-level insight field
+ACTION = 'actions'                   # 'actions' list, matched on action_type
+ACTION_VALUE = 'action_values'       # 'action_values' list
+COST_PER_ACTION = 'cost_per_action_type'
+
+ACTION_SOURCES = (ACTION, ACTION_VALUE, COST_PER_ACTION)
+
+
+def _to_int(value) -> int:
+    return int(float(value))
+
+
+class FieldSpec(NamedTuple):
+    column: str
+    label: str
+    source: str
+    keys: Tuple[str, ...]            # API field or action types, first match wins
+    cast: Callable[[Any], Any]
+    sql_type: Any
+    default: Any = 0
+    index: bool = False
+
+
+def _field(column, label, key, cast, sql_type, default=0, index=False):
+    return FieldSpec(column, label, FIELD, (key,), cast, sql_type, default, index)
+
+
+def _action(column, label, source, keys, cast=float):
+    if isinstance(keys, str):
+        keys = (keys,)
+    return FieldSpec(column, label, source, tuple(keys), cast, BigInteger if cast is _to_int else Float)
+
+
+INSIGHT_FIELDS: List[FieldSpec] = [
+    # Account, campaign, adset and ad info
+    _field('account_id', 'Account ID', 'account_id', str, String(50), default=None),
+    _field('account_name', 'Account name', 'account_name', str, String(500), default=None),
+    _field('campaign_id', 'Campaign ID', 'campaign_id', str, String(50), default=None),
+    _field('campaign_name', 'Campaign name', 'campaign_name', str, String(500), default=None),
+    _field('adset_id', 'Adset ID', 'adset_id', str, String(50), default=None),
+    _field('adset_name', 'Adset Name', 'adset_name', str, String(500), default=None),
+    _field('ad_id', 'ADS ID', 'ad_id', str, String(50), default=None, index=True),
+    _field('ad_name', 'Ad Name', 'ad_name', str, String(500), default=None),
+    _field('day', 'Day', 'date_start', str, Date, default=None, index=True),
+
+    # Basic metrics
+    _field('amount_spent', 'Amount spent', 'spend', float, Float),
+    _field('impressions', 'Impressions', 'impressions', _to_int, BigInteger),
+    _field('reach', 'Reach', 'reach', _to_int, BigInteger),
+    _field('frequency', 'Frequency', 'frequency', float, Float),
+
+    # Click metrics
+    _field('cpc_all', 'CPC (all)', 'cpc', float, Float),
+    _field('cpc_link_click', 'CPC (cost per link click)', 'cost_per_inline_link_click', float, Float),
+    _field('ctr_all', 'CTR (all)', 'ctr', float, Float),
+    _field('ctr_link_click', 'CTR (link click-through rate)', 'inline_link_click_ctr', float, Float),
+    _field('cpm', 'CPM (cost per 1,000 impressions)', 'cpm', float, Float),
+    _field('link_clicks', 'Link clicks', 'inline_link_clicks', _to_int, BigInteger),
+    _field('clicks', 'Clicks (all)', 'clicks', _to_int, BigInteger),
+
+    # Actions, action values and cost per action
+    _action('cost_per_result', 'Cost Per Result', COST_PER_ACTION, ('omni_purchase', 'purchase')),
+    _action('landing_page_views', 'Landing page views', ACTION, 'landing_page_view', _to_int),
+    _action('cost_per_landing_page_view', 'Cost per landing page view', COST_PER_ACTION, 'landing_page_view'),
+    _action('leads', 'Leads', ACTION, 'lead', _to_int),
+    _action('leads_conversion_value', 'Leads Conversion Value', ACTION_VALUE, 'lead'),
+    _action('messaging_conversations_started', 'Messaging conversations started', ACTION,
+            'onsite_conversion.messaging_conversation_started_7d', _to_int),
+    _action('adds_to_cart', 'Adds to cart', ACTION, 'omni_add_to_cart', _to_int),
+    _action('website_adds_to_cart', 'Website adds to cart', ACTION, 'add_to_cart', _to_int),
+    _action('adds_to_cart_conversion_value', 'Adds to cart conversion value', ACTION_VALUE, 'omni_add_to_cart'),
+    _action('checkouts_initiated', 'Checkouts Initiated', ACTION, 'omni_initiated_checkout', _to_int),
+    _action('checkouts_initiated_conversion_value', 'Checkouts initiated conversion value', ACTION_VALUE,
+            'omni_initiated_checkout'),
+    _action('purchases', 'Purchases', ACTION, 'omni_purchase', _to_int),
+    _action('website_purchases', 'Website purchases', ACTION, 'purchase', _to_int),
+    _action('purchases_conversion_value', 'Purchases conversion value', ACTION_VALUE, 'omni_purchase'),
+    _action('website_purchases_conversion_value', 'Website purchases conversion value', ACTION_VALUE, 'purchase'),
+    _action('post_comments', 'Post comments', ACTION, ('post_comment', 'comment'), _to_int),
+]
+
+FIELDS_BY_COLUMN: Dict[str, FieldSpec] = {spec.column: spec for spec in INSIGHT_FIELDS}
+
+# Column order of the Excel export
+EXCEL_COLUMN_ORDER = [
+    'ad_id', 'day', 'campaign_name', 'amount_spent', 'cpc_all',
+    'cpc_link_click', 'ctr_all', 'cpm',
+    'post_comments', 'link_clicks', 'messaging_conversations_started',
+    'landing_page_views', 'cost_per_landing_page_view', 'website_adds_to_cart',
+    'checkouts_initiated', 'website_purchases_conversion_value', 'impressions',
+    'website_purchases', 'leads', 'leads_conversion_value', 'reach',
+    'purchases_conversion_value', 'cost_per_result', 'purchases',
+    'adds_to_cart_conversion_value', 'checkouts_initiated_conversion_value',
+    'adds_to_cart', 'frequency', 'ctr_link_click',
+    'account_id', 'account_name', 'adset_name', 'ad_name',
+]
+
+
+def api_fields(specs: Iterable[FieldSpec] = None, exclude: Iterable[str] = ()) -> List[str]:
+    """Graph API fields needed to fill the given specs, except the `exclude` columns"""
+    fields = []
+    exclude = set(exclude)
+    for spec in specs or INSIGHT_FIELDS:
+        if spec.column in exclude:
+            continue
+        names = spec.keys if spec.source == FIELD else (spec.source,)
+        for name in names:
+            if name not in fields:
+                fields.append(name)
+    return fields
+
+
+def excel_labels() -> Dict[str, str]:
+    return {spec.column: spec.label for spec in INSIGHT_FIELDS}
+
+
+class InsightParser:
+    """Extraction spec compiled once from the registry.
+
+    The specs are turned into the source of a single straight-line parse
+    function: one lookup per top-level field and one pass over each action
+    list, with no temporary per-type dicts of converted values.
+    """
+
+    def __init__(self, specs: Iterable[FieldSpec] = None):
+        self.specs = list(specs or INSIGHT_FIELDS)
+        self.columns = [spec.column for spec in self.specs]
+        self.source = self._generate_source()
+        namespace = {'cast_' + spec.column: spec.cast for spec in self.specs}
+        namespace.update({'wanted_' + source: frozenset(keys) for source, keys in self._wanted_types().items()})
+        exec(compile(self.source, '<insight_parser>', 'exec'), namespace)
+        # parse(data): one raw insight row -> record keyed by column name
+        self.parse: Callable[[Dict[str, Any]], Dict[str, Any]] = namespace['parse']
+
+    def _wanted_types(self) -> Dict[str, List[str]]:
+        wanted = {}
+        for spec in self.specs:
+            if spec.source in ACTION_SOURCES:
+                wanted.setdefault(spec.source, []).extend(spec.keys)
+        return wanted
+
+    def _generate_source(self) -> str:
+        lines = ['def parse(data):', '    get = data.get']
+        for source in self._wanted_types():
+            lines += [
+                f'    found_{source} = {{}}',
+                f'    for entry in get({source!r}) or ():',
+                f'        action_type = entry.get("action_type")',
+                f'        if action_type in wanted_{source}:',
+                f'            found_{source}[action_type] = entry.get("value", 0)',
+            ]
+        lines.append('    return {')
+        for spec in self.specs:
+            cast = None if spec.cast is str else 'cast_' + spec.column
+            if spec.source == FIELD:
+                value = f'get({spec.keys[0]!r})'
+                converted = f'{cast}(value)' if cast else 'value'
+                # A missing metric is its cast default (0.0 for floats), as float(data.get(key, 0)) gave
+                missing = spec.default if spec.default is None else spec.cast(spec.default)
+                lines.append(
+                    f'        {spec.column!r}: {missing!r} if (value := {value}) is None else {converted},'
+                )
+            else:
+                # Nested conditional: first action type present wins
+                expr = repr(spec.default)
+                for key in reversed(spec.keys):
+                    expr = (f'{cast}(found_{spec.source}[{key!r}]) '
+                            f'if {key!r} in found_{spec.source} else {expr}')
+                lines.append(f'        {spec.column!r}: {expr},')
+        lines.append('    }')
+        return '\n'.join(lines) + '\n'
+
+    def parse_columns(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """Parse a whole page into columns: {column: [value per row]}"""
+        columns = {column: [] for column in self.columns}
+        appenders = [(column, columns[column].append) for column in self.columns]
+        for row in rows:
+            record = self.parse(row)
+            for column, append in appenders:
+                append(record[column])
+        return columns
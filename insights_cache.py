@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Insights Cache - on-disk cache of raw insights rows per account and day
+
+Rows of a fetch in progress are appended page by page to a staging table
+and only become a cache entry once their day is complete (commit_day), so
+neither side holds a whole date range in memory.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Staged rows older than this belong to a fetch that never finished
+STAGING_MAX_AGE = 24 * 3600
+
+
+def fields_hash(fields: List[str]) -> str:
+    """Stable short hash of the requested field list (cache entries are per field set)"""
+    return hashlib.sha1(','.join(sorted(fields)).encode('utf-8')).hexdigest()[:16]
+
+
+class InsightsCache:
+    """SQLite-backed cache of compressed raw insights rows, keyed by (account, day, level, fields)"""
+
+    def __init__(self, cache_dir: Path = None, max_bytes: int = None):
+        self.cache_dir = Path(cache_dir or Config.CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / 'insights_cache.sqlite'
+        self.max_bytes = max_bytes or Config.CACHE_MAX_MB * 1024 * 1024
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS insights_pages ('
+                ' account_id TEXT NOT NULL, day TEXT NOT NULL, level TEXT NOT NULL,'
+                ' fields_hash TEXT NOT NULL, payload BLOB NOT NULL, size INTEGER NOT NULL,'
+                ' fetched_at REAL NOT NULL, last_access REAL NOT NULL,'
+                ' PRIMARY KEY (account_id, day, level, fields_hash))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS insights_staging ('
+                ' run_id TEXT NOT NULL, account_id TEXT NOT NULL, day TEXT NOT NULL, level TEXT NOT NULL,'
+                ' fields_hash TEXT NOT NULL, payload BLOB NOT NULL, staged_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_insights_staging_run ON insights_staging (run_id, day)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def ttl_for_day(self, day: date, today: date = None) -> float:
+        """Seconds a cached day stays valid: days inside the attribution window are volatile"""
+        age_days = ((today or date.today()) - day).days
+        if age_days <= Config.ATTRIBUTION_LOOKBACK_DAYS:
+            return Config.CACHE_VOLATILE_TTL
+        return Config.CACHE_CLOSED_TTL
+
+    def get(self, account_id: str, day: date, level: str, fields: List[str]) -> Optional[List[Dict[str, Any]]]:
+        """Cached raw rows for a day, or None when missing or expired"""
+        key = (account_id, day.isoformat(), level, fields_hash(fields))
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                'SELECT payload, fetched_at FROM insights_pages '
+                'WHERE account_id = ? AND day = ? AND level = ? AND fields_hash = ?', key
+            ).fetchone()
+            if row is None:
+                return None
+            payload, fetched_at = row
+            if time.time() - fetched_at > self.ttl_for_day(day):
+                return None
+            conn.execute(
+                'UPDATE insights_pages SET last_access = ? '
+                'WHERE account_id = ? AND day = ? AND level = ? AND fields_hash = ?', (time.time(),) + key
+            )
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, account_id: str, day: date, level: str, fields: List[str], rows: List[Dict[str, Any]]):
+        """Store the raw rows of one day (an empty list is cached too)"""
+        payload = _compress(rows)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO insights_pages '
+                '(account_id, day, level, fields_hash, payload, size, fetched_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (account_id, day.isoformat(), level, fields_hash(fields), payload, len(payload), now, now)
+            )
+
+    def append(self, run_id: str, account_id: str, day: date, level: str, fields: List[str],
+               rows: List[Dict[str, Any]]):
+        """Stage part of a day's raw rows; they are not served until commit_day"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT INTO insights_staging (run_id, account_id, day, level, fields_hash, payload, staged_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (run_id, account_id, day.isoformat(), level, fields_hash(fields), _compress(rows), time.time())
+            )
+
+    def commit_day(self, run_id: str, account_id: str, day: date, level: str, fields: List[str]):
+        """Turn the rows staged for a complete day into its cache entry (no rows = an empty day)"""
+        key = (run_id, account_id, day.isoformat(), level, fields_hash(fields))
+        where = 'WHERE run_id = ? AND account_id = ? AND day = ? AND level = ? AND fields_hash = ?'
+        with closing(self._connect()) as conn, conn:
+            rows = []
+            for (payload,) in conn.execute(f'SELECT payload FROM insights_staging {where} ORDER BY rowid', key):
+                rows.extend(json.loads(zlib.decompress(payload)))
+            conn.execute(f'DELETE FROM insights_staging {where}', key)
+        self.put(account_id, day, level, fields, rows)
+
+    def discard(self, run_id: str):
+        """Drop whatever is still staged for a run (days that never completed)"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM insights_staging WHERE run_id = ?', (run_id,))
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        removed = 0
+        with closing(self._connect()) as conn, conn:
+            # Left behind by processes killed mid-fetch
+            conn.execute('DELETE FROM insights_staging WHERE staged_at < ?', (time.time() - STAGING_MAX_AGE,))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM insights_pages').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            rows = conn.execute(
+                'SELECT account_id, day, level, fields_hash, size FROM insights_pages ORDER BY last_access'
+            ).fetchall()
+            for account_id, day, level, fh, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute(
+                    'DELETE FROM insights_pages WHERE account_id = ? AND day = ? AND level = ? AND fields_hash = ?',
+                    (account_id, day, level, fh)
+                )
+                total -= size
+                removed += 1
+        logger.info(f"Evicted {removed} cached insights days")
+        return removed
+
+
+def _compress(rows: List[Dict[str, Any]]) -> bytes:
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'))
@@ -4,11 +4,19 @@ Main Pipeline Module - Multi Account Support
 """
 import logging
 import time
-from datetime import datetime, timedelta
-import schedule
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List
 from facebook_ads_client import FacebookAdsClient
 from database import DatabaseManager, setup_all_tables
 from excel_exporter import ExcelExporter
+from columnar_exporter import ColumnarExporter
+from rollups import RollupManager
+from streaming import prefetch
+from metrics import get_metrics, trace_span
+from resources import get_api
+from profiling import enable_profiling, profile_stage
 from config import Config
 
 logging.basicConfig(
@@ -18,85 +26,235 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_pipeline_for_account(account: dict, days_back: int = 7):
-    """Run pipeline for a single account"""
+def run_pipeline_for_account(account: dict, days_back: int = 7, start_date: date = None,
+                             end_date: date = None, finish: bool = True) -> Dict[str, Any]:
+    """Run pipeline for a single account, return a summary of what was done
+    
+    An explicit start_date (scheduled runs, queued windows) upserts exactly
+    start_date..end_date (default today), without the incremental lookback and
+    without clearing the table in full mode. With finish=False (queued backfill
+    windows) only the load runs; retention, rollups and exports are left to the
+    account's finalize job.
+    """
     account_id = account['id']
     account_name = account['name']
     table_name = account['table_name']
     excel_filename = account['excel_filename']
     
     logger.info(f"Processing account: {account_name} ({account_id})")
+    summary = {'account': account_name, 'fetched': 0, 'inserted': 0, 'exported': 0}
+    metrics = get_metrics()
     
     try:
-        # 1. Fetch data from Facebook Ads
-        logger.info(f"  Step 1: Fetching data from Facebook Ads API...")
-        fb_client = FacebookAdsClient(ad_account_id=account_id)
-        
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=days_back)
-        
-        ads_data = fb_client.get_ads_data(
-            start_date=start_date.strftime('%Y-%m-%d'),
-            end_date=end_date.strftime('%Y-%m-%d')
-        )
-        
-        logger.info(f"  Fetched {len(ads_data)} records")
-        
-        if not ads_data:
-            logger.warning(f"  No data fetched for {account_name}")
-            return
-        
-        # 2. Save to PostgreSQL (clear old data first)
-        logger.info(f"  Step 2: Saving data to PostgreSQL table: {table_name}...")
-        db_manager = DatabaseManager(table_name=table_name)
-        db_manager.create_table()
-        
-        # Clear old data before inserting new
-        logger.info(f"  Clearing old data from {table_name}...")
-        db_manager.clear_all_data()
-        
-        inserted_count = db_manager.insert_data(ads_data)
-        logger.info(f"  Inserted {inserted_count} records")
-        
-        # 3. Export to Excel (old file auto deleted)
-        logger.info(f"  Step 3: Exporting to Excel: {excel_filename}...")
-        exporter = ExcelExporter(filename=excel_filename)
-        
-        all_data = db_manager.get_all_data()
-        excel_path = exporter.export_to_excel(all_data)
-        logger.info(f"  Exported {len(all_data)} records to {excel_path}")
-        
-        logger.info(f"  Account {account_name} completed successfully!")
+        with DatabaseManager(table_name=table_name) as db_manager:
+            db_manager.create_table()
+            incremental = Config.SYNC_MODE == 'incremental' or start_date is not None
+            
+            end_date = end_date or datetime.now().date()
+            if start_date is None:
+                start_date = end_date - timedelta(days=days_back)
+                if incremental:
+                    start_date = get_incremental_start_date(db_manager, end_date, start_date)
+            
+            fb_client = FacebookAdsClient(ad_account_id=account_id)
+            date_range = {
+                'start_date': start_date.strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d'),
+            }
+            
+            if Config.STREAMING:
+                # 1+2. Stream API pages into PostgreSQL, fetching page N+1 while page N is written
+                logger.info(f"  Steps 1-2: Streaming data from Facebook Ads API into {table_name}...")
+                pages = _count_fetched(fb_client.iter_ads_data(**date_range), summary)
+                # Partitioned tables clear the re-synced window instead of updating rows in place
+                replace_range = (start_date, end_date) if incremental and db_manager.partitions else None
+                with _stage(account_name, 'fetch_load'):
+                    inserted_count = db_manager.load_stream(
+                        prefetch(pages, Config.STREAM_PREFETCH_PAGES),
+                        upsert=incremental,
+                        replace=not incremental,
+                        replace_range=replace_range,
+                        date_range=(start_date, end_date)
+                    )
+                metrics.add_rows(account_name, 'fetch', summary['fetched'])
+                logger.info(f"  Fetched {summary['fetched']} records, saved {inserted_count}")
+                
+                if not summary['fetched']:
+                    logger.warning(f"  No data fetched for {account_name}")
+                    return summary
+            else:
+                # 1. Fetch data from Facebook Ads
+                logger.info(f"  Step 1: Fetching data from Facebook Ads API...")
+                with _stage(account_name, 'fetch'):
+                    ads_data = fb_client.get_ads_data(**date_range)
+                
+                logger.info(f"  Fetched {len(ads_data)} records")
+                summary['fetched'] = len(ads_data)
+                metrics.add_rows(account_name, 'fetch', len(ads_data))
+                
+                if not ads_data:
+                    logger.warning(f"  No data fetched for {account_name}")
+                    return summary
+                
+                # 2. Save to PostgreSQL
+                logger.info(f"  Step 2: Saving data to PostgreSQL table: {table_name}...")
+                with _stage(account_name, 'load'):
+                    if incremental:
+                        replace_range = (start_date, end_date) if db_manager.partitions else None
+                        inserted_count = db_manager.upsert_data(ads_data, replace_range=replace_range)
+                        logger.info(f"  Upserted {inserted_count} records")
+                    else:
+                        # Clear old data before inserting new
+                        logger.info(f"  Clearing old data from {table_name}...")
+                        db_manager.clear_all_data()
+                        inserted_count = db_manager.insert_data(ads_data)
+                        logger.info(f"  Inserted {inserted_count} records")
+            summary['inserted'] = inserted_count
+            metrics.add_rows(account_name, 'load', inserted_count)
+            metrics.add_bytes(account_name, 'database', db_manager.bytes_loaded)
+            
+            if not finish:
+                logger.info(f"  Window {start_date} -> {end_date} of {account_name} loaded")
+                return summary
+            
+            if Config.RETENTION_DAYS:
+                with _stage(account_name, 'retention'):
+                    db_manager.prune_old_data(Config.RETENTION_DAYS)
+            
+            if Config.ROLLUPS_ENABLED:
+                # Only the re-synced days change; a full sync rebuilds every day
+                logger.info(f"  Step 2b: Refreshing campaign/adset daily rollups...")
+                with _stage(account_name, 'rollups'):
+                    rollups = RollupManager(table_name, db_manager.session, db_manager.dimensions)
+                    rollups.create_tables()
+                    if Config.RETENTION_DAYS:
+                        # Same cutoff as the raw rows pruned above
+                        rollups.prune(date.today() - timedelta(days=Config.RETENTION_DAYS))
+                    synced_days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+                    rollups.refresh(synced_days if incremental else None)
+            
+            # 3. Export to Excel (skipped when unchanged, replaced atomically)
+            logger.info(f"  Step 3: Exporting to Excel: {excel_filename}...")
+            exporter = ExcelExporter(filename=excel_filename)
+            
+            with _stage(account_name, 'export_excel'):
+                excel_path = exporter.export_if_changed(db_manager)
+            if excel_path:
+                logger.info(f"  Exported {exporter.last_row_count} records to {excel_path}")
+                if excel_path.exists():
+                    metrics.add_bytes(account_name, 'excel', excel_path.stat().st_size)
+            summary['exported'] = exporter.last_row_count
+            metrics.add_rows(account_name, 'export_excel', exporter.last_row_count)
+            
+            if Config.COLUMNAR_FORMATS:
+                logger.info(f"  Step 4: Writing columnar export ({', '.join(Config.COLUMNAR_FORMATS)})...")
+                columnar = ColumnarExporter(account_id=account_id)
+                with _stage(account_name, 'export_columnar'):
+                    columnar.export_changed(db_manager)
+                metrics.add_bytes(account_name, 'columnar', columnar.bytes_written)
+            
+            logger.info(f"  Account {account_name} completed successfully!")
+            return summary
         
     except Exception as e:
         logger.error(f"  Error processing {account_name}: {e}")
         raise
 
 
-def run_pipeline(days_back: int = 7):
-    """Run pipeline for all accounts"""
+@contextmanager
+def _stage(account_name: str, stage: str):
+    """Time a stage in the run metrics, and profile it when --profile is on"""
+    with get_metrics().stage(account_name, stage), profile_stage(account_name, stage):
+        yield
+
+
+def _count_fetched(pages: Iterator[List[Dict[str, Any]]], summary: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    for page in pages:
+        summary['fetched'] += len(page)
+        yield page
+
+
+def get_incremental_start_date(db_manager: DatabaseManager, end_date: date, default_start: date) -> date:
+    """First day to re-sync: the attribution lookback, or the last stored day when the table is further behind
+    
+    The requested window (default_start) only applies to an empty table; days
+    older than the lookback are left alone once they are stored.
+    """
+    latest_day = db_manager.get_latest_day()
+    if latest_day is None:
+        logger.info(f"  Table {db_manager.table_name} is empty, syncing full window from {default_start}")
+        return default_start
+    
+    start_date = min(end_date - timedelta(days=Config.ATTRIBUTION_LOOKBACK_DAYS), latest_day)
+    logger.info(f"  Incremental sync from {start_date} (latest stored day: {latest_day})")
+    return start_date
+
+
+def run_pipeline(days_back: int = 7, max_workers: int = None) -> List[Dict[str, Any]]:
+    """Run pipeline for all accounts concurrently"""
     logger.info("=" * 60)
     logger.info("STARTING FACEBOOK ADS DATA PIPELINE (MULTI-ACCOUNT)")
     logger.info("=" * 60)
     
     if not Config.AD_ACCOUNTS:
         logger.error("No ad accounts configured!")
-        return
+        return []
     
-    logger.info(f"Found {len(Config.AD_ACCOUNTS)} ad accounts to process")
+    max_workers = max(1, min(max_workers or Config.PIPELINE_WORKERS, len(Config.AD_ACCOUNTS)))
+    logger.info(f"Found {len(Config.AD_ACCOUNTS)} ad accounts to process ({max_workers} workers)")
     
-    for i, account in enumerate(Config.AD_ACCOUNTS, 1):
-        logger.info("-" * 40)
-        logger.info(f"Account {i}/{len(Config.AD_ACCOUNTS)}")
-        try:
-            run_pipeline_for_account(account, days_back)
-        except Exception as e:
-            logger.error(f"Failed to process account: {e}")
-            continue
+    # Initialize the shared Graph API before the account threads start
+    get_api()
+    metrics = get_metrics()
+    metrics.reset()
+    with trace_span('pipeline_run', accounts=len(Config.AD_ACCOUNTS)):
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='account') as executor:
+            results = list(executor.map(
+                lambda account: _run_account_isolated(account, days_back),
+                Config.AD_ACCOUNTS
+            ))
+    metrics.finish()
+    metrics.write_outputs()
+    
+    _log_run_summary(results)
     
     logger.info("=" * 60)
     logger.info("PIPELINE COMPLETED")
     logger.info("=" * 60)
+    return results
+
+
+def _run_account_isolated(account: dict, days_back: int, start_date: date = None,
+                          end_date: date = None, finish: bool = True) -> Dict[str, Any]:
+    """Run one account and capture its outcome instead of propagating failures"""
+    metrics = get_metrics()
+    started = time.monotonic()
+    try:
+        with metrics.stage(account['name'], 'total'):
+            summary = run_pipeline_for_account(account, days_back, start_date, end_date, finish)
+        summary['status'] = 'ok'
+    except Exception as e:
+        logger.error(f"Failed to process account {account['name']}: {e}")
+        summary = {'account': account['name'], 'status': 'failed', 'error': str(e)}
+    summary['duration'] = time.monotonic() - started
+    metrics.set('account_success', 1 if summary['status'] == 'ok' else 0, account=account['name'])
+    return summary
+
+
+def _log_run_summary(results: List[Dict[str, Any]]):
+    logger.info("-" * 40)
+    logger.info("RUN SUMMARY")
+    for r in results:
+        if r['status'] == 'ok':
+            logger.info(
+                f"  {r['account']}: OK - fetched {r.get('fetched', 0)}, "
+                f"inserted {r.get('inserted', 0)}, exported {r.get('exported', 0)} "
+                f"({r['duration']:.1f}s)"
+            )
+        else:
+            logger.error(f"  {r['account']}: FAILED - {r['error']} ({r['duration']:.1f}s)")
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    logger.info(f"  {len(results) - failed} succeeded, {failed} failed")
 
 
 def run_daily_job():
@@ -105,18 +263,22 @@ def run_daily_job():
     run_pipeline(days_back=Config.DEFAULT_DAYS_BACK)
 
 
-def schedule_daily_run():
-    """Schedule daily run"""
-    run_time = Config.DAILY_RUN_TIME
-    logger.info(f"Scheduling daily run at {run_time}")
-    
-    schedule.every().day.at(run_time).do(run_daily_job)
+def schedule_daily_run(max_workers: int = None):
+    """Run every account on its cadences (see scheduler.py) until interrupted"""
+    from scheduler import SyncScheduler
     
-    logger.info("Scheduler started. Press Ctrl+C to stop.")
+    if not Config.AD_ACCOUNTS:
+        logger.error("No ad accounts configured!")
+        return
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    scheduler = SyncScheduler(
+        run_account=lambda account, start_date: _run_account_isolated(account, Config.DEFAULT_DAYS_BACK, start_date),
+        max_workers=max_workers
+    )
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Scheduler interrupted")
 
 
 if __name__ == "__main__":
@@ -124,22 +286,69 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description='Facebook Ads Data Pipeline (Multi-Account)')
     parser.add_argument('--run-now', action='store_true', help='Run pipeline immediately')
-    parser.add_argument('--schedule', action='store_true', help='Run scheduler for daily execution')
-    parser.add_argument('--days', type=int, default=7, help='Number of days to fetch (default: 7)')
+    parser.add_argument('--schedule', action='store_true',
+                        help='Run the scheduler (per-account cadences, catch-up of missed runs)')
+    parser.add_argument('--days', type=int, default=7, help='Number of days to fetch (default: 7; incremental mode: only into an empty table)')
     parser.add_argument('--setup', action='store_true', help='Setup database tables only')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Load history --since/--until in resumable, checkpointed windows')
+    parser.add_argument('--since', type=date.fromisoformat, default=None, metavar='YYYY-MM-DD',
+                        help='First day of the backfill')
+    parser.add_argument('--until', type=date.fromisoformat, default=None, metavar='YYYY-MM-DD',
+                        help='Last day of the backfill (default: today)')
+    parser.add_argument('--window-days', type=int, default=None,
+                        help='Days per backfill window (default: BACKFILL_WINDOW_DAYS)')
+    parser.add_argument('--enqueue', action='store_true',
+                        help='Queue a sync job per account (or backfill windows with --since) for --worker')
+    parser.add_argument('--worker', action='store_true', help='Run queued jobs (any number of hosts)')
+    parser.add_argument('--drain', action='store_true', help='With --worker: exit once no job is ready')
+    parser.add_argument('--sync-mode', choices=['incremental', 'full'], default=None,
+                        help='Override SYNC_MODE (incremental upsert or full rewrite)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of accounts (or backfill windows, worker threads) processed in parallel')
+    parser.add_argument('--profile', nargs='?', const=str(Config.PROFILE_DIR), default=None, metavar='DIR',
+                        help='Profile every stage (cProfile, tracemalloc, collapsed stacks) into DIR')
     
     args = parser.parse_args()
+    if args.sync_mode:
+        Config.SYNC_MODE = args.sync_mode
+    if args.profile:
+        enable_profiling(args.profile)
+        # Samples and allocations are process-wide, so accounts run one at a time
+        args.workers = 1
     
     if args.setup:
         setup_all_tables()
+    elif args.backfill:
+        if not args.since:
+            parser.error('--backfill requires --since')
+        from backfill import Backfill, log_backfill_summary
+        log_backfill_summary(Backfill(
+            since=args.since, until=args.until, window_days=args.window_days,
+            max_workers=args.workers
+        ).run())
+    elif args.enqueue:
+        from work_queue import enqueue_accounts
+        enqueue_accounts(since=args.since, until=args.until, window_days=args.window_days)
+    elif args.worker:
+        from work_queue import QueueWorker
+        QueueWorker(
+            run_account=lambda account, start_date, end_date, finish: _run_account_isolated(
+                account, Config.DEFAULT_DAYS_BACK, start_date, end_date, finish),
+            concurrency=args.workers,
+            drain=args.drain
+        ).run()
     elif args.run_now:
-        run_pipeline(days_back=args.days)
+        run_pipeline(days_back=args.days, max_workers=args.workers)
     elif args.schedule:
-        run_daily_job()
-        schedule_daily_run()
+        # Missed and never-run cadences are due immediately, so no separate first run is needed
+        schedule_daily_run(max_workers=args.workers)
     else:
         print("Usage:")
         print("  python main.py --setup            # Setup database tables")
         print("  python main.py --run-now          # Run pipeline immediately")
         print("  python main.py --run-now --days 30    # Run with 30 days of data")
-        print("  python main.py --schedule         # Run scheduler for daily execution")
+        print("  python main.py --backfill --since 2025-01-01  # Resumable historical backfill")
+        print("  python main.py --enqueue && python main.py --worker  # Distributed workers")
+        print("  python main.py --schedule         # Run scheduler (hourly today + daily lookback)")
+        print("  python main.py --run-now --profile    # Profile each stage into ./profiles")
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Run Metrics - per account/stage timings, API call stats, rows and bytes for each pipeline run
+
+Outputs a Prometheus textfile (node_exporter textfile collector) or a
+Pushgateway push, a JSON run report, and OpenTelemetry spans when the
+opentelemetry package is installed and OTEL_TRACING is on.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+import requests
+from config import Config
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional dependency, spans are skipped without it
+    trace = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'fb_pipeline_'
+
+# name -> help text; every value is a gauge describing the last run
+METRIC_HELP = {
+    'run_duration_seconds': 'Wall time of the last pipeline run',
+    'run_timestamp_seconds': 'Unix time the last pipeline run finished',
+    'account_success': '1 if the account finished without error in the last run',
+    'stage_duration_seconds': 'Time spent per account and stage in the last run',
+    'rows': 'Rows handled per account and stage in the last run',
+    'bytes_written': 'Bytes written per account and target in the last run',
+    'api_calls': 'Graph API HTTP calls in the last run, by outcome',
+    'api_call_duration_seconds_sum': 'Total Graph API call latency in the last run',
+    'api_call_duration_seconds_count': 'Graph API calls timed in the last run',
+    'api_call_duration_seconds_max': 'Slowest Graph API call in the last run',
+    'api_pages': 'Insights result pages read in the last run',
+    'api_batch_requests': 'Sub-requests sent inside Graph API batch calls in the last run',
+    'throttle_wait_seconds': 'Time spent waiting on the Graph API throttler in the last run',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class RunMetrics:
+    """Thread-safe registry of labelled values for one pipeline run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.values: Dict[Tuple[str, Labels], float] = {}
+            self.started_at = time.time()
+            self.finished_at = None
+
+    def _key(self, name: str, labels: Dict[str, Any]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def add(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.values[self._key(name, labels)] = value
+
+    def max(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.values[key] = max(self.values.get(key, 0), value)
+
+    def get(self, name: str, **labels) -> float:
+        return self.values.get(self._key(name, labels), 0)
+
+    @contextmanager
+    def stage(self, account: str, stage: str) -> Iterator[None]:
+        """Time a pipeline stage of one account (and trace it as a span when tracing is on)"""
+        started = time.perf_counter()
+        with _span(stage, account=account, stage=stage):
+            try:
+                yield
+            finally:
+                self.add('stage_duration_seconds', time.perf_counter() - started, account=account, stage=stage)
+
+    def observe_api_call(self, seconds: float, outcome: str):
+        self.add('api_calls', 1, outcome=outcome)
+        self.add('api_call_duration_seconds_sum', seconds)
+        self.add('api_call_duration_seconds_count', 1)
+        self.max('api_call_duration_seconds_max', seconds)
+
+    def observe_throttle_wait(self, seconds: float, reason: str):
+        if seconds > 0:
+            self.add('throttle_wait_seconds', seconds, reason=reason)
+
+    def add_rows(self, account: str, stage: str, count: int):
+        self.add('rows', count, account=account, stage=stage)
+
+    def add_bytes(self, account: str, target: str, count: int):
+        self.add('bytes_written', count, account=account, target=target)
+
+    def finish(self):
+        self.finished_at = time.time()
+        self.set('run_duration_seconds', self.finished_at - self.started_at)
+        self.set('run_timestamp_seconds', self.finished_at)
+
+    # Output
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        by_name: Dict[str, list] = {}
+        with self._lock:
+            for (name, labels), value in sorted(self.values.items()):
+                by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, samples in by_name.items():
+            metric = METRIC_PREFIX + name
+            lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+                value = _format(value)
+                lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def to_report(self) -> Dict[str, Any]:
+        """Nested JSON-friendly view: run totals, per-account stages/rows/bytes, API stats"""
+        report = {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+            'finished_at': datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            'duration_seconds': round(self.get('run_duration_seconds'), 3),
+            'accounts': {},
+            'api': {
+                'calls': {},
+                'latency_seconds_total': round(self.get('api_call_duration_seconds_sum'), 3),
+                'latency_seconds_max': round(self.get('api_call_duration_seconds_max'), 3),
+                'pages': int(self.get('api_pages')),
+                'batched_requests': int(self.get('api_batch_requests')),
+                'throttle_wait_seconds': {},
+            },
+        }
+        calls = self.get('api_call_duration_seconds_count')
+        report['api']['latency_seconds_avg'] = round(self.get('api_call_duration_seconds_sum') / calls, 3) if calls else 0
+        with self._lock:
+            items = list(self.values.items())
+        for (name, labels), value in items:
+            labels = dict(labels)
+            if 'account' in labels:
+                account = report['accounts'].setdefault(
+                    labels['account'], {'success': None, 'stages': {}, 'rows': {}, 'bytes_written': {}}
+                )
+                if name == 'account_success':
+                    account['success'] = bool(value)
+                elif name == 'stage_duration_seconds':
+                    account['stages'][labels['stage']] = round(value, 3)
+                elif name == 'rows':
+                    account['rows'][labels['stage']] = int(value)
+                elif name == 'bytes_written':
+                    account['bytes_written'][labels['target']] = int(value)
+            elif name == 'api_calls':
+                report['api']['calls'][labels['outcome']] = int(value)
+            elif name == 'throttle_wait_seconds':
+                report['api']['throttle_wait_seconds'][labels['reason']] = round(value, 3)
+        return report
+
+    def write_outputs(self):
+        """Write every output enabled in Config; failures are logged, never raised"""
+        outputs = [
+            (Config.METRICS_TEXTFILE, self.write_prometheus_textfile),
+            (Config.METRICS_PUSHGATEWAY_URL, self.push_to_gateway),
+            (Config.METRICS_REPORT_DIR, self.write_json_report),
+        ]
+        for target, write in outputs:
+            if not target:
+                continue
+            try:
+                write(target)
+            except Exception as e:
+                logger.warning(f"Could not write metrics to {target}: {e}")
+
+    def write_prometheus_textfile(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The textfile collector may read at any time: write aside and rename
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.to_prometheus(), encoding='utf-8')
+        os.replace(tmp_path, path)
+        logger.info(f"Wrote Prometheus metrics to {path}")
+
+    def push_to_gateway(self, url: str):
+        target = f"{url.rstrip('/')}/metrics/job/{Config.METRICS_JOB_NAME}"
+        response = requests.put(target, data=self.to_prometheus().encode('utf-8'),
+                                headers={'Content-Type': 'text/plain; version=0.0.4'}, timeout=10)
+        response.raise_for_status()
+        logger.info(f"Pushed metrics to {target}")
+
+    def write_json_report(self, report_dir):
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.finished_at or time.time()).strftime('%Y%m%d_%H%M%S')
+        path = report_dir / f"run_{stamp}.json"
+        path.write_text(json.dumps(self.to_report(), indent=2), encoding='utf-8')
+        logger.info(f"Wrote run report to {path}")
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@contextmanager
+def _span(name: str, **attributes) -> Iterator[None]:
+    if trace is None or not Config.OTEL_TRACING:
+        yield
+        return
+    tracer = trace.get_tracer('facebook_ads_pipeline')
+    with tracer.start_as_current_span(name) as span:
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        yield
+
+
+def trace_span(name: str, **attributes):
+    """Standalone span (no timing recorded), e.g. around a whole run"""
+    return _span(name, **attributes)
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics() -> RunMetrics:
+    """Process-wide metrics of the current run"""
+    return _metrics
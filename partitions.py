@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Table Partitioning - range partitions by day or month, created on demand, pruned by retention
+"""
+import logging
+import re
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Set, Tuple, Union
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARTITION_GRANULARITIES = ('day', 'month')
+
+_BOUND_PATTERN = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+def _as_date(value: Union[str, date]) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+class PartitionManager:
+    """Partitions of one RANGE (day) partitioned account table"""
+
+    def __init__(self, table_name: str, session: Session, granularity: str = 'month'):
+        if granularity not in PARTITION_GRANULARITIES:
+            raise ValueError(f"Unknown partition granularity: {granularity}")
+        self.table_name = table_name
+        self.session = session
+        self.granularity = granularity
+        self._known: Optional[Set[str]] = None
+
+    def bounds(self, day: date) -> Tuple[date, date]:
+        """[start, end) range of the partition holding day"""
+        if self.granularity == 'day':
+            return day, day + timedelta(days=1)
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start, end
+
+    def partition_name(self, day: date) -> str:
+        start, _ = self.bounds(day)
+        suffix = start.strftime('%Y_%m_%d' if self.granularity == 'day' else '%Y_%m')
+        return f"{self.table_name}_p{suffix}"
+
+    def is_partitioned(self) -> bool:
+        return bool(self.session.execute(text(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = :name AND pg_table_is_visible(c.oid)'
+        ), {'name': self.table_name}).scalar())
+
+    def list_partitions(self) -> List[Tuple[str, date, date]]:
+        """(name, start, end) of every attached range partition, oldest first"""
+        rows = self.session.execute(text(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = CAST(:parent AS regclass)'
+        ), {'parent': f'"{self.table_name}"'})
+        partitions = []
+        for name, bound in rows:
+            match = _BOUND_PATTERN.search(bound or '')
+            if match:
+                partitions.append((name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def ensure_for_days(self, days: Iterable[Union[str, date]]) -> int:
+        """Create the partitions missing for the given days, returns how many were created.
+
+        CREATE TABLE ... PARTITION OF locks the parent table, so the DDL runs in a
+        short transaction of its own: pending work of the session is committed
+        first and the new partitions are committed right away.
+        """
+        if self._known is None:
+            self._known = {name for name, _, _ in self.list_partitions()}
+        missing = {}
+        for day in sorted({_as_date(day) for day in days if day is not None}):
+            name = self.partition_name(day)
+            if name not in self._known:
+                missing.setdefault(name, self.bounds(day))
+        if not missing:
+            return 0
+
+        self.session.commit()
+        for name, (start, end) in missing.items():
+            self.session.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{self.table_name}" '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            logger.info(f"Created partition {name} [{start}, {end})")
+        self.session.commit()
+        self._known.update(missing)
+        return len(missing)
+
+    def ensure_range(self, start_date: date, end_date: date) -> int:
+        days = []
+        day = start_date
+        while day <= end_date:
+            days.append(day)
+            day = self.bounds(day)[1]
+        return self.ensure_for_days(days)
+
+    def prune(self, retention_days: int, action: str = 'drop', today: date = None) -> List[str]:
+        """Detach (and drop, unless action='detach') partitions that end before the retention cutoff"""
+        cutoff = (today or date.today()) - timedelta(days=retention_days)
+        pruned = []
+        for name, _, end in self.list_partitions():
+            if end > cutoff:
+                break
+            self.session.execute(text(f'ALTER TABLE "{self.table_name}" DETACH PARTITION "{name}"'))
+            if action == 'drop':
+                self.session.execute(text(f'DROP TABLE "{name}"'))
+            if self._known is not None:
+                self._known.discard(name)
+            pruned.append(name)
+        self.session.commit()
+        if pruned:
+            verb = 'Dropped' if action == 'drop' else 'Detached'
+            logger.info(f"{verb} {len(pruned)} partitions of {self.table_name} older than {cutoff}")
+        return pruned
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling Mode - cProfile, tracemalloc and sampled stacks around each pipeline stage
+
+Enabled with `python main.py --run-now --profile [DIR]`. For every account it writes:
+    <account>.txt        top functions and top allocation sites per stage
+    <account>_<stage>.pstats   raw cProfile data (snakeviz, pstats)
+    <account>.collapsed  collapsed stacks for flamegraph.pl / speedscope
+"""
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List
+from config import Config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+TRACEMALLOC_FRAMES = 10
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'account'
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of every thread at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, prefix: str, interval: float):
+        self.prefix = prefix
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                stack.append(self.prefix)
+                self.counts[';'.join(reversed(stack))] += 1
+
+
+class PipelineProfiler:
+    """Profiles stages and writes one set of report files per account"""
+
+    def __init__(self, output_dir: Path, sample_interval: float = None):
+        self.output_dir = Path(output_dir) / datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.sample_interval = sample_interval or Config.PROFILE_SAMPLE_INTERVAL
+        self._lock = threading.Lock()
+        logger.info(f"Profiling enabled, reports in {self.output_dir}")
+
+    @contextmanager
+    def stage(self, account: str, stage: str) -> Iterator[None]:
+        # Stages of different accounts must not overlap: samples and allocations are process-wide
+        with self._lock:
+            thread_profiles: List[cProfile.Profile] = []
+            profile = cProfile.Profile()
+            sampler = StackSampler(f"{account.replace(';', '_')};{stage}", self.sample_interval)
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            sampler.start()
+            thread_run = threading.Thread.run
+            threading.Thread.run = self._profiled_run(thread_run, thread_profiles)
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - started
+                threading.Thread.run = thread_run
+                samples = sampler.stop()
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+                try:
+                    self._write(account, stage, elapsed, profile, thread_profiles, before, after, peak, samples)
+                except Exception as e:
+                    logger.warning(f"Could not write profile for {account}/{stage}: {e}")
+
+    @staticmethod
+    def _profiled_run(run, thread_profiles: List[cProfile.Profile]):
+        """Thread.run for threads started during the stage (fetch workers, prefetch).
+
+        Each thread disables its own profile when it ends; only finished threads
+        are added to thread_profiles, so no profile is read while still recording.
+        """
+        @functools.wraps(run)
+        def profiled_run(thread):
+            thread_profile = cProfile.Profile()
+            try:
+                thread_profile.enable()
+            except ValueError:
+                # Python 3.12+ profiles every thread from the stage profile already
+                return run(thread)
+            try:
+                return run(thread)
+            finally:
+                thread_profile.disable()
+                thread_profiles.append(thread_profile)
+        return profiled_run
+
+    def _write(self, account: str, stage: str, elapsed: float, profile: cProfile.Profile,
+               thread_profiles: List[cProfile.Profile], before, after, peak: int, samples: Counter):
+        base = self.output_dir / _safe_name(account)
+
+        stats = pstats.Stats(profile)
+        for thread_profile in thread_profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(f"{base}_{_safe_name(stage)}.pstats")
+
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        growth = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), 'lineno')
+
+        with open(f"{base}.txt", 'a', encoding='utf-8') as report:
+            report.write(f"{'=' * 78}\n{account} / {stage}: {elapsed:.3f}s wall, "
+                         f"peak traced memory {peak / 1024 / 1024:.1f} MB, "
+                         f"{len(thread_profiles)} worker threads profiled\n{'=' * 78}\n")
+            report.write(f"\nTop functions by cumulative time:\n{text.getvalue()}\n")
+            report.write("Top allocation sites (net growth during stage):\n")
+            for stat in growth[:TOP_ALLOCATIONS]:
+                report.write(f"  {stat}\n")
+            report.write("\n")
+
+        with open(f"{base}.collapsed", 'a', encoding='utf-8') as collapsed:
+            for stack, count in samples.items():
+                collapsed.write(f"{stack} {count}\n")
+
+        logger.info(f"Profiled {account}/{stage} ({elapsed:.2f}s) -> {base}.txt")
+
+
+_profiler = None
+
+
+def enable_profiling(output_dir: Path = None) -> PipelineProfiler:
+    global _profiler
+    _profiler = PipelineProfiler(output_dir or Config.PROFILE_DIR)
+    return _profiler
+
+
+def profile_stage(account: str, stage: str):
+    """Profile a stage when profiling is enabled, otherwise do nothing"""
+    if _profiler is None:
+        return _noop()
+    return _profiler.stage(account, stage)
+
+
+@contextmanager
+def _noop() -> Iterator[None]:
+    yield
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Resources - one Graph API instance and one database engine per process
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from requests.adapters import HTTPAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from config import Config
+from throttling import ThrottledFacebookAdsApi
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_api = None
+_engine = None
+_sessionmaker = None
+
+
+def get_api() -> ThrottledFacebookAdsApi:
+    """Initialize the Graph API once; every account reuses its keep-alive HTTP connections"""
+    global _api
+    with _lock:
+        if _api is None:
+            api = ThrottledFacebookAdsApi.init(
+                app_id=Config.FACEBOOK_APP_ID,
+                app_secret=Config.FACEBOOK_APP_SECRET,
+                access_token=Config.FACEBOOK_ACCESS_TOKEN,
+                timeout=Config.HTTP_TIMEOUT
+            )
+            if Config.FACEBOOK_GRAPH_URL:
+                api._session.GRAPH = Config.FACEBOOK_GRAPH_URL.rstrip('/')
+            # Default adapters keep 10 connections per host; size the pool for all concurrent workers
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.HTTP_POOL_SIZE)
+            api._session.requests.mount('https://', adapter)
+            api._session.requests.mount('http://', adapter)
+            _api = api
+            logger.info(f"Facebook Ads API initialized (HTTP pool size {Config.HTTP_POOL_SIZE})")
+        return _api
+
+
+def get_engine() -> Engine:
+    """Create the pooled engine on first use"""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = create_engine(
+                Config.DATABASE_URL,
+                echo=False,
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_MAX_OVERFLOW,
+                pool_timeout=Config.DB_POOL_TIMEOUT,
+                pool_recycle=Config.DB_POOL_RECYCLE,
+                pool_pre_ping=Config.DB_POOL_PRE_PING,
+            )
+            logger.info(
+                f"Database engine created (pool size {Config.DB_POOL_SIZE}, overflow {Config.DB_MAX_OVERFLOW})"
+            )
+        return _engine
+
+
+def get_sessionmaker() -> sessionmaker:
+    global _sessionmaker
+    engine = get_engine()
+    with _lock:
+        if _sessionmaker is None:
+            _sessionmaker = sessionmaker(bind=engine)
+        return _sessionmaker
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """Session that is rolled back on error and always returned to the pool"""
+    session = get_sessionmaker()()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def dispose():
+    """Close pooled database and HTTP connections (end of process)"""
+    global _api, _engine, _sessionmaker
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+        if _api is not None:
+            _api._session.requests.close()
+        _api = _engine = _sessionmaker = None
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Rollup Tables - campaign/day and adset/day aggregates per account table
+
+Rows without a campaign_id / adset_id (stored before those columns existed)
+are left out of the rollups of that level rather than merged under one key.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import BigInteger, Column, Date, Float, MetaData, String, Table, text
+from sqlalchemy.orm import Session
+from dimensions import DimensionStore, dimension_table_name
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Summed metrics: rollup column -> ad table column
+SUMMED_METRICS = {
+    'amount_spent': 'amount_spent',
+    'impressions': 'impressions',
+    'clicks': 'clicks',
+    'link_clicks': 'link_clicks',
+    'purchases': 'purchases',
+    'purchases_conversion_value': 'purchases_conversion_value',
+}
+
+# Ratios recomputed from the summed metrics (averaging per-ad ratios would be wrong)
+DERIVED_RATIOS = {
+    'ctr_all': "s.clicks * 100.0 / NULLIF(s.impressions, 0)",
+    'cpc_all': "s.amount_spent / NULLIF(s.clicks, 0)",
+    'cpm': "s.amount_spent * 1000.0 / NULLIF(s.impressions, 0)",
+}
+
+# Rollup level -> (id column, name column)
+ROLLUP_LEVELS = {
+    'campaign': ('campaign_id', 'campaign_name'),
+    'adset': ('adset_id', 'adset_name'),
+}
+
+
+def rollup_table_name(table_name: str, level: str) -> str:
+    return f"{table_name}_{level}_daily"
+
+
+def create_rollup_table(table_name: str, level: str) -> Table:
+    """Rollup table keyed by (day, <level>_id)"""
+    id_column, name_column = ROLLUP_LEVELS[level]
+    columns = [
+        Column('day', Date, primary_key=True),
+        Column(id_column, String(50), primary_key=True),
+        Column(name_column, String(500)),
+    ]
+    if level == 'adset':
+        columns.append(Column('campaign_id', String(50), index=True))
+    columns += [Column(name, BigInteger if name in ('impressions', 'clicks', 'link_clicks', 'purchases') else Float)
+                for name in SUMMED_METRICS]
+    columns += [Column(name, Float) for name in DERIVED_RATIOS]
+    # Own MetaData: accounts build their rollup tables concurrently
+    return Table(rollup_table_name(table_name, level), MetaData(), *columns)
+
+
+class RollupManager:
+    """Keeps the campaign/day and adset/day rollups of one ad table up to date"""
+
+    def __init__(self, table_name: str, session: Session, dimensions: Optional[DimensionStore] = None):
+        self.table_name = table_name
+        self.session = session
+        self.dimensions = dimensions
+        self.tables = {level: create_rollup_table(table_name, level) for level in ROLLUP_LEVELS}
+
+    def create_tables(self):
+        for table in self.tables.values():
+            table.create(self.session.get_bind(), checkfirst=True)
+
+    def refresh(self, days: Optional[List[date]] = None) -> Dict[str, int]:
+        """Recompute rollup rows for the given days (all days when None), in one transaction
+
+        A rollup table that is still empty (just created) is built for every
+        day instead, so history loaded before rollups were enabled is included.
+        """
+        counts = {}
+        for level, table in self.tables.items():
+            level_days = days
+            if days is not None and self._is_empty(table.name):
+                logger.info(f"Rollup table {table.name} is empty, building it for all days")
+                level_days = None
+            counts[level] = self._refresh_level(level, table.name, level_days)
+        self.session.commit()
+        scope = f"{len(days)} days" if days is not None else "all days"
+        logger.info(f"Refreshed rollups for {self.table_name} ({scope}): {counts}")
+        return counts
+
+    def prune(self, cutoff: date) -> int:
+        """Delete rollup rows of days before cutoff (the raw rows' retention cutoff)"""
+        removed = 0
+        for table in self.tables.values():
+            removed += self.session.execute(text(f'DELETE FROM "{table.name}" WHERE day < :cutoff'),
+                                            {'cutoff': cutoff}).rowcount
+        self.session.commit()
+        logger.info(f"Deleted {removed} rollup rows older than {cutoff} for {self.table_name}")
+        return removed
+
+    def _is_empty(self, rollup_name: str) -> bool:
+        return self.session.execute(text(f'SELECT 1 FROM "{rollup_name}" LIMIT 1')).first() is None
+
+    def _refresh_level(self, level: str, rollup_name: str, days: Optional[List[date]]) -> int:
+        id_column, name_column = ROLLUP_LEVELS[level]
+        params = {}
+        day_filter = ''
+        if days is not None:
+            day_filter = 'WHERE day = ANY(:days)'
+            params['days'] = list(days)
+
+        self.session.execute(text(f'DELETE FROM "{rollup_name}" {day_filter}'), params)
+
+        source_filter = f'{day_filter} AND' if day_filter else 'WHERE'
+        source_filter += f' {id_column} IS NOT NULL'
+        parent = ['campaign_id'] if level == 'adset' else []
+        target_columns = ['day', id_column, name_column] + parent + list(SUMMED_METRICS) + list(DERIVED_RATIOS)
+        grouped = ['day', id_column]
+        if self.dimensions is None:
+            grouped.append(f'MAX({name_column}) AS {name_column}')
+        grouped += [f'MAX({column}) AS {column}' for column in parent]
+        grouped += [f'COALESCE(SUM({source}), 0) AS {name}' for name, source in SUMMED_METRICS.items()]
+        selected = [f's.{column}' for column in target_columns[:-len(DERIVED_RATIOS)]] + [
+            f'{expr} AS {name}' for name, expr in DERIVED_RATIOS.items()
+        ]
+        if self.dimensions is not None:
+            # Normalized fact tables carry no names: take the current one from the dimension table
+            dim_table = dimension_table_name(self.table_name, level)
+            selected[2] = (f'(SELECT d.{name_column} FROM "{dim_table}" d '
+                           f'WHERE d.{id_column} = s.{id_column}) AS {name_column}')
+        result = self.session.execute(text(
+            f'INSERT INTO "{rollup_name}" ({", ".join(target_columns)}) '
+            f'SELECT {", ".join(selected)} FROM ('
+            f'SELECT {", ".join(grouped)} FROM "{self.table_name}" {source_filter} '
+            f'GROUP BY day, {id_column}'
+            f') s'
+        ), params)
+        return result.rowcount
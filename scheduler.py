@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Sync Scheduler - per-account cadences with jitter, overlap protection and missed-run catch-up
+
+Cadences are written as `name=every/days_back`, comma separated, e.g.
+    today=1h/0,lookback=daily@06:00/7
+re-syncs today every hour and the last 7 days once a day at 06:00 (plus jitter).
+`every` is `<n>m`, `<n>h`, `<n>d` or `daily@HH:MM`.
+
+The last successful sync of every account/cadence is kept in `sync_watermarks`,
+so a restarted scheduler runs what it missed once and re-syncs from the last
+synced day instead of leaving a gap.
+"""
+import logging
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, Text, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import Config
+from metrics import get_metrics
+from resources import get_engine, session_scope
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+# Longest the loop sleeps without re-checking, so stop() and clock changes are noticed
+MAX_SLEEP_SECONDS = 60
+
+watermarks_table = Table(
+    'sync_watermarks', metadata,
+    Column('account_id', String(50), primary_key=True),
+    Column('cadence', String(50), primary_key=True),
+    Column('last_attempt_at', DateTime),
+    Column('last_success_at', DateTime),
+    Column('last_status', String(20)),
+    Column('last_error', Text),
+    Column('synced_from', Date),
+    Column('synced_through', Date),
+    Column('rows', Integer),
+)
+
+
+class Cadence(NamedTuple):
+    """How often a window of days is re-synced; anchored cadences run at a fixed time of day"""
+    name: str
+    interval: timedelta
+    days_back: int
+    at: Optional[dt_time] = None
+
+    def next_due(self, last_success: Optional[datetime], now: datetime) -> datetime:
+        """Next run time; a run that was missed (or never happened) is due immediately"""
+        if self.at is None:
+            return now if last_success is None else max(now, last_success + self.interval)
+        slot = datetime.combine(now.date(), self.at)
+        if slot > now:
+            slot -= timedelta(days=1)
+        if last_success is None or last_success < slot:
+            return now
+        return slot + timedelta(days=1)
+
+
+def parse_cadences(spec: str) -> List[Cadence]:
+    """Parse `name=every/days_back,...` (see module docstring)"""
+    cadences = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            name, rest = item.split('=', 1)
+            every, days_back = rest.rsplit('/', 1)
+            cadences.append(_parse_every(name.strip(), every.strip(), int(days_back)))
+        except ValueError as e:
+            raise ValueError(f"Invalid cadence '{item}' (expected name=every/days_back): {e}") from None
+    if not cadences:
+        raise ValueError(f"No cadences in '{spec}'")
+    return cadences
+
+
+def _parse_every(name: str, every: str, days_back: int) -> Cadence:
+    if every.startswith('daily@'):
+        return Cadence(name, timedelta(days=1), days_back, datetime.strptime(every[6:], '%H:%M').time())
+    units = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+    if every[-1:] not in units or not every[:-1].isdigit() or int(every[:-1]) <= 0:
+        raise ValueError(f"unknown interval '{every}'")
+    return Cadence(name, timedelta(**{units[every[-1]]: int(every[:-1])}), days_back)
+
+
+def default_cadences() -> str:
+    """Hourly refresh of today plus the daily lookback window at DAILY_RUN_TIME"""
+    return f"today=1h/0,lookback=daily@{Config.DAILY_RUN_TIME}/{Config.DEFAULT_DAYS_BACK}"
+
+
+def account_cadences(account: dict) -> List[Cadence]:
+    return parse_cadences(account.get('cadences') or Config.SCHEDULE_CADENCES or default_cadences())
+
+
+class WatermarkStore:
+    """Last attempt and last successful sync per account and cadence"""
+
+    def create_table(self):
+        watermarks_table.create(get_engine(), checkfirst=True)
+
+    def load(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        with session_scope() as session:
+            rows = session.execute(select(watermarks_table)).mappings().all()
+        return {(row['account_id'], row['cadence']): dict(row) for row in rows}
+
+    def synced_through(self, account_id: str) -> Optional[date]:
+        """Last day covered by any successful sync of the account"""
+        with session_scope() as session:
+            return session.execute(
+                select(func.max(watermarks_table.c.synced_through))
+                .where(watermarks_table.c.account_id == account_id)
+            ).scalar()
+
+    def record(self, account_id: str, cadence: str, **values):
+        row = {'account_id': account_id, 'cadence': cadence, **values}
+        statement = pg_insert(watermarks_table).values(**row)
+        statement = statement.on_conflict_do_update(
+            index_elements=['account_id', 'cadence'],
+            set_={key: statement.excluded[key] for key in values}
+        )
+        with session_scope() as session:
+            session.execute(statement)
+            session.commit()
+
+
+@contextmanager
+def account_lock(account_id: str) -> Iterator[bool]:
+    """Postgres advisory lock so two scheduler processes never sync the same account at once.
+
+    Yields False when another process holds it. The lock lives as long as its
+    connection, so the connection is kept out of the pool for the whole run.
+    """
+    with get_engine().connect() as connection:
+        key = f"fb_sync:{account_id}"
+        acquired = connection.execute(text('SELECT pg_try_advisory_lock(hashtext(:key))'), {'key': key}).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                connection.execute(text('SELECT pg_advisory_unlock(hashtext(:key))'), {'key': key})
+            connection.commit()
+
+
+class ScheduledJob:
+    """One cadence of one account and its next planned run"""
+
+    def __init__(self, account: dict, cadence: Cadence):
+        self.account = account
+        self.cadence = cadence
+        self.next_run: Optional[datetime] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.account['id'], self.cadence.name
+
+    def __repr__(self) -> str:
+        return f"{self.account['name']}/{self.cadence.name}"
+
+
+class SyncScheduler:
+    """Runs every account's cadences; one run per account at a time, in-process and across processes"""
+
+    def __init__(self, run_account: Callable[[dict, date], Dict[str, Any]], accounts: List[dict] = None,
+                 max_workers: int = None, jitter_seconds: float = None, retry_minutes: float = None):
+        self.run_account = run_account
+        self.accounts = accounts if accounts is not None else Config.AD_ACCOUNTS
+        self.jobs = [ScheduledJob(account, cadence)
+                     for account in self.accounts for cadence in account_cadences(account)]
+        self.max_workers = max(1, max_workers or Config.PIPELINE_WORKERS)
+        self.jitter = Config.SCHEDULE_JITTER_SECONDS if jitter_seconds is None else jitter_seconds
+        self.retry_delay = timedelta(minutes=Config.SCHEDULE_RETRY_MINUTES if retry_minutes is None else retry_minutes)
+        self.watermarks = WatermarkStore()
+        self._busy = set()
+        self._busy_lock = threading.Lock()
+        self._running: Dict[Future, ScheduledJob] = {}
+        self._stop = threading.Event()
+
+    def plan(self, now: datetime = None):
+        """Set next_run of every job from the persisted watermarks (missed runs become due now)"""
+        now = now or datetime.now()
+        state = self.watermarks.load()
+        for job in self.jobs:
+            self._schedule(job, state.get(job.key, {}), now)
+            every = f"daily at {job.cadence.at:%H:%M}" if job.cadence.at else f"every {job.cadence.interval}"
+            logger.info(f"  {job}: {every}, last {job.cadence.days_back} days, "
+                        f"next run {job.next_run:%Y-%m-%d %H:%M:%S}")
+
+    def _schedule(self, job: ScheduledJob, watermark: Dict[str, Any], now: datetime):
+        due = job.cadence.next_due(watermark.get('last_success_at'), now)
+        last_attempt = watermark.get('last_attempt_at')
+        if watermark.get('last_status') == 'failed' and last_attempt:
+            due = max(due, last_attempt + self.retry_delay)
+        # Jitter spreads accounts that share a cadence so they don't hit the API together
+        job.next_run = due + timedelta(seconds=random.uniform(0, self.jitter))
+
+    def run_forever(self):
+        logger.info(f"Scheduler started with {len(self.jobs)} jobs ({self.max_workers} workers). Press Ctrl+C to stop.")
+        self.watermarks.create_table()
+        self.plan()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sync') as executor:
+            try:
+                while not self._stop.is_set():
+                    self.submit_due(executor)
+                    self._wait()
+            finally:
+                self._stop.set()
+                # Queued runs are dropped, started ones finish and record their watermark
+                for future in list(self._running):
+                    if future.cancel():
+                        self._running.pop(future)
+                if self._running:
+                    logger.info(f"Stopping, waiting for {len(self._running)} running syncs to finish...")
+        logger.info("Scheduler stopped")
+
+    def stop(self):
+        self._stop.set()
+
+    def submit_due(self, executor: ThreadPoolExecutor, now: datetime = None):
+        now = now or datetime.now()
+        if not self._running:
+            # Metrics describe the runs since the scheduler was last idle
+            get_metrics().reset()
+        for job in sorted(self.jobs, key=lambda j: j.next_run):
+            if job.next_run > now or job in self._running.values():
+                continue
+            with self._busy_lock:
+                if job.account['id'] in self._busy:
+                    # Another cadence of this account is running; it is picked up when that one ends
+                    continue
+                self._busy.add(job.account['id'])
+            self._running[executor.submit(self._run_job, job)] = job
+
+    def _wait(self):
+        # Jobs waiting on a busy account are reconsidered when a running job finishes
+        with self._busy_lock:
+            pending = [job.next_run for job in self.jobs if job.account['id'] not in self._busy]
+        timeout = MAX_SLEEP_SECONDS
+        if pending:
+            timeout = min(timeout, max(0.0, (min(pending) - datetime.now()).total_seconds()))
+        if self._running:
+            done, _ = wait(list(self._running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._running.pop(future)
+        else:
+            self._stop.wait(timeout)
+
+    def _run_job(self, job: ScheduledJob):
+        account_id = job.account['id']
+        watermark = {}
+        try:
+            with account_lock(account_id) as acquired:
+                if not acquired:
+                    logger.warning(f"Skipping {job}: account is being synced by another process")
+                    job.next_run = datetime.now() + self.retry_delay
+                    return
+                watermark = self._sync(job)
+        except Exception as e:
+            logger.error(f"Scheduled sync {job} failed: {e}")
+            job.next_run = datetime.now() + self.retry_delay
+        finally:
+            with self._busy_lock:
+                self._busy.discard(account_id)
+        if watermark:
+            self._schedule(job, watermark, datetime.now())
+            logger.info(f"Next run of {job}: {job.next_run:%Y-%m-%d %H:%M:%S}")
+
+    def _sync(self, job: ScheduledJob) -> Dict[str, Any]:
+        account_id = job.account['id']
+        started_at = datetime.now()
+        today = started_at.date()
+        start_date = today - timedelta(days=job.cadence.days_back)
+        # Catch up: re-sync from the last synced day so downtime leaves no gap
+        synced_through = self.watermarks.synced_through(account_id)
+        if synced_through and synced_through < start_date:
+            logger.info(f"  {job}: catching up from {synced_through} (last synced day)")
+            start_date = synced_through
+
+        self.watermarks.record(account_id, job.cadence.name, last_attempt_at=started_at, last_status='running')
+        logger.info(f"Scheduled sync {job}: {start_date} -> {today}")
+        summary = self.run_account(job.account, start_date)
+
+        watermark = {'last_attempt_at': started_at, 'last_status': summary['status']}
+        if summary['status'] == 'ok':
+            watermark.update(last_success_at=started_at, last_error=None, synced_from=start_date,
+                             synced_through=today, rows=summary.get('inserted', 0))
+        else:
+            watermark['last_error'] = summary.get('error')
+        self.watermarks.record(account_id, job.cadence.name, **watermark)
+
+        metrics = get_metrics()
+        metrics.finish()
+        metrics.write_outputs()
+        return watermark
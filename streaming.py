@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming helpers - bounded producer/consumer plumbing for the pipeline
+"""
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, max_pending: int = 2) -> Iterator:
+    """Iterate `iterable` on a background thread, keeping at most `max_pending` items ahead.
+    
+    Lets the producer (e.g. fetching page N+1 from the API) overlap with the
+    consumer (e.g. writing page N to the database) while memory stays bounded.
+    Exceptions raised by the producer are re-raised in the consumer. The
+    producer thread is joined when the consumer finishes or goes away, so
+    nothing keeps running on its behalf (it may finish the item it is on).
+    """
+    buffer = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+    producer = threading.Thread(target=produce_into, args=(buffer, iterable, stop), name='prefetch', daemon=True)
+    producer.start()
+    try:
+        yield from consume(buffer)
+    finally:
+        stop.set()
+        producer.join()
+
+
+def produce_into(buffer: queue.Queue, iterable: Iterable, stop: threading.Event):
+    """Put every item of `iterable` into `buffer`, then a done marker (or the exception raised).
+    
+    Gives up as soon as `stop` is set, so a consumer that went away never leaves it blocked.
+    """
+    try:
+        for item in iterable:
+            if not _put(buffer, item, stop):
+                return
+        _put(buffer, _DONE, stop)
+    except BaseException as e:
+        _put(buffer, e, stop)
+
+
+def consume(buffer: queue.Queue) -> Iterator:
+    """Yield the items produce_into puts in `buffer` until it is done, re-raising its exception"""
+    while True:
+        item = buffer.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _put(buffer: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def rebatch(pages: Iterable[List[Dict[str, Any]]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Regroup a stream of variable-size pages into batches of at most `batch_size` records"""
+    batch = []
+    for page in pages:
+        for record in page:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
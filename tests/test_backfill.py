@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from datetime import date, timedelta
+
+import pytest
+
+from backfill import Backfill, days_in_window, plan_windows
+
+
+def test_plan_windows_covers_the_range_newest_first():
+    windows = plan_windows(date(2025, 1, 1), date(2025, 1, 20), 7)
+    assert windows == [
+        (date(2025, 1, 15), date(2025, 1, 20)),
+        (date(2025, 1, 8), date(2025, 1, 14)),
+        (date(2025, 1, 1), date(2025, 1, 7)),
+    ]
+
+
+@pytest.mark.parametrize('window_days', [1, 3, 7, 30, 400])
+def test_plan_windows_tiles_without_gaps_or_overlap(window_days):
+    since, until = date(2024, 2, 10), date(2024, 12, 31)
+    windows = plan_windows(since, until, window_days)
+    days = [day for window in windows for day in days_in_window(window)]
+    assert len(days) == len(set(days)) == (until - since).days + 1
+    assert all((end - start).days < window_days for start, end in windows)
+
+
+def test_plan_windows_single_day():
+    day = date(2025, 3, 1)
+    assert plan_windows(day, day, 7) == [(day, day)]
+
+
+def test_days_in_window_is_inclusive():
+    start = date(2025, 2, 27)
+    assert days_in_window((start, date(2025, 3, 1))) == {start + timedelta(days=i) for i in range(3)}
+
+
+def test_windows_with_every_day_done_are_skipped_across_window_sizes():
+    # Done days recorded with 7-day windows, planned again with 10-day windows
+    done = set()
+    for window in plan_windows(date(2025, 1, 1), date(2025, 1, 14), 7):
+        done |= days_in_window(window)
+    windows = plan_windows(date(2025, 1, 1), date(2025, 1, 31), 10)
+    pending = [window for window in windows if not days_in_window(window) <= done]
+    assert pending == [(date(2025, 1, 31), date(2025, 1, 31)),
+                       (date(2025, 1, 21), date(2025, 1, 30)),
+                       (date(2025, 1, 11), date(2025, 1, 20))]
+
+
+def test_backfill_rejects_since_after_until():
+    with pytest.raises(ValueError):
+        Backfill(date(2025, 2, 1), date(2025, 1, 1), accounts=[])
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+from columnar_exporter import ColumnarExporter
+
+
+@pytest.fixture
+def no_pyarrow(monkeypatch):
+    # A None entry makes `import pyarrow` raise ImportError
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    monkeypatch.setitem(sys.modules, 'pyarrow.parquet', None)
+
+
+def test_csv_export_does_not_need_pyarrow(no_pyarrow, tmp_path):
+    exporter = ColumnarExporter('act_1', export_folder=tmp_path, formats=['csv'])
+    exporter.write_partition('2025-06-01', [])
+    assert (tmp_path / 'csv' / 'account=act_1' / 'date=2025-06-01' / 'part-0.csv.gz').exists()
+
+
+def test_parquet_without_pyarrow_fails_with_a_clear_message(no_pyarrow, tmp_path):
+    with pytest.raises(ImportError, match='COLUMNAR_FORMATS=parquet needs pyarrow'):
+        ColumnarExporter('act_1', export_folder=tmp_path, formats=['parquet'])
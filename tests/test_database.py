@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+
+import database
+from config import Config
+from database import DatabaseManager
+
+
+class RecordingSession:
+    """Records statements and commits in the order DatabaseManager sends them"""
+
+    def __init__(self):
+        self.events = []
+
+    def execute(self, statement, params=None):
+        self.events.append(str(statement).split()[0].upper())
+        return []
+
+    def commit(self):
+        self.events.append('COMMIT')
+
+    def rollback(self):
+        self.events.append('ROLLBACK')
+
+    @contextmanager
+    def begin_nested(self):
+        yield
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(database, 'get_sessionmaker', lambda: RecordingSession)
+    monkeypatch.setattr(Config, 'DB_BULK_METHOD', 'executemany')
+    return DatabaseManager(table_name='ads_test', partition_by='month')
+
+
+def _row(day):
+    return {'ad_id': '1', 'day': day}
+
+
+def _failing_pages():
+    yield [_row('2025-06-01')]
+    raise RuntimeError('Graph timeout')
+
+
+def test_failed_fetch_never_commits_the_cleared_range(manager):
+    with pytest.raises(RuntimeError):
+        manager.load_stream(_failing_pages(), upsert=False, batch_size=1,
+                            replace_range=(date(2025, 6, 1), date(2025, 7, 3)))
+    events = manager.session.events
+    # Both partitions are created (and committed) before the clear
+    assert events.count('CREATE') == 2
+    assert 'TRUNCATE' not in events
+    assert 'COMMIT' not in events[events.index('DELETE'):]
+
+
+def test_stream_commits_once_after_the_last_batch(manager):
+    pages = iter([[_row('2025-06-01')], [_row('2025-06-02')]])
+    count = manager.load_stream(pages, upsert=False, batch_size=1,
+                                replace_range=(date(2025, 6, 1), date(2025, 6, 2)))
+    events = manager.session.events
+    assert count == 2
+    assert events[events.index('DELETE'):] == ['DELETE', 'INSERT', 'INSERT', 'COMMIT']
+
+
+def test_replacing_a_partitioned_table_needs_the_range(manager):
+    with pytest.raises(ValueError):
+        manager.load_stream(iter([[_row('2025-06-01')]]), upsert=False, replace=True)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import resources
+from config import Config
+from fake_graph_api import FakeGraphAPI
+from facebook_ads_client import FacebookAdsClient
+
+ADS = 600  # two pages of PAGE_LIMIT rows per day
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with FakeGraphAPI(ads=ADS, campaigns=3) as server:
+        monkeypatch.setattr(resources, '_api', None)
+        monkeypatch.setattr(Config, 'FACEBOOK_GRAPH_URL', server.url)
+        monkeypatch.setattr(Config, 'FACEBOOK_ACCESS_TOKEN', 'test-token')
+        # Config.validate() insists on DB_PASSWORD even though no database is touched
+        monkeypatch.setattr(Config, 'DB_PASSWORD', 'unused')
+        monkeypatch.setattr(Config, 'ASYNC_INSIGHTS', False)
+        monkeypatch.setattr(Config, 'CACHE_ENABLED', False)
+        monkeypatch.setattr(Config, 'NAMES_SOURCE', 'insights')
+        monkeypatch.setattr(Config, 'FETCH_SPLIT', 'day')
+        yield server
+    resources._api = None
+
+
+def _fetch(batch_size, monkeypatch):
+    monkeypatch.setattr(Config, 'GRAPH_BATCH_SIZE', batch_size)
+    pages = FacebookAdsClient('act_1').iter_ads_data('2025-01-01', '2025-01-03')
+    return sorted((row['ad_id'], str(row['day'])) for page in pages for row in page)
+
+
+def test_batched_windows_match_unbatched(server, monkeypatch):
+    unbatched = _fetch(0, monkeypatch)
+    assert len(unbatched) == 3 * ADS
+    assert _fetch(50, monkeypatch) == unbatched
+
+
+def test_batch_carries_first_pages_and_yields_before_following_cursors(server, monkeypatch):
+    monkeypatch.setattr(Config, 'GRAPH_BATCH_SIZE', 50)
+    client = FacebookAdsClient('act_1')
+    pages = client._iter_windows_batched(client.plan_windows('2025-01-01', '2025-01-03', 'day'), raw=True)
+    first = next(pages)
+    assert {row['date_start'] for row in first} == {'2025-01-01'}
+    # One batch call with the first page of every window, no second page read yet
+    assert server.stats['batched'] == 3
+    requests = server.stats['requests']
+    rest = list(pages)
+    assert sum(len(page) for page in rest) + len(first) == 3 * ADS
+    assert server.stats['batched'] == 3
+    assert server.stats['requests'] == requests + 3
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from insight_fields import INSIGHT_FIELDS, InsightParser
+
+
+def legacy_parse_insight(insight):
+    """_parse_insight as it was before the compiled parser, kept as the reference"""
+    data = dict(insight)
+
+    actions = {}
+    if 'actions' in data:
+        for action in data.get('actions', []):
+            action_type = action.get('action_type', '')
+            action_value = float(action.get('value', 0))
+            actions[action_type] = action_value
+
+    action_values = {}
+    if 'action_values' in data:
+        for av in data.get('action_values', []):
+            action_type = av.get('action_type', '')
+            action_value = float(av.get('value', 0))
+            action_values[action_type] = action_value
+
+    cost_per_action = {}
+    if 'cost_per_action_type' in data:
+        for cpa in data.get('cost_per_action_type', []):
+            action_type = cpa.get('action_type', '')
+            cost = float(cpa.get('value', 0))
+            cost_per_action[action_type] = cost
+
+    return {
+        'account_id': data.get('account_id'),
+        'account_name': data.get('account_name'),
+        'campaign_name': data.get('campaign_name'),
+        'adset_name': data.get('adset_name'),
+        'ad_id': data.get('ad_id'),
+        'ad_name': data.get('ad_name'),
+        'day': data.get('date_start'),
+        'amount_spent': float(data.get('spend', 0)),
+        'impressions': int(data.get('impressions', 0)),
+        'reach': int(data.get('reach', 0)),
+        'frequency': float(data.get('frequency', 0)),
+        'cpc_all': float(data.get('cpc', 0)),
+        'cpc_link_click': float(data.get('cost_per_inline_link_click', 0)),
+        'ctr_all': float(data.get('ctr', 0)),
+        'ctr_link_click': float(data.get('inline_link_click_ctr', 0)),
+        'cpm': float(data.get('cpm', 0)),
+        'link_clicks': int(data.get('inline_link_clicks', 0)),
+        'cost_per_result': cost_per_action.get('omni_purchase', cost_per_action.get('purchase', 0)),
+        'landing_page_views': int(actions.get('landing_page_view', 0)),
+        'cost_per_landing_page_view': cost_per_action.get('landing_page_view', 0),
+        'leads': int(actions.get('lead', 0)),
+        'leads_conversion_value': action_values.get('lead', 0),
+        'messaging_conversations_started': int(actions.get('onsite_conversion.messaging_conversation_started_7d', 0)),
+        'adds_to_cart': int(actions.get('omni_add_to_cart', 0)),
+        'website_adds_to_cart': int(actions.get('add_to_cart', 0)),
+        'adds_to_cart_conversion_value': action_values.get('omni_add_to_cart', 0),
+        'checkouts_initiated': int(actions.get('omni_initiated_checkout', 0)),
+        'checkouts_initiated_conversion_value': action_values.get('omni_initiated_checkout', 0),
+        'purchases': int(actions.get('omni_purchase', 0)),
+        'website_purchases': int(actions.get('purchase', 0)),
+        'purchases_conversion_value': action_values.get('omni_purchase', 0),
+        'website_purchases_conversion_value': action_values.get('purchase', 0),
+        'post_comments': int(actions.get('post_comment', actions.get('comment', 0))),
+    }
+
+
+IDS = {
+    'account_id': '1234', 'account_name': 'Shop', 'campaign_name': 'Sale', 'adset_name': 'Broad',
+    'ad_id': '120210000000001', 'ad_name': 'Video A', 'date_start': '2025-06-01', 'date_stop': '2025-06-01',
+}
+
+FULL = dict(
+    IDS, spend='125.37', impressions='10234', reach='8120', frequency='1.26', cpc='0.52',
+    cost_per_inline_link_click='0.91', ctr='2.31', inline_link_click_ctr='1.33', cpm='12.25',
+    inline_link_clicks='137',
+    actions=[
+        {'action_type': 'landing_page_view', 'value': '98'},
+        {'action_type': 'lead', 'value': '4'},
+        {'action_type': 'onsite_conversion.messaging_conversation_started_7d', 'value': '6'},
+        {'action_type': 'omni_add_to_cart', 'value': '21'},
+        {'action_type': 'add_to_cart', 'value': '19'},
+        {'action_type': 'omni_initiated_checkout', 'value': '9'},
+        {'action_type': 'omni_purchase', 'value': '5'},
+        {'action_type': 'purchase', 'value': '4'},
+        {'action_type': 'post_comment', 'value': '3'},
+        {'action_type': 'comment', 'value': '7'},
+        {'action_type': 'video_view', 'value': '1500'},
+    ],
+    action_values=[
+        {'action_type': 'lead', 'value': '40.5'},
+        {'action_type': 'omni_add_to_cart', 'value': '830.1'},
+        {'action_type': 'omni_initiated_checkout', 'value': '412'},
+        {'action_type': 'omni_purchase', 'value': '251.75'},
+        {'action_type': 'purchase', 'value': '199'},
+    ],
+    cost_per_action_type=[
+        {'action_type': 'landing_page_view', 'value': '1.279'},
+        {'action_type': 'purchase', 'value': '31.34'},
+        {'action_type': 'omni_purchase', 'value': '25.07'},
+    ],
+)
+
+ROWS = {
+    'full': FULL,
+    'no_metrics': IDS,
+    'empty_action_lists': dict(IDS, spend='0', actions=[], action_values=[], cost_per_action_type=[]),
+    'fallback_action_types': dict(
+        IDS, spend='3', actions=[{'action_type': 'comment', 'value': '2'}],
+        cost_per_action_type=[{'action_type': 'purchase', 'value': '7.5'}],
+    ),
+    'repeated_action_type': dict(
+        IDS, actions=[{'action_type': 'lead', 'value': '1'}, {'action_type': 'lead', 'value': '3'}],
+    ),
+    'action_without_value': dict(IDS, actions=[{'action_type': 'lead'}]),
+}
+
+
+@pytest.fixture(scope='module')
+def parser():
+    return InsightParser()
+
+
+@pytest.mark.parametrize('name', sorted(ROWS))
+def test_parser_matches_legacy_values_and_types(parser, name):
+    expected = legacy_parse_insight(ROWS[name])
+    parsed = parser.parse(ROWS[name])
+    assert {column: parsed[column] for column in expected} == expected
+    assert {column: type(parsed[column]) for column in expected} == \
+        {column: type(value) for column, value in expected.items()}
+
+
+def test_missing_float_metrics_are_float_zero(parser):
+    parsed = parser.parse(IDS)
+    assert parsed['amount_spent'] == 0.0 and isinstance(parsed['amount_spent'], float)
+    assert parsed['impressions'] == 0 and isinstance(parsed['impressions'], int)
+
+
+def test_parser_fills_every_registry_column(parser):
+    assert set(parser.parse(FULL)) == {spec.column for spec in INSIGHT_FIELDS}
+
+
+def test_parse_columns_matches_parse(parser):
+    rows = list(ROWS.values())
+    columns = parser.parse_columns(rows)
+    for index, row in enumerate(rows):
+        assert {column: values[index] for column, values in columns.items()} == parser.parse(row)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import insights_cache
+from config import Config
+from insights_cache import InsightsCache
+
+FIELDS = ['ad_id', 'spend']
+TODAY = date(2025, 6, 30)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'ATTRIBUTION_LOOKBACK_DAYS', 3)
+    monkeypatch.setattr(Config, 'CACHE_VOLATILE_TTL', 60.0)
+    monkeypatch.setattr(Config, 'CACHE_CLOSED_TTL', 3600.0)
+    return InsightsCache(cache_dir=tmp_path)
+
+
+def _rows(day: date, count: int = 2):
+    return [{'ad_id': str(i), 'date_start': day.isoformat(), 'spend': '1.5'} for i in range(count)]
+
+
+def test_ttl_depends_on_the_age_of_the_day(cache):
+    assert cache.ttl_for_day(TODAY, today=TODAY) == 60.0
+    assert cache.ttl_for_day(TODAY - timedelta(days=3), today=TODAY) == 60.0
+    assert cache.ttl_for_day(TODAY - timedelta(days=4), today=TODAY) == 3600.0
+
+
+def test_get_returns_rows_until_the_ttl_expires(cache, monkeypatch):
+    day = date.today() - timedelta(days=10)
+    cache.put('act_1', day, 'ad', FIELDS, _rows(day))
+    assert cache.get('act_1', day, 'ad', FIELDS) == _rows(day)
+
+    now = time.time()
+    monkeypatch.setattr(insights_cache.time, 'time', lambda: now + 3601)
+    assert cache.get('act_1', day, 'ad', FIELDS) is None
+
+
+def test_volatile_days_expire_sooner(cache, monkeypatch):
+    day = date.today()
+    cache.put('act_1', day, 'ad', FIELDS, _rows(day))
+    now = time.time()
+    monkeypatch.setattr(insights_cache.time, 'time', lambda: now + 61)
+    assert cache.get('act_1', day, 'ad', FIELDS) is None
+
+
+def test_entries_are_keyed_by_field_set(cache):
+    day = date.today() - timedelta(days=10)
+    cache.put('act_1', day, 'ad', FIELDS, _rows(day))
+    assert cache.get('act_1', day, 'ad', FIELDS + ['clicks']) is None
+    assert cache.get('act_1', day, 'ad', list(reversed(FIELDS))) == _rows(day)
+
+
+def test_empty_days_are_cached(cache):
+    day = date.today() - timedelta(days=10)
+    cache.put('act_1', day, 'ad', FIELDS, [])
+    assert cache.get('act_1', day, 'ad', FIELDS) == []
+
+
+def test_staged_rows_are_served_only_after_commit(cache):
+    day = date.today() - timedelta(days=10)
+    first, second = _rows(day, 2), _rows(day, 3)[2:]
+    cache.append('run', 'act_1', day, 'ad', FIELDS, first)
+    cache.append('run', 'act_1', day, 'ad', FIELDS, second)
+    assert cache.get('act_1', day, 'ad', FIELDS) is None
+
+    cache.commit_day('run', 'act_1', day, 'ad', FIELDS)
+    assert cache.get('act_1', day, 'ad', FIELDS) == first + second
+
+
+def test_commit_without_staged_rows_caches_an_empty_day(cache):
+    day = date.today() - timedelta(days=10)
+    cache.commit_day('run', 'act_1', day, 'ad', FIELDS)
+    assert cache.get('act_1', day, 'ad', FIELDS) == []
+
+
+def test_discard_drops_unfinished_days(cache):
+    day = date.today() - timedelta(days=10)
+    cache.append('run', 'act_1', day, 'ad', FIELDS, _rows(day))
+    cache.discard('run')
+    cache.commit_day('run', 'act_1', day, 'ad', FIELDS)
+    assert cache.get('act_1', day, 'ad', FIELDS) == []
+
+
+def test_evict_drops_least_recently_used_days(tmp_path):
+    cache = InsightsCache(cache_dir=tmp_path)
+    old, new = date.today() - timedelta(days=11), date.today() - timedelta(days=10)
+    cache.put('act_1', old, 'ad', FIELDS, _rows(old))
+    time.sleep(0.01)
+    cache.put('act_1', new, 'ad', FIELDS, _rows(new))
+    time.sleep(0.01)
+    cache.get('act_1', old, 'ad', FIELDS)
+
+    cache.max_bytes = len(insights_cache._compress(_rows(old)))
+    assert cache.evict() == 1
+    assert cache.get('act_1', old, 'ad', FIELDS) == _rows(old)
+    assert cache.get('act_1', new, 'ad', FIELDS) is None
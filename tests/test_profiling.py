@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+import pytest
+
+from profiling import PipelineProfiler
+
+
+def _busy():
+    return sum(i * i for i in range(10000))
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason='the stage profile covers every thread')
+def test_stage_collects_worker_profiles_disabled(tmp_path, monkeypatch):
+    written = {}
+    profiler = PipelineProfiler(tmp_path, sample_interval=0.01)
+    monkeypatch.setattr(profiler, '_write', lambda *args: written.update(thread_profiles=args[4]))
+    with profiler.stage('account', 'fetch'):
+        worker = threading.Thread(target=_busy)
+        worker.start()
+        worker.join()
+    assert threading.Thread.run.__name__ == 'run'
+    assert len(written['thread_profiles']) == 1
+    # The worker disabled its own profile: enabling it again from here works
+    profile = written['thread_profiles'][0]
+    profile.enable()
+    profile.disable()
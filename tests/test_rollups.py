@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from rollups import RollupManager
+
+
+class _Result:
+    rowcount = 0
+
+    def __init__(self, first=None):
+        self._first = first
+
+    def first(self):
+        return self._first
+
+
+class RecordingSession:
+    """Records the SQL sent by RollupManager; `empty` rollup tables answer no row"""
+
+    def __init__(self, empty=()):
+        self.empty = set(empty)
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append((sql, params or {}))
+        if sql.startswith('SELECT 1 FROM'):
+            return _Result(None if any(f'"{name}"' in sql for name in self.empty) else (1,))
+        return _Result()
+
+    def commit(self):
+        self.commits += 1
+
+    def inserts(self):
+        return [(sql, params) for sql, params in self.statements if sql.startswith('INSERT')]
+
+
+DAYS = [date(2025, 6, 1), date(2025, 6, 2)]
+
+
+def test_refresh_limits_populated_rollups_to_the_synced_days():
+    session = RecordingSession()
+    RollupManager('ads', session).refresh(DAYS)
+    inserts = session.inserts()
+    assert len(inserts) == 2
+    for sql, params in inserts:
+        assert 'day = ANY(:days)' in sql
+        assert params['days'] == DAYS
+    assert session.commits == 1
+
+
+def test_refresh_builds_an_empty_rollup_table_for_all_days():
+    session = RecordingSession(empty={'ads_campaign_daily'})
+    RollupManager('ads', session).refresh(DAYS)
+    campaign, adset = session.inserts()
+    assert 'ads_campaign_daily' in campaign[0] and 'ANY(:days)' not in campaign[0]
+    assert 'ads_adset_daily' in adset[0] and 'ANY(:days)' in adset[0]
+
+
+def test_rows_without_an_id_are_left_out():
+    session = RecordingSession()
+    RollupManager('ads', session).refresh(None)
+    campaign, adset = session.inserts()
+    assert 'WHERE campaign_id IS NOT NULL' in campaign[0]
+    assert 'WHERE adset_id IS NOT NULL' in adset[0]
+    assert "COALESCE(campaign_id, '')" not in campaign[0]
+
+
+def test_prune_deletes_rollup_days_before_the_cutoff():
+    session = RecordingSession()
+    RollupManager('ads', session).prune(date(2025, 1, 1))
+    deletes = [(sql, params) for sql, params in session.statements if sql.startswith('DELETE')]
+    assert [params for _, params in deletes] == [{'cutoff': date(2025, 1, 1)}] * 2
+    assert all('day < :cutoff' in sql for sql, _ in deletes)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+import time
+
+import pytest
+
+from streaming import prefetch, rebatch
+
+
+def _wait_for_no_thread(name: str, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not any(thread.name == name for thread in threading.enumerate()):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_rebatch_regroups_pages():
+    pages = [[1, 2, 3], [], [4], [5, 6, 7, 8, 9]]
+    assert list(rebatch(pages, 4)) == [[1, 2, 3, 4], [5, 6, 7, 8], [9]]
+
+
+def test_rebatch_empty_stream():
+    assert list(rebatch([[], []], 10)) == []
+
+
+def test_prefetch_yields_everything_in_order():
+    pages = [[i] for i in range(20)]
+    assert list(prefetch(iter(pages), 2)) == pages
+
+
+def test_prefetch_reraises_producer_error():
+    def pages():
+        yield [1]
+        raise ValueError('boom')
+
+    stream = prefetch(pages(), 2)
+    assert next(stream) == [1]
+    with pytest.raises(ValueError, match='boom'):
+        next(stream)
+
+
+def test_prefetch_stops_producer_when_consumer_goes_away():
+    produced = []
+
+    def pages():
+        for i in itertools.count():
+            produced.append(i)
+            yield [i]
+
+    stream = prefetch(pages(), 2)
+    assert next(stream) == [0]
+    stream.close()
+    assert _wait_for_no_thread('prefetch')
+    # Producer ran at most a few pages ahead of the consumer
+    assert len(produced) <= 5
+
+
+def test_prefetch_joins_producer_on_close():
+    stream = prefetch(iter([[i] for i in range(10)]), 2)
+    assert next(stream) == [0]
+    stream.close()
+    assert not any(thread.name == 'prefetch' for thread in threading.enumerate())
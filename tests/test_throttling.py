@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import pytest
+
+from config import Config
+from throttling import GraphThrottler, parse_usage_headers
+
+
+@pytest.fixture(autouse=True)
+def watermarks(monkeypatch):
+    monkeypatch.setattr(Config, 'THROTTLE_LOW_WATERMARK', 50.0)
+    monkeypatch.setattr(Config, 'THROTTLE_HIGH_WATERMARK', 90.0)
+    monkeypatch.setattr(Config, 'THROTTLE_MAX_INTERVAL', 10.0)
+
+
+def _account_usage(percent: float, reset: float = 0) -> dict:
+    return {'X-Ad-Account-Usage': json.dumps({'acc_id_util_pct': percent, 'reset_time_duration': reset})}
+
+
+def test_parse_usage_headers_takes_the_highest_usage():
+    headers = {
+        'x-business-use-case-usage': json.dumps({'123': [
+            {'call_count': 12, 'total_cputime': 40, 'total_time': 7, 'estimated_time_to_regain_access': 2},
+        ]}),
+        'X-Ad-Account-Usage': json.dumps({'acc_id_util_pct': 33, 'reset_time_duration': 30}),
+        'X-App-Usage': json.dumps({'call_count': 55, 'total_cputime': 1, 'total_time': 1}),
+    }
+    assert parse_usage_headers(headers) == {'usage': 55.0, 'regain_seconds': 120.0}
+
+
+def test_parse_usage_headers_ignores_missing_and_malformed_values():
+    assert parse_usage_headers(None) == {'usage': 0.0, 'regain_seconds': 0.0}
+    assert parse_usage_headers({'X-App-Usage': 'not json'}) == {'usage': 0.0, 'regain_seconds': 0.0}
+
+
+def test_low_usage_never_blocks_even_with_a_reset_time():
+    throttler = GraphThrottler(max_concurrency=8)
+    throttler.observe(_account_usage(10, reset=100))
+    assert throttler.band == 'low'
+    assert throttler.limit == 8
+    assert throttler.min_interval == 0
+    assert throttler.blocked_until == 0
+
+
+def test_mid_band_halves_concurrency_once():
+    throttler = GraphThrottler(max_concurrency=8)
+    for _ in range(5):
+        throttler.observe(_account_usage(70))
+    assert throttler.band == 'mid'
+    assert throttler.limit == 4
+    # Pacing grows quadratically across the band: halfway is a quarter of the max interval
+    assert throttler.min_interval == pytest.approx(2.5)
+
+
+def test_high_band_serializes_and_blocks_for_the_reset_time():
+    throttler = GraphThrottler(max_concurrency=8)
+    before = time.monotonic()
+    throttler.observe(_account_usage(95, reset=100))
+    assert throttler.band == 'high'
+    assert throttler.limit == 1
+    assert throttler.min_interval == 10.0
+    assert throttler.blocked_until >= before + 100
+
+
+def test_recovery_raises_concurrency_one_step_per_response():
+    throttler = GraphThrottler(max_concurrency=4)
+    throttler.observe(_account_usage(95))
+    limits = []
+    for _ in range(5):
+        throttler.observe(_account_usage(10))
+        limits.append(throttler.limit)
+    assert limits == [2, 3, 4, 4, 4]
+    assert throttler.band == 'low'
+
+
+def test_reentering_mid_band_from_high_steps_back_to_half():
+    throttler = GraphThrottler(max_concurrency=8)
+    throttler.observe(_account_usage(95))
+    throttler.observe(_account_usage(60))
+    assert throttler.band == 'mid'
+    assert throttler.limit == 4
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Graph API Throttling - adaptive pacing from rate-limit usage headers
+"""
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
+from config import Config
+from metrics import get_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Graph API error codes that mean "slow down" rather than "request is wrong"
+THROTTLE_ERROR_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005,
+                        80006, 80008, 80009, 80014}
+
+
+def is_throttle_error(error: Exception) -> bool:
+    return isinstance(error, FacebookRequestError) and error.api_error_code() in THROTTLE_ERROR_CODES
+
+
+def parse_usage_headers(headers: Dict[str, str]) -> Dict[str, float]:
+    """Extract the highest usage percentage and the longest regain-access wait from response headers.
+
+    Reads X-Business-Use-Case-Usage, X-Ad-Account-Usage and X-App-Usage.
+    Returns {'usage': percent, 'regain_seconds': seconds}.
+    """
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    usage = 0.0
+    regain_seconds = 0.0
+
+    buc = _load_header(headers.get('x-business-use-case-usage'))
+    if isinstance(buc, dict):
+        for entries in buc.values():
+            for entry in entries or []:
+                usage = max(usage, float(entry.get('call_count', 0)),
+                            float(entry.get('total_cputime', 0)), float(entry.get('total_time', 0)))
+                regain_seconds = max(regain_seconds, float(entry.get('estimated_time_to_regain_access', 0)) * 60)
+
+    account = _load_header(headers.get('x-ad-account-usage'))
+    if isinstance(account, dict):
+        usage = max(usage, float(account.get('acc_id_util_pct', 0)))
+        regain_seconds = max(regain_seconds, float(account.get('reset_time_duration', 0)))
+
+    app = _load_header(headers.get('x-app-usage'))
+    if isinstance(app, dict):
+        usage = max(usage, float(app.get('call_count', 0)),
+                    float(app.get('total_cputime', 0)), float(app.get('total_time', 0)))
+
+    return {'usage': usage, 'regain_seconds': regain_seconds}
+
+
+def _load_header(value: Optional[str]) -> Any:
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GraphThrottler:
+    """Shared limiter that adapts concurrency and pacing to the reported quota usage"""
+
+    def __init__(self, max_concurrency: int = None, max_retries: int = None):
+        self.max_concurrency = max_concurrency or Config.THROTTLE_MAX_CONCURRENCY
+        self.max_retries = Config.THROTTLE_MAX_RETRIES if max_retries is None else max_retries
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.usage = 0.0
+        self.band = 'low'
+        self.min_interval = 0.0
+        self.blocked_until = 0.0
+        self.last_request_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free request slot and the pacing interval"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            now = time.monotonic()
+            start_at = max(self.blocked_until, self.last_request_at + self.min_interval, now)
+            self.last_request_at = start_at
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def observe(self, headers: Dict[str, str]):
+        """Adjust concurrency and pacing from a response's usage headers"""
+        stats = parse_usage_headers(headers)
+        with self._cond:
+            self.usage = stats['usage']
+            if self.usage >= Config.THROTTLE_HIGH_WATERMARK:
+                band = 'high'
+                self.limit = 1
+                self.min_interval = Config.THROTTLE_MAX_INTERVAL
+                # Meta reports a reset time even at low usage; it only means "blocked" near the limit
+                if stats['regain_seconds']:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + stats['regain_seconds'])
+            elif self.usage >= Config.THROTTLE_LOW_WATERMARK:
+                band = 'mid'
+                if self.band != 'mid':
+                    # Step to half concurrency once when entering the band, not on every response
+                    self.limit = max(1, self.max_concurrency // 2)
+                span = Config.THROTTLE_HIGH_WATERMARK - Config.THROTTLE_LOW_WATERMARK
+                ratio = (self.usage - Config.THROTTLE_LOW_WATERMARK) / span
+                self.min_interval = Config.THROTTLE_MAX_INTERVAL * ratio * ratio
+            else:
+                band = 'low'
+                self.limit = min(self.max_concurrency, self.limit + 1)
+                self.min_interval = 0.0
+            self.band = band
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, error: FacebookRequestError) -> float:
+        """Block all callers for a jittered exponential delay after a throttle error"""
+        delay = min(Config.THROTTLE_BACKOFF_MAX, Config.THROTTLE_BACKOFF_BASE * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        regain = parse_usage_headers(error.http_headers())['regain_seconds']
+        delay = max(delay, min(regain, Config.THROTTLE_BACKOFF_MAX))
+        with self._cond:
+            self.limit = 1
+            self.band = 'high'
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        logger.warning(
+            f"Graph API throttled (code {error.api_error_code()}), "
+            f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+        )
+        return delay
+
+
+_throttler = None
+_throttler_lock = threading.Lock()
+
+
+def get_throttler() -> GraphThrottler:
+    """Process-wide throttler: all accounts share the same app/business quota"""
+    global _throttler
+    with _throttler_lock:
+        if _throttler is None:
+            _throttler = GraphThrottler()
+        return _throttler
+
+
+class ThrottledFacebookAdsApi(FacebookAdsApi):
+    """FacebookAdsApi whose every HTTP call goes through the shared GraphThrottler"""
+
+    @classmethod
+    def set_default_api(cls, api_instance):
+        # Register on the base class: ad objects look up FacebookAdsApi.get_default_api()
+        FacebookAdsApi.set_default_api(api_instance)
+
+    def call(self, *args, **kwargs):
+        throttler = get_throttler()
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            waited = time.perf_counter()
+            throttler.acquire()
+            started = time.perf_counter()
+            metrics.observe_throttle_wait(started - waited, 'pacing')
+            try:
+                response = super().call(*args, **kwargs)
+            except FacebookRequestError as e:
+                throttled = is_throttle_error(e)
+                metrics.observe_api_call(time.perf_counter() - started, 'throttled' if throttled else 'error')
+                throttler.observe(e.http_headers())
+                if not throttled or attempt >= throttler.max_retries:
+                    raise
+                metrics.observe_throttle_wait(throttler.backoff(attempt, e), 'backoff')
+                attempt += 1
+                continue
+            except Exception:
+                metrics.observe_api_call(time.perf_counter() - started, 'error')
+                raise
+            finally:
+                throttler.release()
+            metrics.observe_api_call(time.perf_counter() - started, 'ok')
+            throttler.observe(response.headers())
+            return response
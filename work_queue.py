@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Work Queue - account and date-window jobs in a Postgres table, shared by any number of workers
+
+    python main.py --enqueue                          # one sync job per account
+    python main.py --enqueue --since 2025-01-01       # backfill windows + one finalize job per account
+    python main.py --worker [--workers 4] [--drain]   # on every host / container
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, hold them under a
+lease that a heartbeat keeps extending, and retry failures with backoff. A
+job whose worker died is picked up again once its lease expires. The
+per-account advisory lock of the scheduler is taken around every job, so
+workers, schedulers and each other never sync the same table at once.
+
+Backfill window jobs only load their window. Rollups and exports run once
+per account in its finalize job, which is not claimed while any window job
+of the account is still queued or running.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, Text, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import Config
+from backfill import CheckpointStore, days_in_window, finish_account, plan_windows
+from metrics import get_metrics
+from resources import get_engine, session_scope
+from scheduler import account_lock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+jobs_table = Table(
+    'pipeline_jobs', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('account_id', String(50), nullable=False),
+    # sync: incremental sync of the account (NULL window), window: load one backfill window,
+    # finalize: rollups and exports once the account's windows are loaded
+    Column('kind', String(20), nullable=False, server_default='sync'),
+    Column('window_start', Date),
+    Column('window_end', Date),
+    Column('status', String(20), nullable=False, default='queued', index=True),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('max_attempts', Integer, nullable=False),
+    Column('run_after', DateTime, nullable=False, server_default=func.now()),
+    Column('worker_id', String(200)),
+    Column('lease_expires_at', DateTime),
+    Column('heartbeat_at', DateTime),
+    Column('rows', Integer),
+    Column('error', Text),
+    Column('created_at', DateTime, nullable=False, server_default=func.now()),
+    Column('finished_at', DateTime),
+)
+
+# One queued or running job per account, kind and window; finished jobs stay as history
+ACTIVE_JOB_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_pipeline_jobs_active_kind ON pipeline_jobs "
+    "(account_id, kind, COALESCE(window_start, '1970-01-01'), COALESCE(window_end, '1970-01-01')) "
+    "WHERE status IN ('queued', 'running')"
+)
+
+# Tables created before job kinds existed
+UPGRADE_SQL = (
+    "ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'sync'",
+    "UPDATE pipeline_jobs SET kind = 'window' WHERE kind = 'sync' AND window_start IS NOT NULL",
+    "DROP INDEX IF EXISTS uq_pipeline_jobs_active",
+)
+
+CLAIM_SQL = text("""
+    UPDATE pipeline_jobs
+    SET status = 'running', worker_id = :worker_id, attempts = attempts + 1,
+        lease_expires_at = now() + make_interval(secs => :lease), heartbeat_at = now()
+    WHERE id = (
+        SELECT id FROM pipeline_jobs
+        WHERE ((status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND lease_expires_at < now() AND attempts < max_attempts))
+          AND NOT (kind = 'finalize' AND EXISTS (
+              SELECT 1 FROM pipeline_jobs w
+              WHERE w.account_id = pipeline_jobs.account_id AND w.kind = 'window'
+                AND w.status IN ('queued', 'running')
+          ))
+        ORDER BY run_after, id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, account_id, kind, window_start, window_end, attempts, max_attempts
+""")
+
+# Jobs whose worker died on their last attempt
+EXPIRE_SQL = text("""
+    UPDATE pipeline_jobs
+    SET status = 'failed', finished_at = now(), error = 'lease expired on last attempt'
+    WHERE status = 'running' AND lease_expires_at < now() AND attempts >= max_attempts
+""")
+
+
+def default_worker_id() -> str:
+    return Config.WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Enqueue, claim, heartbeat and finish jobs in pipeline_jobs"""
+
+    def __init__(self, worker_id: str = None):
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = Config.QUEUE_LEASE_SECONDS
+
+    def create_table(self):
+        engine = get_engine()
+        jobs_table.create(engine, checkfirst=True)
+        with engine.begin() as connection:
+            for statement in UPGRADE_SQL:
+                connection.execute(text(statement))
+            connection.execute(text(ACTIVE_JOB_INDEX))
+
+    def _execute(self, statement, params: Dict[str, Any] = None):
+        with session_scope() as session:
+            result = session.execute(statement, params or {})
+            rows = result.mappings().all() if result.returns_rows else result.rowcount
+            session.commit()
+        return rows
+
+    def enqueue(self, account_id: str, window_start: date = None, window_end: date = None,
+                kind: str = None) -> bool:
+        """Add a job unless the same account/kind/window is already queued or running"""
+        kind = kind or ('window' if window_start else 'sync')
+        statement = pg_insert(jobs_table).values(
+            account_id=account_id, kind=kind, window_start=window_start, window_end=window_end,
+            status='queued', attempts=0, max_attempts=Config.QUEUE_MAX_ATTEMPTS
+        ).on_conflict_do_nothing()
+        return bool(self._execute(statement))
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        if self._execute(EXPIRE_SQL):
+            logger.warning("Marked jobs with expired leases on their last attempt as failed")
+        rows = self._execute(CLAIM_SQL, {'worker_id': self.worker_id, 'lease': self.lease_seconds})
+        return dict(rows[0]) if rows else None
+
+    def heartbeat(self, job_id: int) -> bool:
+        """Extend the lease; False when the job was taken over by another worker"""
+        return bool(self._execute(text(
+            "UPDATE pipeline_jobs SET heartbeat_at = now(), "
+            "lease_expires_at = now() + make_interval(secs => :lease) "
+            "WHERE id = :id AND worker_id = :worker_id AND status = 'running'"
+        ), {'id': job_id, 'worker_id': self.worker_id, 'lease': self.lease_seconds}))
+
+    def complete(self, job_id: int, rows: int = 0):
+        self._execute(text(
+            "UPDATE pipeline_jobs SET status = 'done', rows = :rows, error = NULL, finished_at = now() "
+            "WHERE id = :id AND worker_id = :worker_id"
+        ), {'id': job_id, 'rows': rows, 'worker_id': self.worker_id})
+
+    def fail(self, job: Dict[str, Any], error: str, permanent: bool = False):
+        """Requeue with exponential backoff, or mark failed after max_attempts"""
+        if permanent or job['attempts'] >= job['max_attempts']:
+            self._execute(text(
+                "UPDATE pipeline_jobs SET status = 'failed', error = :error, finished_at = now() "
+                "WHERE id = :id AND worker_id = :worker_id"
+            ), {'id': job['id'], 'error': error, 'worker_id': self.worker_id})
+            logger.error(f"Job {job['id']} failed permanently after {job['attempts']} attempts: {error}")
+            return
+        delay = Config.QUEUE_RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1)
+        self.release(job['id'], delay, error)
+        logger.warning(f"Job {job['id']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {error}")
+
+    def release(self, job_id: int, delay: float, error: str = None, refund_attempt: bool = False):
+        """Put a claimed job back in the queue after `delay` seconds"""
+        self._execute(text(
+            "UPDATE pipeline_jobs SET status = 'queued', worker_id = NULL, lease_expires_at = NULL, "
+            "error = :error, run_after = now() + make_interval(secs => :delay), "
+            "attempts = attempts - :refund WHERE id = :id AND worker_id = :worker_id"
+        ), {'id': job_id, 'delay': delay, 'error': error, 'refund': int(refund_attempt),
+            'worker_id': self.worker_id})
+
+    def counts(self) -> Dict[str, int]:
+        with session_scope() as session:
+            rows = session.execute(text("SELECT status, count(*) FROM pipeline_jobs GROUP BY status")).all()
+        return {status: count for status, count in rows}
+
+
+def enqueue_accounts(accounts: List[dict] = None, since: date = None, until: date = None,
+                     window_days: int = None) -> int:
+    """One sync job per account, or (with since) one job per backfill window not yet checkpointed
+    followed by one finalize job per account that got windows"""
+    accounts = accounts if accounts is not None else Config.AD_ACCOUNTS
+    queue = WorkQueue()
+    queue.create_table()
+    checkpoints = CheckpointStore()
+    if since:
+        checkpoints.create_table()
+    until = until or datetime.now().date()
+    added = 0
+    for account in accounts:
+        if not since:
+            added += queue.enqueue(account['id'])
+            continue
+        done = checkpoints.done_days(account['id'])
+        windows = 0
+        for window in plan_windows(since, until, window_days or Config.BACKFILL_WINDOW_DAYS):
+            if not days_in_window(window) <= done:
+                windows += queue.enqueue(account['id'], *window)
+        if windows:
+            # Queued after the windows, and only claimed once none of them is pending
+            windows += queue.enqueue(account['id'], since, until, kind='finalize')
+        added += windows
+    logger.info(f"Enqueued {added} jobs for {len(accounts)} accounts")
+    return added
+
+
+class QueueWorker:
+    """Claims and runs jobs on `concurrency` threads until stopped (or the queue is empty with drain)"""
+
+    def __init__(self, run_account: Callable[[dict, Optional[date], Optional[date], bool], Dict[str, Any]],
+                 concurrency: int = None, drain: bool = False, worker_id: str = None):
+        self.run_account = run_account
+        self.concurrency = max(1, concurrency or Config.WORKER_CONCURRENCY)
+        self.drain = drain
+        self.queue = WorkQueue(worker_id)
+        self.accounts = {account['id']: account for account in Config.AD_ACCOUNTS}
+        self.checkpoints = CheckpointStore()
+        self._stop = threading.Event()
+
+    def run(self):
+        logger.info(f"Worker {self.queue.worker_id} started with {self.concurrency} threads. Press Ctrl+C to stop.")
+        self.queue.create_table()
+        self.checkpoints.create_table()
+        threads = [threading.Thread(target=self._loop, name=f"worker-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            logger.info("Stopping, waiting for running jobs to finish...")
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        # Jobs of all threads record into the same registry, so it is written once, on shutdown
+        metrics = get_metrics()
+        metrics.finish()
+        metrics.write_outputs()
+        logger.info(f"Worker {self.queue.worker_id} stopped, queue: {self.queue.counts()}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                if self.drain:
+                    return
+                self._stop.wait(Config.QUEUE_POLL_SECONDS)
+                continue
+            try:
+                self._process(job)
+            except Exception as e:
+                logger.error(f"Job {job['id']} crashed: {e}")
+                try:
+                    self.queue.fail(job, str(e))
+                except Exception as fail_error:
+                    logger.error(f"Could not requeue job {job['id']}, its lease will expire: {fail_error}")
+
+    def _process(self, job: Dict[str, Any]):
+        account = self.accounts.get(job['account_id'])
+        if account is None:
+            self.queue.fail(job, f"Account {job['account_id']} is not configured on worker {self.queue.worker_id}",
+                            permanent=True)
+            return
+
+        with account_lock(account['id']) as acquired:
+            if not acquired:
+                # Someone else is syncing this table; not the job's fault, so the attempt is refunded
+                logger.info(f"Job {job['id']}: {account['name']} is locked by another process, requeued")
+                self.queue.release(job['id'], Config.QUEUE_POLL_SECONDS, refund_attempt=True)
+                return
+
+            window = f"{job['window_start']} -> {job['window_end']}" if job['window_start'] else 'incremental'
+            logger.info(f"Job {job['id']}: {account['name']} {job['kind']} {window} (attempt {job['attempts']})")
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], stop_heartbeat),
+                                         name=f"heartbeat-{job['id']}", daemon=True)
+            heartbeat.start()
+            try:
+                if job['kind'] == 'finalize':
+                    summary = self._finalize(account, job)
+                else:
+                    # Window jobs only load; the tail runs once in the finalize job
+                    summary = self.run_account(account, job['window_start'], job['window_end'],
+                                               job['kind'] == 'sync')
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+        try:
+            if summary['status'] == 'ok':
+                self.queue.complete(job['id'], summary.get('inserted', 0))
+                if job['kind'] == 'window':
+                    # Keeps --backfill and the queue agreeing on what is already loaded
+                    self.checkpoints.record(account['id'], (job['window_start'], job['window_end']),
+                                            'done', rows=summary.get('inserted', 0))
+            else:
+                self.queue.fail(job, summary.get('error', 'unknown error'))
+        except Exception as e:
+            logger.error(f"Could not record the outcome of job {job['id']}: {e}")
+
+    def _finalize(self, account: dict, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Rollups and exports for the checkpointed days of the finalize job's range"""
+        days = sorted(self.checkpoints.done_days(account['id'])
+                      & days_in_window((job['window_start'], job['window_end'])))
+        if not days:
+            logger.info(f"Job {job['id']}: no loaded days for {account['name']}, nothing to finalize")
+            return {'status': 'ok'}
+        try:
+            with get_metrics().stage(account['name'], 'finalize'):
+                finish_account(account, days)
+        except Exception as e:
+            logger.error(f"Job {job['id']}: finalizing {account['name']} failed: {e}")
+            return {'status': 'failed', 'error': str(e)}
+        return {'status': 'ok'}
+
+    def _heartbeat(self, job_id: int, stop: threading.Event):
+        while not stop.wait(Config.QUEUE_HEARTBEAT_SECONDS):
+            try:
+                if not self.queue.heartbeat(job_id):
+                    logger.warning(f"Job {job_id}: lease lost, another worker may run it again")
+                    return
+            except Exception as e:
+                logger.warning(f"Job {job_id}: heartbeat failed: {e}")